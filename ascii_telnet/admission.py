@@ -0,0 +1,202 @@
+# coding=utf-8
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from threading import Condition, Lock
+from typing import Awaitable, Callable, Optional
+
+SERVER_FULL_MESSAGE = b"The theater is full right now. Please come back a little later!\r\n"
+
+
+class WaitingRoom(object):
+    def __init__(self, capacity: Optional[int]):
+        """
+        Lets up to capacity visitors in at a time. The others wait in line, first come first served, and are told
+        their place in line whenever it changes.
+
+        Args:
+            capacity (int): How many visitors may be in at a time, None for no limit
+        """
+        self.capacity = capacity
+        self.in_use = 0
+        self._line = deque()
+        self._condition = Condition()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._line)
+
+    def enter(self, place_changed: Callable[[int], None] = None):
+        """
+        Blocks until the visitor is let in.
+
+        Args:
+            place_changed (callable): Called with the visitor's place in line (starting at 1) whenever it changes.
+                It is called without holding the room's lock, so it may block on the visitor's connection.
+        """
+        ticket = object()
+        with self._condition:
+            if self._has_room():
+                self.in_use += 1
+                return
+            self._line.append(ticket)
+        try:
+            reported_place = None
+            while True:
+                with self._condition:
+                    place = self._line.index(ticket) + 1
+                    if place == 1 and self._has_room(waiting=True):
+                        self._line.popleft()
+                        self.in_use += 1
+                        self._condition.notify_all()
+                        return
+                    if place == reported_place:
+                        self._condition.wait()
+                        continue
+                reported_place = place
+                if place_changed:
+                    place_changed(place)
+        except BaseException:
+            with self._condition:
+                if ticket in self._line:
+                    self._line.remove(ticket)
+                    self._condition.notify_all()
+            raise
+
+    def leave(self):
+        with self._condition:
+            self.in_use -= 1
+            self._condition.notify_all()
+
+    @contextmanager
+    def admitted(self, place_changed: Callable[[int], None] = None):
+        self.enter(place_changed)
+        try:
+            yield
+        finally:
+            self.leave()
+
+    def _has_room(self, waiting=False) -> bool:
+        """
+        Args:
+            waiting (bool): Whether it's the visitor at the front of the line asking, rather than a new one
+        """
+        if not waiting and self._line:
+            return False  # No cutting in line
+        return self.capacity is None or self.in_use < self.capacity
+
+
+class AsyncWaitingRoom(WaitingRoom):
+    """
+    WaitingRoom for visitors that are coroutines on one event loop.
+    """
+
+    def __init__(self, capacity: Optional[int]):
+        super().__init__(capacity)
+        self._condition = None  # Created on the event loop that uses it
+
+    async def enter(self, place_changed: Callable[[int], Awaitable[None]] = None):
+        """
+        Waits until the visitor is let in.
+
+        Args:
+            place_changed (callable): Awaited with the visitor's place in line (starting at 1) whenever it changes
+        """
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        if self._has_room():
+            self.in_use += 1
+            return
+        ticket = object()
+        self._line.append(ticket)
+        try:
+            reported_place = None
+            while True:
+                place = self._line.index(ticket) + 1
+                if place == 1 and self._has_room(waiting=True):
+                    self._line.popleft()
+                    self.in_use += 1
+                    await self._notify_all()
+                    return
+                if place != reported_place:
+                    reported_place = place
+                    if place_changed:
+                        await place_changed(place)
+                    continue
+                async with self._condition:
+                    await self._condition.wait()
+        except BaseException:
+            if ticket in self._line:
+                self._line.remove(ticket)
+                await asyncio.shield(self._notify_all())
+            raise
+
+    async def leave(self):
+        self.in_use -= 1
+        await self._notify_all()
+
+    @asynccontextmanager
+    async def admitted(self, place_changed: Callable[[int], Awaitable[None]] = None):
+        await self.enter(place_changed)
+        try:
+            yield
+        finally:
+            await self.leave()
+
+    async def _notify_all(self):
+        if self._condition is not None:
+            async with self._condition:
+                self._condition.notify_all()
+
+
+class AdmissionControl(object):
+    waiting_room_class = WaitingRoom
+
+    def __init__(
+        self,
+        max_connections: Optional[int] = None,
+        max_sessions: Optional[int] = None,
+        max_playbacks: Optional[int] = None
+    ):
+        """
+        Keeps a burst of visitors from overloading the server. None means no limit for each of the limits.
+
+        Args:
+            max_connections (int): Hard limit of connected visitors, waiting ones included. Visitors beyond it are
+                turned away right after connecting, before they cost a thread or any memory.
+            max_sessions (int): How many visitors may be going through the prompts before the movie at a time
+            max_playbacks (int): How many visitors may be watching the movie at a time
+        """
+        self.max_connections = max_connections
+        self.connections = 0
+        self._connections_lock = Lock()
+        self.sessions = self.waiting_room_class(max_sessions)
+        self.playbacks = self.waiting_room_class(max_playbacks)
+
+    def connect(self) -> bool:
+        """
+        Returns:
+            bool: Whether the new connection is let in. If it is, disconnect must be called when it closes.
+        """
+        with self._connections_lock:
+            if self.max_connections is not None and self.connections >= self.max_connections:
+                return False
+            self.connections += 1
+            return True
+
+    def disconnect(self):
+        with self._connections_lock:
+            self.connections -= 1
+
+
+class AsyncAdmissionControl(AdmissionControl):
+    """
+    AdmissionControl for the asyncio server.
+    """
+    waiting_room_class = AsyncWaitingRoom
+
+
+def waiting_message(place: int) -> str:
+    if place == 1:
+        return "All seats are taken. You're next in line, the movie will start as soon as a seat frees up."
+    return f"All seats are taken. You're number {place} in line, please hold on."
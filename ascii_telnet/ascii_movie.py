@@ -27,10 +27,21 @@
 
 from __future__ import division, print_function
 
+import hashlib
+import itertools
+import mmap
 import pickle
 import re
+import shutil
+import struct
+import tempfile
+import zlib
+from array import array
+from collections import OrderedDict
+from collections.abc import Sequence
 from copy import deepcopy
-from typing import Iterator, List, Tuple
+from threading import Lock
+from typing import Callable, Hashable, Iterable, Iterator, List, Tuple
 
 import colorama
 import yaml
@@ -38,9 +49,22 @@ import textwrap
 
 ansi_escape = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
 
+MOVIE_FILE_EXTENSION = '.atm'
+MOVIE_FILE_MAGIC = b'ATMV'
+MOVIE_FILE_VERSION = 1
+# magic, version, screen width, screen height, frame width, frame height, left margin, top margin, number of frames
+MOVIE_FILE_HEADER = struct.Struct('<4sHHHHHHHI')
+MOVIE_FILE_OFFSET = struct.Struct('<QI')  # payload offset, payload length
+MOVIE_FILE_DISPLAY_TIME = struct.Struct('<I')
+
+FRAME_BLOCK_SIZE = 16  # Distinct frames compressed together in a CompressedMovie, which share most of their styling
+FRAME_COMPRESSION_LEVEL = 6
+FRAME_CACHE_BLOCKS = 64  # Decompressed blocks kept by the cache shared by every CompressedMovie
+
 
 class Frame(object):
     DISPLAY_PER_SECONDS = 15
+    frame_id = None
 
     def __init__(self, display_time=1):
         """
@@ -54,6 +78,8 @@ class Frame(object):
         """
         self.display_time = display_time
         self.data = []  # frame lines
+        # Equal for frames with equal lines. Set by interning, and cleared when the lines change.
+        self.frame_id = None
 
     @property
     def dimensions(self):
@@ -89,6 +115,7 @@ class Frame(object):
         padding_content = [' ' * current_width] * padding
         margin_content = [' ' * current_width] * margin
         self.data = padding_content + margin_content + self.data + margin_content
+        self.frame_id = None
 
     def _increase_width(self, width: int):
         current_width, current_height = self.dimensions
@@ -102,18 +129,21 @@ class Frame(object):
             for row in self.data
         ]
         self.data = lines
+        self.frame_id = None
 
     def set_background_on_frame(self, background_code):
         self.data = [
             background_code + line + colorama.Style.RESET_ALL
             for line in self.data
         ]
+        self.frame_id = None
 
     def remove_styling(self):
         self.data = [
             self._remove_ansi_sequences_from_line(line)
             for line in self.data
         ]
+        self.frame_id = None
 
     @property
     def frame_seconds(self) -> float:
@@ -127,16 +157,30 @@ class Frame(object):
     def clone(self) -> 'Frame':
         frame = self.__class__(self.display_time)
         frame.data = deepcopy(self.data)
+        frame.frame_id = self.frame_id
         return frame
 
 
 class TimeBar(object):
     height = 1
 
-    def __init__(self, duration, length, left_decorator=u"<", spacer=u" ", right_decorator=u">", marker=u"o"):
+    def __init__(
+        self,
+        duration,
+        length,
+        left_decorator=u"<",
+        spacer=u" ",
+        right_decorator=u">",
+        marker=u"o",
+        row=None,
+        column=1
+    ):
         """
         TimeBar that appears at the bottom of the screen.
 
+        The marker can only be at internal_length places, so every possible bar is rendered once up front and looked
+        up by frame number afterwards.
+
         Args:
             duration (int): Frame count that this bar will be tracking
             length (int): Length in characters that the TimeBar will be on the screen
@@ -144,6 +188,9 @@ class TimeBar(object):
             spacer (str): Spacer in between left and right decorators
             right_decorator (str): Decorator on the right side
             marker (str): Marker for position in Ascii Movie
+            row (int): Screen row (starting at 1) the bar is drawn on. When given, the encoded bars start with the VT100
+                code to move there.
+            column (int): Screen column (starting at 1) the bar starts at, when a row is given
         """
         self.length = length
 
@@ -161,6 +208,10 @@ class TimeBar(object):
                                                                                                self.marker,
                                                                                                self.right_decorator))
 
+        self._bars = tuple(self._render_timebar(marker_pos) for marker_pos in range(self.internal_length))
+        move_to_row = u"\x1b[{0};{1}H".format(row, column) if row is not None else u""
+        self._encoded_bars = tuple((move_to_row + bar).encode() for bar in self._bars)
+
     @property
     def _empty_timebar(self):
         time_bar_internals = u"{0:{spacer}>{length}}".format(u"", spacer=self.spacer, length=self.internal_length)
@@ -189,15 +240,32 @@ class TimeBar(object):
             str: String representation of the TimeBar at the given Frame Number
                 Example:  "<    o               >"
         """
-        marker_pos = self.get_marker_postion(frame_num)
+        return self._bars[self._bar_index(frame_num)]
 
-        if marker_pos >= self.internal_length:
-            # Make sure we never overwrite the end decorator.
-            marker_pos = self.internal_length - 1
+    def get_encoded_timebar(self, frame_num, previous_frame_num=None):
+        """
+        Args:
+            frame_num: The Frame Number that the movie that the TimeBar marker should reflect
+            previous_frame_num: The Frame Number of the bar already on screen, if any
 
-        return self._empty_timebar[:marker_pos + len(self.left_decorator)] + \
+        Returns:
+            bytes: The TimeBar at the given Frame Number as it is sent to the screen, or nothing if it looks the same
+                as the bar already on screen
+        """
+        bar_index = self._bar_index(frame_num)
+        if previous_frame_num is not None and self._bar_index(previous_frame_num) == bar_index:
+            return b""
+        return self._encoded_bars[bar_index]
+
+    def _bar_index(self, frame_num):
+        # Make sure we never overwrite the end decorator.
+        return min(self.get_marker_postion(frame_num), self.internal_length - 1)
+
+    def _render_timebar(self, marker_pos):
+        empty_timebar = self._empty_timebar
+        return empty_timebar[:marker_pos + len(self.left_decorator)] + \
                self.marker + \
-               self._empty_timebar[marker_pos + len(self.right_decorator) + 1:]
+               empty_timebar[marker_pos + len(self.right_decorator) + 1:]
 
 
 class Movie(object):
@@ -258,25 +326,90 @@ class Movie(object):
         Args:
             filepath (str): Path to Ascii Movie Data
         """
+        return self.load_parts([filepath])
+
+    def load_parts(self, filepaths: Iterable[str]) -> bool:
+        """
+        Loads a movie that was cut into several files, such as a video transcoded in segments, one after the other.
+        Equal frames are merged across the cuts too.
+
+        Args:
+            filepaths (iterable): Paths to the parts of the Ascii Movie Data, in order
+        """
+        return self.load_frames(self.stream_parts(filepaths))
+
+    def load_frames(self, frames: Iterable[Frame]) -> bool:
+        """
+        Loads frames that were made some other way, such as by the video_converter, merging consecutive equal frames.
+        The frames should already fit the movie's frame dimensions.
+
+        Args:
+            frames (iterable): The frames of the movie, in order
+        """
         if self._loaded:
             # we don't want to be loaded twice.
             return False
 
+        self.frames = list(merge_equal_frames(frames))
+        self._intern_frames()
+        self._loaded = True
+        return True
+
+    def stream_frames(self, filepath) -> Iterator[Frame]:
+        """
+        Reads the frames of a .txt or .yaml movie file one at a time, merging consecutive equal frames as it goes.
+        Only a couple of frames are held in memory at once, so this can feed frames straight into a MovieFileWriter.
+
+        Args:
+            filepath (str): Path to Ascii Movie Data
+        """
         with open(filepath) as f:
             if filepath.endswith('.txt'):
-                self.frames = self._get_text_frames(f)
+                frames = self._generate_text_frames(f)
             elif filepath.endswith('.yaml'):
-                self.frames = self._get_yaml_frames(f)
+                frames = self.generate_frames(yaml.parse(f))
+            else:
+                frames = iter([])
+            yield from merge_equal_frames(frames)
 
-        self.compress()
-        self._loaded = True
-        return True
+    def stream_parts(self, filepaths: Iterable[str]) -> Iterator[Frame]:
+        """
+        Reads the frames of several .txt or .yaml movie files as one movie, like stream_frames.
+        """
+        parts = (self.stream_frames(filepath) for filepath in filepaths)
+        yield from merge_equal_frames(itertools.chain.from_iterable(parts))
+
+    def stream_to_movie_file(self, filepath, output_path: str) -> str:
+        """
+        Converts a .txt or .yaml movie file to the indexed binary movie format without loading it into memory.
 
-    def _get_text_frames(self, file_handle):
+        Args:
+            filepath (str): Path to Ascii Movie Data
+            output_path (str): Path of the movie file to write
+        """
+        return self.stream_parts_to_movie_file([filepath], output_path)
+
+    def stream_parts_to_movie_file(self, filepaths: Iterable[str], output_path: str) -> str:
+        """
+        Converts a movie that was cut into several .txt or .yaml files to a single movie file, like
+        stream_to_movie_file.
+        """
+        return self.stream_frames_to_movie_file(self.stream_parts(filepaths), output_path)
+
+    def stream_frames_to_movie_file(self, frames: Iterable[Frame], output_path: str) -> str:
+        """
+        Writes frames that were made some other way to a movie file as they come, merging consecutive equal frames,
+        like load_frames does.
+        """
+        with MovieFileWriter(output_path, self) as writer:
+            for frame in merge_equal_frames(frames):
+                writer.write_frame(frame)
+        return writer.output_path
+
+    def _generate_text_frames(self, file_handle) -> Iterator[Frame]:
 
         lines_per_frame = self._frame_height + TimeBar.height  # incl. meta data (time information)
         current_frame = None
-        frames = []
         for line_num, line in enumerate(file_handle):
             time_metadata = None
 
@@ -284,19 +417,17 @@ class Movie(object):
                 time_metadata = int(line.strip())
 
             if time_metadata is not None:
+                if current_frame is not None:
+                    yield current_frame
                 current_frame = Frame(display_time=time_metadata)
-                frames.append(current_frame)
             else:
                 line = self._fix_line(line)
                 current_frame.data.append(line)
 
-        return frames
-
-    def _get_yaml_frames(self, file_handle):
-        yaml_reader = yaml.parse(file_handle)
-        return list(self.generate_frames(yaml_reader))
+        if current_frame is not None:
+            yield current_frame
 
-    def generate_frames(self, yaml_reader):
+    def generate_frames(self, yaml_reader) -> Iterator[Frame]:
         for event in yaml_reader:
             if isinstance(event, yaml.StreamEndEvent):
                 break
@@ -306,7 +437,7 @@ class Movie(object):
                 frame = Frame()
                 frame.data = lines[:-1]
                 frame.set_background_on_frame(colorama.Back.BLACK)
-                self._add_frames([frame])
+                self._fit_frame(frame)
                 yield frame
 
     def _fix_line(self, line):
@@ -325,6 +456,16 @@ class Movie(object):
             pickle.dump(self, f)
         return output_path
 
+    def to_movie_file(self, output_path: str):
+        """
+        Saves the movie in the indexed binary movie format, which MappedMovie can play without loading it into memory.
+        See MovieFileWriter for the layout.
+        """
+        with MovieFileWriter(output_path, self) as writer:
+            for frame in self.frames:
+                writer.write_frame(frame)
+        return writer.output_path
+
     def splice_in_text(self, text_file_path: str, seconds_per_slide: int):
         try:
             frame_iterator = iter(self.frames)
@@ -363,7 +504,9 @@ class Movie(object):
         accumulated_time = 0
         while accumulated_time < seconds_per_slide:
             frame = next(frame_iterator)
-            frame.data.extend(formatted_lines)
+            # A new list, since interned frames share theirs
+            frame.data = frame.data + formatted_lines
+            frame.frame_id = None
             width, height = frame.dimensions
             if height > self._frame_height:
                 self.set_frame_dimensions(width, height)
@@ -372,29 +515,47 @@ class Movie(object):
     def _add_frames(self, frames: List[Frame]):
         for frame in frames:
             self.frames.append(frame)
-            frame.dimensions = self._frame_width, self._frame_height
-            frame.set_background_on_frame(colorama.Back.BLACK)
+            self._fit_frame(frame)
+
+    def _fit_frame(self, frame: Frame):
+        frame.dimensions = self._frame_width, self._frame_height
+        frame.set_background_on_frame(colorama.Back.BLACK)
 
     def compress(self):
-        new_frames = []
-        current_frame = None
-        for index in range(len(self.frames)):
-            this_frame = self.frames[index]
-            if current_frame and this_frame == current_frame:
-                current_frame.display_time += this_frame.display_time
-                continue
+        """
+        Merges runs of equal frames, and interns the frames so that equal ones anywhere in the movie share their lines.
+        """
+        self.frames = list(merge_equal_frames(self.frames))
+        self._intern_frames()
+
+    def _intern_frames(self):
+        interner = FrameInterner()
+        for frame in self.frames:
+            interner.intern(frame)
 
-            current_frame = this_frame
-            new_frames.append(current_frame)
-        compression_percent = (len(self.frames) - len(new_frames)) / len(self.frames)
-        print(f"Compression ratio achieved! {compression_percent}%")
+    @property
+    def display_times(self) -> List[int]:
+        return [frame.display_time for frame in self.frames]
 
-        self.frames = new_frames
+    @property
+    def timeline(self) -> List[Tuple[int, int]]:
+        """
+        The movie as (frame id, display time) for every frame. Frame ids are None for frames that aren't interned.
+        """
+        return [(frame.frame_id, frame.display_time) for frame in self.frames]
+
+    def deduplication_report(self) -> str:
+        """
+        Returns:
+            str: How many of the frames are distinct, once the movie is loaded or compressed
+        """
+        return dedupe_report(len(self.display_times), len({frame_id for frame_id, _ in self.timeline}))
 
     def remove_styling(self):
         """For windows terminal, this will help improve transmission rates significantly."""
         for frame in self.frames:
             frame.remove_styling()
+        self._intern_frames()
 
     def __iadd__(self, other):
         self._add_frames(other.frames)
@@ -433,11 +594,426 @@ class Movie(object):
         return '\n'.join(viewing_box)
 
 
+def merge_equal_frames(frames: Iterable[Frame]) -> Iterator[Frame]:
+    """
+    Merges runs of equal consecutive frames into one frame displayed for their combined time. Only the frame being
+    merged into is held, so this works on a stream of frames.
+    """
+    current_frame = None
+    for this_frame in frames:
+        if current_frame and this_frame == current_frame:
+            current_frame.display_time += this_frame.display_time
+            continue
+
+        if current_frame is not None:
+            yield current_frame
+        current_frame = this_frame
+
+    if current_frame is not None:
+        yield current_frame
+
+
+class FrameInterner(object):
+    def __init__(self):
+        """
+        Keeps one copy of the lines of each distinct frame. Interned frames with equal lines share the same list, and
+        get the same frame id, which is the index of their lines in unique_frames.
+
+        Asciimations repeat the same backgrounds and poses all over, so this saves a lot of memory, and a lot of
+        encoding work for anything that caches by frame id.
+        """
+        self.unique_frames = []  # Lines of every distinct frame, by frame id
+        self.frames_in = 0
+        self._frame_ids = {}  # tuple of lines -> frame id
+
+    def intern(self, frame: Frame) -> int:
+        """
+        Points the frame at the shared copy of its lines.
+
+        Returns:
+            int: The frame id
+        """
+        self.frames_in += 1
+        key = tuple(frame.data)
+        frame_id = self._frame_ids.get(key)
+        if frame_id is None:
+            frame_id = self._frame_ids[key] = len(self.unique_frames)
+            self.unique_frames.append(frame.data)
+        frame.data = self.unique_frames[frame_id]
+        frame.frame_id = frame_id
+        return frame_id
+
+    def report(self) -> str:
+        return dedupe_report(self.frames_in, len(self.unique_frames))
+
+
+def dedupe_report(frame_count: int, unique_frame_count: int) -> str:
+    deduplicated = 1 - unique_frame_count / frame_count if frame_count else 0
+    return f"{frame_count} frames, {unique_frame_count} unique ({deduplicated:.1%} deduplicated)"
+
+
+class MovieFileWriter(object):
+    def __init__(self, output_path: str, movie: Movie):
+        """
+        Writes a movie file in the indexed binary movie format, one frame at a time.
+
+        The file is a header, an index of (offset, length) for every frame payload, a table of the display times and
+        then the frame payloads, which are the UTF-8 encoded frame lines joined by newlines. Since the index comes
+        first, payloads are spooled to a temporary file until the writer is closed. Only the index is kept in memory.
+
+        Each distinct payload is only written once. Frames that repeat one point at the same offset, which readers
+        don't need to know about.
+
+        Args:
+            output_path (str): Path of the movie file to write. .atm is appended if it is missing.
+            movie (Movie): Movie whose screen and frame dimensions go in the header
+        """
+        if not output_path.endswith(MOVIE_FILE_EXTENSION):
+            output_path += MOVIE_FILE_EXTENSION
+        self.output_path = output_path
+        self._movie = movie
+        self._payload_starts = array('Q')  # Offset of every frame's payload in the spooled payloads
+        self._payload_lengths = array('I')
+        self._display_times = array('I')
+        self._payloads = tempfile.TemporaryFile()
+        self._spooled_payloads = {}  # Digest of a payload -> its offset in the spooled payloads
+        self._spooled_length = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._payloads.close()
+
+    def write_frame(self, frame: Frame):
+        payload = '\n'.join(frame.data).encode()
+        digest = hashlib.blake2b(payload, digest_size=16).digest()
+        start = self._spooled_payloads.get(digest)
+        if start is None:
+            start = self._spooled_payloads[digest] = self._spooled_length
+            self._payloads.write(payload)
+            self._spooled_length += len(payload)
+        self._payload_starts.append(start)
+        self._payload_lengths.append(len(payload))
+        self._display_times.append(frame.display_time)
+
+    def close(self):
+        movie = self._movie
+        frame_count = len(self._payload_lengths)
+        payload_offset = (
+            MOVIE_FILE_HEADER.size +
+            frame_count * (MOVIE_FILE_OFFSET.size + MOVIE_FILE_DISPLAY_TIME.size)
+        )
+        with open(self.output_path, mode='wb') as f:
+            f.write(MOVIE_FILE_HEADER.pack(
+                MOVIE_FILE_MAGIC,
+                MOVIE_FILE_VERSION,
+                movie.screen_width,
+                movie.screen_height,
+                movie._frame_width,
+                movie._frame_height,
+                movie.left_margin,
+                movie.top_margin,
+                frame_count
+            ))
+            for payload_start, payload_length in zip(self._payload_starts, self._payload_lengths):
+                f.write(MOVIE_FILE_OFFSET.pack(payload_offset + payload_start, payload_length))
+            for display_time in self._display_times:
+                f.write(MOVIE_FILE_DISPLAY_TIME.pack(display_time))
+            self._payloads.seek(0)
+            shutil.copyfileobj(self._payloads, f)
+        self._payloads.close()
+
+
+class MappedFrames(Sequence):
+    def __init__(self, buffer: mmap.mmap, frame_count: int, display_times: List[int]):
+        """
+        The frames of a movie file, read from the memory mapped file only when they are asked for.
+
+        Args:
+            buffer (mmap.mmap): The memory mapped movie file
+            frame_count (int): Number of frames in the file
+            display_times (list): Display time of every frame
+        """
+        self._buffer = buffer
+        self._frame_count = frame_count
+        self.display_times = display_times
+
+    def __len__(self):
+        return self._frame_count
+
+    def __getitem__(self, index: int) -> Frame:
+        offset, length = self._payload(index)
+        frame = Frame(self.display_times[index])
+        frame.data = self._buffer[offset:offset + length].decode().split('\n')
+        frame.frame_id = (offset, length)
+        return frame
+
+    def frame_id(self, index: int) -> Tuple[int, int]:
+        """
+        The frame id of the frame at index, without reading the frame. Repeated frames share their payload, so where
+        the payload is serves as the id.
+        """
+        return self._payload(index)
+
+    def _payload(self, index: int) -> Tuple[int, int]:
+        if index < 0:
+            index += self._frame_count
+        if not 0 <= index < self._frame_count:
+            raise IndexError("Frame index out of range")
+        return MOVIE_FILE_OFFSET.unpack_from(self._buffer, MOVIE_FILE_HEADER.size + index * MOVIE_FILE_OFFSET.size)
+
+
+class ReadOnlyMovie(Movie):
+    """
+    A Movie whose frames are read from somewhere they can't be changed, one at a time as they are asked for. Every
+    frame read is a new Frame object, so changes to it are not kept.
+
+    The frames also tell the frame id of a frame without reading it, with frames.frame_id(index).
+    """
+    @property
+    def display_times(self) -> List[int]:
+        return self.frames.display_times
+
+    @property
+    def timeline(self) -> List[Tuple[int, int]]:
+        frames = self.frames
+        return [(frames.frame_id(index), display_time) for index, display_time in enumerate(self.display_times)]
+
+    def load(self, filepath):
+        return False
+
+    def compress(self):
+        self._refuse_changes()
+
+    def remove_styling(self):
+        self._refuse_changes()
+
+    def __iadd__(self, other):
+        self._refuse_changes()
+
+    def _refuse_changes(self):
+        raise TypeError(f"A {type(self).__name__} is read-only. Clone it to get a Movie that can be changed.")
+
+    def clone(self) -> Movie:
+        movie = Movie(self.screen_width, self.screen_height)
+        movie.set_frame_dimensions(self._frame_width, self._frame_height)
+        movie.frames = list(self.frames)  # Every frame read is already a new object
+        return movie
+
+
+class MappedMovie(ReadOnlyMovie):
+    def __init__(self, filepath: str):
+        """
+        A Movie played straight from a file in the indexed binary movie format (see Movie.to_movie_file).
+
+        Opening it only reads the header and display times, and a frame is only read from the file when it is asked
+        for. Only the pages of the frames actually being played are kept in memory, and they are shared between
+        processes.
+
+        Args:
+            filepath (str): Path to the movie file
+        """
+        super().__init__()
+        with open(filepath, mode='rb') as f:
+            self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (
+            magic,
+            version,
+            self.screen_width,
+            self.screen_height,
+            self._frame_width,
+            self._frame_height,
+            self.left_margin,
+            self.top_margin,
+            frame_count
+        ) = MOVIE_FILE_HEADER.unpack_from(self._buffer)
+        if magic != MOVIE_FILE_MAGIC or version != MOVIE_FILE_VERSION:
+            raise ValueError(f"{filepath} is not a version {MOVIE_FILE_VERSION} movie file")
+
+        display_times_offset = MOVIE_FILE_HEADER.size + frame_count * MOVIE_FILE_OFFSET.size
+        display_times = [
+            display_time
+            for display_time, in MOVIE_FILE_DISPLAY_TIME.iter_unpack(
+                self._buffer[display_times_offset:display_times_offset + frame_count * MOVIE_FILE_DISPLAY_TIME.size]
+            )
+        ]
+        self.frames = MappedFrames(self._buffer, frame_count, display_times)
+        self._loaded = True
+
+
+class FrameBlockCache(object):
+    def __init__(self, size: int = FRAME_CACHE_BLOCKS):
+        """
+        Keeps the size most recently used decompressed blocks of frames, for all the CompressedMovies that share it,
+        and counts how often a block was found in it. Safe to share between threads.
+        """
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._blocks = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Hashable, decompress: Callable[[], list]) -> list:
+        with self._lock:
+            block = self._blocks.get(key)
+            if block is not None:
+                self.hits += 1
+                self._blocks.move_to_end(key)
+                return block
+            self.misses += 1
+        block = decompress()
+        with self._lock:
+            self._blocks[key] = block
+            while len(self._blocks) > self.size:
+                self._blocks.popitem(last=False)
+        return block
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0
+
+    def report(self) -> str:
+        return f"Frame cache: {self.hit_ratio:.1%} hits over {self.hits + self.misses} lookups"
+
+
+FRAME_BLOCK_CACHE = FrameBlockCache()
+
+
+class CompressedFrames(Sequence):
+    _keys = itertools.count()
+
+    def __init__(
+        self,
+        frames: Iterable[Frame],
+        block_size: int = FRAME_BLOCK_SIZE,
+        cache: FrameBlockCache = FRAME_BLOCK_CACHE,
+        level: int = FRAME_COMPRESSION_LEVEL
+    ):
+        """
+        Frames kept zlib compressed in memory, and decompressed a block at a time when they are asked for.
+
+        Equal frames are only kept once. The distinct frames are compressed in blocks of block_size frames, since
+        frames close together in a movie share most of their lines and styling, and compress much better together.
+
+        Args:
+            frames (iterable): The frames to keep
+            block_size (int): Distinct frames per compressed block
+            cache (FrameBlockCache): Where the decompressed blocks are kept
+            level (int): zlib compression level
+        """
+        self.block_size = block_size
+        self.display_times = []
+        self._key = next(self._keys)  # Of this store's blocks in the cache
+        self.uncompressed_bytes = 0  # Of every frame, as UTF-8, like they would be in a movie file
+        self.compressed_bytes = 0
+        self._cache = cache
+        self._frame_ids = array('I')
+        self._blocks = []  # Compressed payloads of block_size distinct frames
+        self._payload_lengths = array('I')  # Of every distinct frame, to split the blocks
+
+        interner = FrameInterner()
+        for frame in frames:
+            self.uncompressed_bytes += len('\n'.join(frame.data).encode())
+            interned = Frame(frame.display_time)  # Leaves the frames given alone
+            interned.data = frame.data
+            self._frame_ids.append(interner.intern(interned))
+            self.display_times.append(frame.display_time)
+        self.unique_frame_count = len(interner.unique_frames)
+        for start in range(0, self.unique_frame_count, block_size):
+            payloads = ['\n'.join(lines).encode() for lines in interner.unique_frames[start:start + block_size]]
+            self._payload_lengths.extend(len(payload) for payload in payloads)
+            self._blocks.append(zlib.compress(b''.join(payloads), level))
+        self.compressed_bytes = sum(len(block) for block in self._blocks)
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.uncompressed_bytes - self.compressed_bytes
+
+    def report(self) -> str:
+        return (
+            f"{dedupe_report(len(self), self.unique_frame_count)}, "
+            f"{self.uncompressed_bytes / 2 ** 20:.1f}MB compressed to {self.compressed_bytes / 2 ** 20:.1f}MB "
+            f"in {len(self._blocks)} blocks"
+        )
+
+    def __len__(self):
+        return len(self._frame_ids)
+
+    def __getitem__(self, index: int) -> Frame:
+        frame_id = self._frame_ids[index]
+        block_index, position = divmod(frame_id, self.block_size)
+        lines = self._cache.get((self._key, block_index), lambda: self._decompress(block_index))[position]
+        frame = Frame(self.display_times[index])
+        frame.data = list(lines)  # The decompressed lines are shared with every other reader
+        frame.frame_id = frame_id
+        return frame
+
+    def frame_id(self, index: int) -> int:
+        return self._frame_ids[index]
+
+    def _decompress(self, block_index: int) -> List[List[str]]:
+        data = zlib.decompress(self._blocks[block_index])
+        frames = []
+        start = 0
+        first_frame = block_index * self.block_size
+        for payload_length in self._payload_lengths[first_frame:first_frame + self.block_size]:
+            frames.append(data[start:start + payload_length].decode().split('\n'))
+            start += payload_length
+        return frames
+
+
+class CompressedMovie(ReadOnlyMovie):
+    def __init__(
+        self,
+        movie: Movie,
+        block_size: int = FRAME_BLOCK_SIZE,
+        cache: FrameBlockCache = FRAME_BLOCK_CACHE,
+        level: int = FRAME_COMPRESSION_LEVEL
+    ):
+        """
+        A Movie whose frames are kept compressed in memory (see CompressedFrames), for keeping several long, fully
+        colored movies loaded at once. Frames are decompressed as they are played, through a cache that every
+        CompressedMovie shares, so the memory they take is bounded by the size of the cache.
+
+        Args:
+            movie (Movie): The movie to compress. It is left as it is, and can be thrown away afterwards.
+            block_size (int): Distinct frames per compressed block
+            cache (FrameBlockCache): Where the decompressed blocks are kept
+            level (int): zlib compression level
+        """
+        super().__init__()
+        self.screen_width = movie.screen_width
+        self.screen_height = movie.screen_height
+        self._frame_width = movie._frame_width
+        self._frame_height = movie._frame_height
+        self.left_margin = movie.left_margin
+        self.top_margin = movie.top_margin
+        self.frames = CompressedFrames(movie.frames, block_size, cache, level)
+        self._loaded = True
+
+
 def get_loaded_movie(filepath) -> Movie:
     if filepath.endswith('.pkl'):
         with open(filepath, mode='rb') as f:
             return pickle.load(f)
+    if filepath.endswith(MOVIE_FILE_EXTENSION):
+        return MappedMovie(filepath)
 
     movie = Movie()
     movie.load(filepath)
     return movie
+
+
+def save_movie(movie: Movie, output_path: str) -> str:
+    """
+    Saves the movie in the indexed binary movie format if output_path ends with .atm, otherwise as a pickle.
+    """
+    if output_path.endswith(MOVIE_FILE_EXTENSION):
+        return movie.to_movie_file(output_path)
+    return movie.to_pickle(output_path)
@@ -26,15 +26,18 @@
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 from __future__ import division, print_function
 
-import sys
+import asyncio
 import time
-from datetime import datetime
-from io import BytesIO
+from typing import Union
 
-from ascii_telnet.ascii_movie import TimeBar, Movie
+from ascii_telnet.ascii_movie import Frame, Movie
+from ascii_telnet.encoded_movie import EncodedMovie
+from ascii_telnet.metrics import DESTYLINGS, DRIFT_SECONDS, FRAMES_DROPPED
+from ascii_telnet.quality import QualityController, QualityTiers
 
 
 DESTYLING_THRESHOLD_SECONDS = 4
+MAX_BACKLOG_SECONDS = 1  # Frames are skipped while more than this much is still waiting to reach the client
 
 
 class VT100Player(object):
@@ -47,101 +50,176 @@ class VT100Player(object):
     CLEARSCRN = ESC + "[2J"  # Clear entire screen
     CLEARDOWN = ESC + "[J"  # Clear screen from cursor down
 
-    def __init__(self, movie: Movie):
+    def __init__(
+        self,
+        movie: Union[Movie, EncodedMovie],
+        delta: bool = False,
+        quality_tiers: QualityTiers = None,
+        max_backlog_seconds: float = MAX_BACKLOG_SECONDS
+    ):
         """
         Player class plays a movie.
         It also stores the current position.
         It exposes the all frame numbers in real values. Therefore not encoded.
 
         Args:
-            movie (ascii_movie.Movie): Movie Object that the player will play.
+            movie (ascii_movie.Movie | encoded_movie.EncodedMovie): Movie Object that the player will play. Pass an
+                EncodedMovie to share the already encoded frames between players.
+            delta (bool): Only send the characters that changed since the last drawn frame, when possible.
+            quality_tiers (quality.QualityTiers): Tiers to adapt the quality between, depending on how well the client
+                keeps up. The movie should be the first tier. Without them, the movie is only destyled once the
+                client falls too far behind.
+            max_backlog_seconds (float): Skip frames while backlog_seconds reports more than this.
 
         """
+        if isinstance(movie, Movie):
+            movie = EncodedMovie(movie)
         self._movie = movie
         self._cursor = 0  # virtual cursor pointing to the current frame
-        self._frame_count = 0
+        self._seek_position = None  # frame cycle to jump to, set by seek
+        self._frame_count = movie.frame_count
 
         self._stopped = False
+        self._delta = delta
+        self._quality_tiers = quality_tiers
+        self._max_backlog_seconds = max_backlog_seconds
+        self._last_drawn = None  # (EncodedMovie, frame index) of the frame currently on screen
 
         self._clear_screen_setup_done = False
 
-        for f in self._movie.frames:
-            self._frame_count += f.display_time
-
-        self.timebar = TimeBar(self._frame_count, self._movie.screen_width)
+        self.timebar = movie.timebar
 
     def play(self):
         """
         Plays the movie
+
+        Every frame has a deadline on a monotonic clock, computed from when the movie started rather than from how long
+        the previous frames took, so timing errors don't add up. When the player falls behind, it jumps straight to the
+        frame that should be on screen by now.
         """
         self._stopped = False
-        drift = 0
         dropped_frames = 0
         dropped_seconds = 0
         destyling_applied = False
-        movie = self._movie.clone()
-        for frame in movie.frames:
+        movie = self._movie
+        quality = QualityController(self._quality_tiers) if self._quality_tiers else None
+        self._seek_position = self._seek_position or 0
+        while True:
             if self._stopped:
                 return
-            self._cursor += frame.display_time
-            # We'll drop some frames to catch up, if we need to
-            if frame.frame_seconds <= drift:
-                drift -= frame.frame_seconds
+            if self._seek_position is not None:
+                index = movie.index_of(self._seek_position)
+                clock_start = time.perf_counter() - self._seek_position / Frame.DISPLAY_PER_SECONDS
+                self._seek_position = None
+            if quality:
+                movie, index = self._adapt_quality(quality, movie, index)
+            if index >= len(movie):
+                break
+            frame_index = index
+            frame_seconds = movie.frame_seconds(frame_index)
+            frame_deadline = clock_start + movie.frame_end(frame_index) / Frame.DISPLAY_PER_SECONDS
+            right_now = time.perf_counter()
+            if right_now >= frame_deadline:
+                # We're behind, so skip to the frame that should be on screen by now without rendering the others
+                index = movie.index_of((right_now - clock_start) * Frame.DISPLAY_PER_SECONDS)
+                dropped_frames += index - frame_index
+                FRAMES_DROPPED.inc(index - frame_index, reason='late')
+                dropped_cycles = movie.frame_start(index) - movie.frame_start(frame_index)
+                dropped_seconds += dropped_cycles / Frame.DISPLAY_PER_SECONDS
+                if quality:
+                    for dropped_index in range(frame_index, index):
+                        quality.record_dropped_frame(movie.frame_seconds(dropped_index))
+                elif dropped_seconds > DESTYLING_THRESHOLD_SECONDS and not destyling_applied:
+                    movie = movie.destyled
+                    print("Destyling applied to speed transmission")
+                    DESTYLINGS.inc()
+                    destyling_applied = True
+                continue
+            index += 1
+            self._cursor = movie.frame_end(frame_index)
+            if self.backlog_seconds() > self._max_backlog_seconds:
+                # The client hasn't even received the earlier frames yet, so give it this frame's time to catch up.
                 dropped_frames += 1
-                dropped_seconds += frame.frame_seconds
-                continue  # Skip this frame and don't even render it
-
-            right_now = datetime.now()
-            self._load_frame(frame, self._cursor)
-            draw_time = datetime.now() - right_now
-            sleep_time = frame.frame_seconds - draw_time.total_seconds()
-            if sleep_time < 0:
-                # When draw speed exceeds the total frame seconds, we record the drift so we can catch up later
-                drift += abs(sleep_time)
-                sleep_time = 0  # Don't really sleep at all if it's already taking too long
-            elif sleep_time > 0:
-                # When draw speed exceeds total frame seconds, we catch up, if there's catching up to do
-                drift -= min(frame.frame_seconds, drift)
-            if drift == 0:
-                dropped_seconds = 0
-            elif dropped_seconds > DESTYLING_THRESHOLD_SECONDS and not destyling_applied:
-                movie.remove_styling()
-                print("Destyling applied to speed transmission")
-                destyling_applied = True
-
-            time.sleep(sleep_time)
+                FRAMES_DROPPED.inc(reason='backlog')
+                if quality:
+                    quality.record_dropped_frame(frame_seconds)
+                time.sleep(max(0, frame_deadline - time.perf_counter()))
+                continue
+
+            frame_due = clock_start + movie.frame_start(frame_index) / Frame.DISPLAY_PER_SECONDS
+            DRIFT_SECONDS.observe(max(0, right_now - frame_due))
+            self._load_frame(movie, frame_index)
+            draw_done = time.perf_counter()
+            if quality:
+                quality.record_frame(draw_done - right_now, frame_seconds)
+            if draw_done < frame_deadline:
+                dropped_seconds = 0  # We're keeping up again
+            time.sleep(max(0, frame_deadline - draw_done))
         print(f"Dropped {dropped_frames} frames to speed connection")
 
+    def seek(self, seconds: float):
+        """
+        Moves playback to the frame on screen at that many seconds into the movie. While playing, playback jumps there
+        at the next frame; otherwise the next play starts there.
+
+        Args:
+            seconds (float): Position in the movie
+        """
+        self._seek_position = min(max(seconds * Frame.DISPLAY_PER_SECONDS, 0), self._frame_count)
+
     def stop(self):
         """
         Stop the movie
         """
         self._stopped = True
 
-    def _load_frame(self, frame, frame_pos):
+    def backlog_seconds(self) -> float:
+        """
+        Public event method, which can be used to report how many seconds of already drawn frames are still waiting
+        to reach the client. Frames are skipped while it is above the player's max_backlog_seconds.
+        """
+        return 0
+
+    def _adapt_quality(self, quality: QualityController, movie: EncodedMovie, index: int):
         """
-        Buffer the the frame and then call draw_frame to display it
+        At keyframes, moves to the quality tier that the controller wants. The tiers cover the same time, so playback
+        continues from the first frame of the new tier that starts at or after the current point.
+
+        Returns:
+            tuple: The movie and frame index to play next
+        """
+        if not movie.is_keyframe(index):
+            return movie, index
+        level = quality.wanted_level()
+        if level == quality.level:
+            return movie, index
+        quality.switch_to(level)
+        print(f"Switched to {quality.name} quality")
+        return quality.movie, quality.movie.index_at(movie.frame_start(index))
+
+    def _load_frame(self, movie, index):
+        """
+        Hand the already encoded frame to draw_frame, clearing the screen first if this is the first frame.
+
+        In delta mode the delta is sent when the frame right before it is on screen. Otherwise (first frame, dropped
+        frames or a switch to the destyled movie) the full frame is sent.
 
         Args:
-            frame (ascii_movie.Frame): Frame data to display
-            frame_pos (int):  Where the frame falls in the movie
+            movie (encoded_movie.EncodedMovie): The movie the frame belongs to
+            index (int): Index of the frame to display
 
         """
-        screenbuf = BytesIO()
+        if self._delta and self._last_drawn == (movie, index - 1):
+            encoded_frame = movie.deltas[index]
+        else:
+            encoded_frame = movie.frames[index]
+        self._last_drawn = (movie, index)
+
         if not self._clear_screen_setup_done:
-            screenbuf.write(self.CLEARSCRN.encode())
+            encoded_frame = self._movie.clear_screen + encoded_frame
             self._clear_screen_setup_done = True
 
-        # center vertical, with respect to the time bar (like letter boxing)
-        screenbuf.write(self._move_cursor(1, self._movie.top_margin))
-        for line in frame.data:
-            screenbuf.write((line + "\r\n").encode())
-
-        self._update_timebar(screenbuf, frame_pos)
-
-        # now rewind the internal buffer and fire the public event
-        screenbuf.seek(0)
-        self.draw_frame(screenbuf)
+        self.draw_frame(encoded_frame)
 
     def draw_frame(self, screen_buffer):
         """
@@ -149,41 +227,137 @@ class VT100Player(object):
         This must be implemented by the user.
 
         Args:
-            screen_buffer:  its a file like object containing the VT100 screen buffer
+            screen_buffer (bytes): the VT100 screen buffer
 
         """
         raise NotImplementedError("You must specify how to draw the frame.")
 
-    def _update_timebar(self, screen_buffer, frame_pos):
+
+class FrameTickScheduler(object):
+    def __init__(self, ticks_per_second=Frame.DISPLAY_PER_SECONDS):
         """
-        Writes at the bottom of the screen a line like this
-        <.......o.....................>
-        It should visualize a timeline with 'o' is the current position.
+        A single clock for all the AsyncVT100Players on an event loop. Instead of every player sleeping on its own
+        timer, players wait for a tick number and are all woken together when that tick arrives.
 
         Args:
-            screen_buffer: file like object, where the data is written to
-            frame_pos (int): current cursor position on frame
-
+            ticks_per_second (int): Ticks per second, which is the frame cycle rate of the movies.
         """
-        # Move cursor to the bottom of the screen
-        screen_buffer.write(self._move_cursor(1, self._movie.screen_height))
+        self.tick = 0
+        self._interval = 1 / ticks_per_second
+        self._waiters = {}  # tick number -> future resolved on that tick
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
 
-        screen_buffer.write(self.timebar.get_timebar(frame_pos).encode())
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def wait_for_tick(self, tick: int):
+        if tick <= self.tick:
+            return
+        waiter = self._waiters.get(tick)
+        if waiter is None:
+            waiter = self._waiters[tick] = asyncio.get_event_loop().create_future()
+        # Shielded, so a player that is cancelled doesn't cancel the tick for everyone else waiting on it.
+        await asyncio.shield(waiter)
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        start_time = loop.time()
+        while True:
+            # Ticks are computed from the start time so that they don't drift; a late wake up releases every tick
+            # that has passed in the meantime.
+            current_tick = int((loop.time() - start_time) / self._interval)
+            for tick in range(self.tick + 1, current_tick + 1):
+                waiter = self._waiters.pop(tick, None)
+                if waiter is not None:
+                    waiter.set_result(None)
+            self.tick = max(self.tick, current_tick)
+            next_tick_time = start_time + (self.tick + 1) * self._interval
+            await asyncio.sleep(next_tick_time - loop.time())
+
+
+class AsyncVT100Player(VT100Player):
+    """
+    VT100Player for asyncio servers. Frames are timed by a FrameTickScheduler rather than by sleeping a thread.
+    """
 
-    def _move_cursor(self, x, y):
+    async def play(self, scheduler: FrameTickScheduler):
         """
-        Send VT100 commands: go to position X,Y
+        Plays the movie
 
         Args:
-            x (int): x coordinate (starting at 1)
-            y (int): y coordinate (starting at 1)
-
-        Returns:
-            str: the VT100 code as a string
+            scheduler (FrameTickScheduler): The clock shared by the players on this event loop
+        """
+        self._stopped = False
+        dropped_frames = 0
+        dropped_seconds = 0
+        destyling_applied = False
+        movie = self._movie
+        quality = QualityController(self._quality_tiers) if self._quality_tiers else None
+        self._seek_position = self._seek_position or 0
+        while True:
+            if self._stopped:
+                return
+            if self._seek_position is not None:
+                # Ticks are whole frame cycles, so start on the cycle of the frame that is on screen at that position.
+                index = movie.index_of(self._seek_position)
+                start_tick = scheduler.tick - movie.frame_start(index)
+                self._seek_position = None
+            if quality:
+                movie, index = self._adapt_quality(quality, movie, index)
+            if index >= len(movie):
+                break
+            frame_index = index
+            frame_seconds = movie.frame_seconds(frame_index)
+            frame_begin = start_tick + movie.frame_start(frame_index)
+            frame_end = start_tick + movie.frame_end(frame_index)
+            if scheduler.tick >= frame_end:
+                # We're behind, so skip to the frame that should be on screen by now without rendering the others
+                index = movie.index_of(scheduler.tick - start_tick)
+                dropped_frames += index - frame_index
+                FRAMES_DROPPED.inc(index - frame_index, reason='late')
+                dropped_cycles = movie.frame_start(index) - movie.frame_start(frame_index)
+                dropped_seconds += dropped_cycles / Frame.DISPLAY_PER_SECONDS
+                if quality:
+                    for dropped_index in range(frame_index, index):
+                        quality.record_dropped_frame(movie.frame_seconds(dropped_index))
+                elif dropped_seconds > DESTYLING_THRESHOLD_SECONDS and not destyling_applied:
+                    movie = movie.destyled
+                    print("Destyling applied to speed transmission")
+                    DESTYLINGS.inc()
+                    destyling_applied = True
+                continue
+            index += 1
+            self._cursor = movie.frame_end(frame_index)
+
+            await scheduler.wait_for_tick(frame_begin)
+            if self._seek_position is not None:
+                continue
+            if self.backlog_seconds() > self._max_backlog_seconds:
+                # The client hasn't even received the earlier frames yet, so give it this frame's time to catch up.
+                dropped_frames += 1
+                FRAMES_DROPPED.inc(reason='backlog')
+                if quality:
+                    quality.record_dropped_frame(frame_seconds)
+                continue
+            right_now = time.perf_counter()
+            DRIFT_SECONDS.observe((scheduler.tick - frame_begin) / Frame.DISPLAY_PER_SECONDS)
+            self._load_frame(movie, frame_index)
+            await self.drain()
+            if quality:
+                quality.record_frame(time.perf_counter() - right_now, frame_seconds)
+            if scheduler.tick < frame_end:
+                dropped_seconds = 0  # We're keeping up again
+        await scheduler.wait_for_tick(start_tick + self._cursor)  # Let the last frame have its time on screen
+        print(f"Dropped {dropped_frames} frames to speed connection")
 
+    async def drain(self):
         """
-        if 0 >= x > self._movie.screen_width or 0 >= y > self._movie.screen_height:
-            sys.stderr.write("Warning, coordinates out of range. ({0}, {1})\n".format(x, y))
-            return "".encode()
-        else:
-            return (self.ESC + "[{0};{1}H".format(y, x)).encode()
+        Public event method, awaited after every drawn frame so the user can wait for the frame to be sent.
+        """
+        pass
@@ -29,14 +29,55 @@ import json
 import socket
 import textwrap
 import time
+from contextlib import contextmanager
 from itertools import chain
 
 import yaml
 
+from ascii_telnet.admission import SERVER_FULL_MESSAGE, AdmissionControl, waiting_message
 from ascii_telnet.ascii_movie import Movie
-from ascii_telnet.ascii_player import VT100Player
-from ascii_telnet.connection_notifier import send_notification, MisconfiguredNotificationError
+from ascii_telnet.ascii_player import MAX_BACKLOG_SECONDS, VT100Player
+from ascii_telnet.backpressure import SendQueueMonitor
+from ascii_telnet.broadcast import BroadcastChannel, BroadcastViewer
+from ascii_telnet.connection_notifier import NotificationDispatcher
+from ascii_telnet.encoded_movie import NO_STYLING, EncodedMovie
+from ascii_telnet.metrics import (
+    BYTES_WRITTEN,
+    COMPRESSED_SESSIONS,
+    CONNECTIONS_REJECTED,
+    FRAME_WRITE_SECONDS,
+    FRAMES_SENT,
+    SESSIONS,
+    collect_server_state,
+)
+from ascii_telnet.profiling import SessionProfile, SessionProfiler
 from ascii_telnet.prompt_resolver import Dialogue
+from ascii_telnet.quality import QualityTiers
+from ascii_telnet.telnet_protocol import (  # The Telnet command codes used to be defined here, so they're still exported
+    AO,
+    AYT,
+    BRK,
+    COMPRESS2,
+    DEFAULT_COMPRESSION_LEVEL,
+    DM,
+    DO,
+    DONT,
+    EC,
+    EL,
+    GA,
+    IAC,
+    IP,
+    NAWS,
+    NOP,
+    SB,
+    SE,
+    TERMINAL_TYPE,
+    WILL,
+    WONT,
+    CompressibleOutput,
+    TelnetParser,
+    strip_telnet_commands,
+)
 
 try:
     # noinspection PyCompatibility
@@ -48,26 +89,39 @@ except ImportError:  # Py2
 
 class ThreadedTCPServer(ThreadingMixIn, TCPServer):
     daemon_threads = True
+    allow_reuse_address = True  # Connections of a previous run left in TIME_WAIT shouldn't keep the port from binding
+    reuse_port = False  # Lets several worker processes bind the same port, with the kernel balancing between them
 
+    def server_bind(self):
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
 
-# Telnet special command codes
-IAC = 255  # "Interpret As Command"
-DONT = 254
-DO = 253
-WONT = 252
-WILL = 251
-SE = 240  # Subnegotiation End
-NOP = 241  # No Operation
-DM = 242  # Data Mark
-BRK = 243  # Break
-IP = 244  # Interrupt process
-AO = 245  # Abort output
-AYT = 246  # Are You There
-EC = 247  # Erase Character
-EL = 248  # Erase Line
-GA = 249  # Go Ahead
-SB = 250  # Subnegotiation Begin
-NAWS = 31
+    def process_request(self, request, client_address):
+        admission = self.RequestHandlerClass.admission
+        if not admission.connect():
+            # Turned away before a thread is started for it
+            CONNECTIONS_REJECTED.inc()
+            try:
+                request.sendall(SERVER_FULL_MESSAGE)
+            except OSError:
+                pass
+            self.shutdown_request(request)
+            return
+        try:
+            super().process_request(request, client_address)
+        except BaseException:
+            admission.disconnect()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self.RequestHandlerClass.admission.disconnect()
+
+
+NAWS_TIMEOUT_SECONDS = 1  # How long to wait for a client to answer the window size negotiation
 
 ESC = chr(27)
 CLEAR_SCREEN = ESC + '[2J'
@@ -79,6 +133,42 @@ MOVE_TO_TOP_LEFT = ESC + "[1;1H"
 class NotAHumanError(Exception): pass
 
 
+def wrap_output_text(output_text: str, width: int, return_at_end=True) -> str:
+    endswith_space = output_text.endswith(' ')
+    lines = output_text.splitlines()
+    wrapped_lines = chain.from_iterable(
+        textwrap.wrap(line, width, replace_whitespace=False)
+        if line
+        else ['']
+        for line in lines
+    )
+    wrapped = '\r\n'.join(wrapped_lines)
+    if endswith_space:
+        wrapped += ' '
+    if return_at_end and not wrapped.endswith('\r\n'):
+        wrapped += '\r\n'
+    return wrapped
+
+
+@contextmanager
+def session_phase(session_profile: SessionProfile, phase: str):
+    """
+    Counts a session as being in a phase, such as prompting or playing, for the metrics, and profiles the phase if the
+    session is being profiled.
+    """
+    with SESSIONS.track(phase=phase):
+        if session_profile is None:
+            yield
+        else:
+            with session_profile.phase(phase):
+                yield
+
+
+def get_text_from_raw_bytes(bytes_in: bytes) -> str:
+    # Telnet is tricky and there are special command codes that can precede the input
+    return strip_telnet_commands(bytes_in).decode('ISO-8859-1')
+
+
 class TelnetRequestHandler(StreamRequestHandler):
     """
     Request handler used for multi threaded TCP server
@@ -86,39 +176,164 @@ class TelnetRequestHandler(StreamRequestHandler):
     """
 
     movie = None
+    encoded_movie = None
     dialogue_options = None
+    delta_playback = False
+    quality_tiers = None
+    max_backlog_seconds = MAX_BACKLOG_SECONDS
+    broadcast_channel = None
+    admission = AdmissionControl()
+    notifier = None
+    profiler = None
+    compression_level = None  # Offer visitors MCCP2 compression at this zlib level, if set
+
+    def setup(self):
+        super().setup()
+        self.window_size = None
+        self.terminal_type = None
+        self.output_stream = CompressibleOutput(self.wfile.write, self.compression_level or DEFAULT_COMPRESSION_LEVEL)
+        self.telnet = TelnetParser(offered_options=(COMPRESS2,) if self.compression_level else ())
+        self.telnet.send = self.output_stream.write
+        self.telnet.window_size_changed = self.window_size_changed
+        self.telnet.terminal_type_received = self.terminal_type_received
+        self.telnet.local_option_changed = self.local_option_changed
+        self._input = b''  # What the visitor typed that hasn't been read yet
+        self.session_profile = self.profiler.start_session(self.client_address) if self.profiler else None
 
     @classmethod
     def set_up_handler_global_state(
         cls,
         movie: Movie,
         dialogue_options: Dialogue,
+        delta_playback: bool = False,
+        broadcast: bool = False,
+        adaptive_quality: bool = False,
+        max_backlog_seconds: float = MAX_BACKLOG_SECONDS,
+        admission: AdmissionControl = None,
+        notifier: NotificationDispatcher = None,
+        profiler: SessionProfiler = None,
+        compression_level: int = None,
     ):
         cls.movie = movie
+        cls.encoded_movie = EncodedMovie(movie)
+        # Clients that fall behind switch to the destyled movie. Build it now, not while a client is already late.
+        cls.encoded_movie.variant(styling=NO_STYLING)
+        # Visitors with the most common terminal sizes share frames encoded up front, like the movie's own size.
+        cls.encoded_movie.prepare_windows()
         cls.dialogue_options = dialogue_options
+        cls.delta_playback = delta_playback
+        cls.quality_tiers = QualityTiers(cls.encoded_movie) if adaptive_quality else None
+        cls.max_backlog_seconds = max_backlog_seconds
+        cls.admission = admission or AdmissionControl()
+        cls.notifier = notifier or NotificationDispatcher()
+        collect_server_state(cls.admission, cls.notifier)
+        cls.profiler = profiler
+        cls.compression_level = compression_level
+        if broadcast:
+            cls.broadcast_channel = BroadcastChannel(cls.encoded_movie)
+
+    @classmethod
+    def serve(cls, interface: str, port: int, reuse_port: bool = False, listening_socket: socket.socket = None):
+        """
+        Serves visitors forever.
+
+        Args:
+            interface (str):  bind to this interface
+            port (int): bind to this port
+            reuse_port (bool): bind with SO_REUSEPORT, so other processes can serve the same port
+            listening_socket (socket.socket): an already listening socket to serve instead of binding a new one
+        """
+        if cls.broadcast_channel:
+            cls.broadcast_channel.start()
+        if listening_socket:
+            server = ThreadedTCPServer(listening_socket.getsockname(), cls, bind_and_activate=False)
+            server.socket.close()
+            server.socket = listening_socket
+        else:
+            server = ThreadedTCPServer((interface, port), cls, bind_and_activate=False)
+            server.reuse_port = reuse_port
+            try:
+                server.server_bind()
+                server.server_activate()
+            except Exception:
+                server.server_close()
+                raise
+        server.serve_forever()
+
+    def finish(self):
+        try:
+            self.output_stream.stop_compressing()  # So the client knows the compressed stream ended on purpose
+        except OSError:
+            pass
+        super().finish()
 
     def handle(self):
         try:
+            with session_phase(self.session_profile, 'negotiating'):
+                self.negotiate_window_size()
             try:
-                self.verify_is_human()
+                with self.admission.sessions.admitted(self.show_place_in_line):
+                    with session_phase(self.session_profile, 'prompting'):
+                        encoded_movie, visitor = self.prepare_visitor()
             except NotAHumanError:
                 print(f"Nonhuman visited")
                 return
-            self.prepare_for_screen_size()
-            if self.dialogue_options:
-                visitor = self.run_visitor_dialogue()
-                if 'adventurer' in visitor.lower():
-                    visitor = self.run_adventure()
-
-            self.player = VT100Player(self.movie)
-            self.player.draw_frame = self.draw_frame
-            self.player.play()
-            self.wfile.write(b'\r\n')
+            with self.admission.playbacks.admitted(self.show_place_in_line):
+                with session_phase(self.session_profile, 'playing'):
+                    self.play_movie(encoded_movie)
+            self.output_stream.write(b'\r\n')
             if self.dialogue_options:
-                self.prompt_for_parting_message(visitor)
+                with session_phase(self.session_profile, 'parting'):
+                    self.prompt_for_parting_message(visitor)
         except BrokenPipeError:
             pass
 
+    def prepare_visitor(self):
+        """
+        Everything before the movie: making sure the visitor is human, their screen size and the dialogue.
+
+        Returns:
+            tuple: The rendering of the movie to play and the visitor's name, if there was a dialogue
+        """
+        self.verify_is_human()
+        if self.window_size:
+            encoded_movie = self.encoded_movie.for_window(*self.window_size)
+        else:
+            self.prepare_for_screen_size()
+            encoded_movie = self.encoded_movie
+        visitor = None
+        if self.dialogue_options:
+            visitor = self.run_visitor_dialogue()
+            if 'adventurer' in visitor.lower():
+                visitor = self.run_adventure()
+        return encoded_movie, visitor
+
+    def play_movie(self, encoded_movie: EncodedMovie):
+        if self.broadcast_channel:
+            self.player = BroadcastViewer(
+                self.broadcast_channel,
+                self.delta_playback,
+                self.max_backlog_seconds,
+                encoded_movie
+            )
+        else:
+            quality_tiers = self.quality_tiers
+            if quality_tiers and encoded_movie is not self.encoded_movie:
+                quality_tiers = QualityTiers(encoded_movie)
+            self.player = VT100Player(
+                encoded_movie,
+                self.delta_playback,
+                quality_tiers,
+                self.max_backlog_seconds
+            )
+        self.send_queue = SendQueueMonitor(self.request)
+        self.player.draw_frame = self.draw_frame
+        self.player.backlog_seconds = self.send_queue.backlog_seconds
+        self.player.play()
+
+    def show_place_in_line(self, place: int):
+        self.output(waiting_message(place))
+
     def run_visitor_dialogue(self):
         results = self.dialogue_options.run('visitor', self.prompt, self.output)
         visitor = results['input']
@@ -145,6 +360,46 @@ class TelnetRequestHandler(StreamRequestHandler):
                 continue
             return adventurer_name
 
+    def negotiate_window_size(self):
+        """
+        Asks the client for its terminal size (Telnet NAWS), so the movie can be laid out for it instead of asking the
+        visitor to resize their terminal. Clients that don't answer within NAWS_TIMEOUT_SECONDS are assumed not to
+        support it. The terminal type is asked for too, and MCCP2 compression offered if it's on, but neither is
+        waited for.
+        """
+        self.telnet.request_option(NAWS)
+        self.telnet.request_option(TERMINAL_TYPE)
+        if self.compression_level:
+            self.telnet.offer_option(COMPRESS2)
+        deadline = time.monotonic() + NAWS_TIMEOUT_SECONDS
+        try:
+            while not self.window_size and NAWS not in self.telnet.refused_options:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.request.settimeout(remaining)
+                if not self._receive():
+                    break
+        except socket.timeout:
+            pass
+        finally:
+            self.request.settimeout(None)
+
+    def window_size_changed(self, width: int, height: int):
+        self.window_size = (width, height)
+
+    def local_option_changed(self, option: int, enabled: bool):
+        if option != COMPRESS2:
+            return
+        if enabled:
+            self.output_stream.start_compressing()
+            COMPRESSED_SESSIONS.inc()
+        else:
+            self.output_stream.stop_compressing()
+
+    def terminal_type_received(self, terminal_type: str):
+        self.terminal_type = terminal_type
+
     def prepare_for_screen_size(self):
         self.output("A box is about to be shown to help you prepare your terminal window size.")
         time.sleep(5)
@@ -156,63 +411,61 @@ class TelnetRequestHandler(StreamRequestHandler):
             time.sleep(1)
 
     def output(self, output_text, return_at_end=True):
-        endswith_space = output_text.endswith(' ')
-        lines = output_text.splitlines()
-        wrapped_lines = chain.from_iterable(
-            textwrap.wrap(line, self.movie.screen_width, replace_whitespace=False)
-            if line
-            else ['']
-            for line in lines
-        )
-        wrapped = '\r\n'.join(wrapped_lines)
-        if endswith_space:
-            wrapped += ' '
-        if return_at_end and not wrapped.endswith('\r\n'):
-            wrapped += '\r\n'
-
+        wrapped = wrap_output_text(output_text, self.movie.screen_width, return_at_end)
         line_count = wrapped.count('\r\n')
         if line_count > self.movie.screen_height:
             self._output_long_text(wrapped)
         else:
             encoded = wrapped.encode('ISO-8859-1')
-            self.wfile.write(encoded)
+            self.output_stream.write(encoded)
 
     def prompt(self, prompt_text, max_bytes_in=300, pad_with_trailing_space=True) -> str:
         if pad_with_trailing_space:
             prompt_text += ' '
-        self.rfile.flush()
         self.output(prompt_text, False)
-        raw_bytes_in = self.rfile.readline(max_bytes_in)
-        input_string = self.get_text_from_raw_bytes(raw_bytes_in)
+        bytes_in = self._readline(max_bytes_in)
+        input_string = bytes_in.decode('ISO-8859-1')
         return input_string.strip()
 
-    def get_text_from_raw_bytes(self, bytes_in: bytes) -> str:
-        # Telnet is tricky and there are special command codes that can precede the input
-        last_byte = None
-        real_text_bytes = []
-        for byte_integer in bytes_in:
-            if last_byte == SB and byte_integer == SE:
-                pass
-            elif last_byte == SB:
-                continue  # We'll skip everything between SB and SE
-            elif last_byte in (IAC, WILL, WONT, DO, DONT):
-                pass
-            elif 240 <= byte_integer <= 255:
-                pass
-            else:
-                real_text_bytes.append(byte_integer)
-            last_byte = byte_integer
+    def _receive(self) -> bool:
+        """
+        Receives what the client sent next, answering its Telnet commands and keeping what the visitor typed.
+
+        Returns:
+            bool: False once the client has hung up
+        """
+        data = self.request.recv(1024)
+        self._input += self.telnet.feed(data)
+        return bool(data)
 
-        remainder_of_bytes = bytes(real_text_bytes)
-        decoded = remainder_of_bytes.decode('ISO-8859-1')
-        return decoded
+    def _readline(self, max_bytes_in: int) -> bytes:
+        """
+        Reads what the visitor typed up to and including the next new line, but no more than max_bytes_in.
+        """
+        while True:
+            end = self._input.find(b'\n', 0, max_bytes_in) + 1
+            if end:
+                break
+            if len(self._input) >= max_bytes_in or not self._receive():
+                end = max_bytes_in
+                break
+        line, self._input = self._input[:end], self._input[end:]
+        return line
+
+    def get_text_from_raw_bytes(self, bytes_in: bytes) -> str:
+        return get_text_from_raw_bytes(bytes_in)
 
     def draw_frame(self, screen_buffer):
         """
         Gets the current screen buffer and writes it to the socket.
         """
         try:
-            self.wfile.write(screen_buffer.read())
+            write_start = time.perf_counter()
+            bytes_written = self.output_stream.write(screen_buffer)
+            FRAME_WRITE_SECONDS.observe(time.perf_counter() - write_start)
+            FRAMES_SENT.inc()
+            BYTES_WRITTEN.inc(bytes_written)
+            self.send_queue.record_write(bytes_written)
         except socket.error as e:
             if e.errno == errno.EPIPE:
                 print("Client Disconnected.")
@@ -234,11 +487,9 @@ class TelnetRequestHandler(StreamRequestHandler):
         self.notify(notification)
 
     def notify(self, notification_text: str):
-        try:
-            with_tabs_replaced = notification_text.replace('\t', '....')
-            send_notification(with_tabs_replaced)
-        except MisconfiguredNotificationError:
-            print(notification_text)
+        # Only queued here, so the visitor doesn't wait for the mail server.
+        with_tabs_replaced = notification_text.replace('\t', '....')
+        self.notifier.notify(with_tabs_replaced)
 
     def _output_long_text(self, long_text):
         lines = long_text.split('\r\n')
@@ -258,8 +509,8 @@ class TelnetRequestHandler(StreamRequestHandler):
             to_print = '\r\n'.join(window)
             encoded = to_print.encode('ISO-8859-1')
             # Clear the line, return cursor to first column and move up one line
-            self.wfile.write(f'{CLEAR_SCREEN}{LINE_UP}'.encode())
-            self.wfile.write(encoded)
+            self.output_stream.write(f'{CLEAR_SCREEN}{LINE_UP}'.encode())
+            self.output_stream.write(encoded)
             if current_index < end_index:
                 response = self.prompt(
                     f"\n{'-' * self.movie.screen_width}\n\n"
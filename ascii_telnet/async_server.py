@@ -0,0 +1,412 @@
+# coding=utf-8
+import asyncio
+import json
+import socket
+import time
+
+from ascii_telnet.admission import SERVER_FULL_MESSAGE, AsyncAdmissionControl, waiting_message
+from ascii_telnet.ascii_movie import Movie
+from ascii_telnet.ascii_player import MAX_BACKLOG_SECONDS, AsyncVT100Player, FrameTickScheduler
+from ascii_telnet.ascii_server import (
+    CLEAR_SCREEN,
+    LINE_UP,
+    MOVE_TO_TOP_LEFT,
+    NAWS_TIMEOUT_SECONDS,
+    NotAHumanError,
+    session_phase,
+    wrap_output_text,
+)
+from ascii_telnet.backpressure import SendQueueMonitor
+from ascii_telnet.broadcast import AsyncBroadcastChannel, AsyncBroadcastViewer
+from ascii_telnet.connection_notifier import NotificationDispatcher
+from ascii_telnet.encoded_movie import NO_STYLING, EncodedMovie
+from ascii_telnet.metrics import (
+    BYTES_WRITTEN,
+    COMPRESSED_SESSIONS,
+    CONNECTIONS_REJECTED,
+    FRAME_WRITE_SECONDS,
+    FRAMES_SENT,
+    collect_server_state,
+)
+from ascii_telnet.profiling import SessionProfiler
+from ascii_telnet.prompt_resolver import Dialogue
+from ascii_telnet.quality import QualityTiers
+from ascii_telnet.telnet_protocol import (
+    COMPRESS2,
+    DEFAULT_COMPRESSION_LEVEL,
+    NAWS,
+    TERMINAL_TYPE,
+    CompressibleOutput,
+    TelnetParser,
+)
+
+MAX_INPUT_BYTES = 300
+
+
+class AsyncTelnetSession(object):
+    """
+    One visitor of the asyncio server. This does what TelnetRequestHandler does, but as coroutines on an event loop
+    rather than on a thread of its own.
+    """
+
+    movie = None
+    encoded_movie = None
+    dialogue_options = None
+    delta_playback = False
+    quality_tiers = None
+    max_backlog_seconds = MAX_BACKLOG_SECONDS
+    broadcast = False
+    scheduler = None
+    broadcast_channel = None
+    admission = AsyncAdmissionControl()
+    notifier = None
+    profiler = None
+    compression_level = None  # Offer visitors MCCP2 compression at this zlib level, if set
+
+    @classmethod
+    def set_up_handler_global_state(
+        cls,
+        movie: Movie,
+        dialogue_options: Dialogue,
+        delta_playback: bool = False,
+        broadcast: bool = False,
+        adaptive_quality: bool = False,
+        max_backlog_seconds: float = MAX_BACKLOG_SECONDS,
+        admission: AsyncAdmissionControl = None,
+        notifier: NotificationDispatcher = None,
+        profiler: SessionProfiler = None,
+        compression_level: int = None,
+    ):
+        cls.movie = movie
+        cls.encoded_movie = EncodedMovie(movie)
+        # Clients that fall behind switch to the destyled movie. Build it now, not while a client is already late.
+        cls.encoded_movie.variant(styling=NO_STYLING)
+        # Visitors with the most common terminal sizes share frames encoded up front, like the movie's own size.
+        cls.encoded_movie.prepare_windows()
+        cls.dialogue_options = dialogue_options
+        cls.delta_playback = delta_playback
+        cls.quality_tiers = QualityTiers(cls.encoded_movie) if adaptive_quality else None
+        cls.max_backlog_seconds = max_backlog_seconds
+        cls.admission = admission or AsyncAdmissionControl()
+        cls.notifier = notifier or NotificationDispatcher()
+        collect_server_state(cls.admission, cls.notifier)
+        cls.profiler = profiler
+        cls.compression_level = compression_level
+        cls.broadcast = broadcast
+        cls.scheduler = FrameTickScheduler()
+
+    @classmethod
+    async def serve(cls, interface: str, port: int, reuse_port: bool = False, listening_socket: socket.socket = None):
+        """
+        Serves visitors forever.
+
+        Args:
+            interface (str):  bind to this interface
+            port (int): bind to this port
+            reuse_port (bool): bind with SO_REUSEPORT, so other processes can serve the same port
+            listening_socket (socket.socket): an already listening socket to serve instead of binding a new one
+        """
+        cls.scheduler.start()
+        if cls.broadcast:
+            cls.broadcast_channel = AsyncBroadcastChannel(cls.encoded_movie, cls.scheduler)
+            cls.broadcast_channel.start()
+        if listening_socket:
+            server = await asyncio.start_server(cls.handle_connection, sock=listening_socket, limit=MAX_INPUT_BYTES)
+        else:
+            server = await asyncio.start_server(
+                cls.handle_connection,
+                interface,
+                port,
+                reuse_port=reuse_port or None,
+                limit=MAX_INPUT_BYTES
+            )
+        async with server:
+            await server.serve_forever()
+
+    @classmethod
+    async def handle_connection(cls, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        if not cls.admission.connect():
+            CONNECTIONS_REJECTED.inc()
+            writer.write(SERVER_FULL_MESSAGE)
+            writer.close()
+            return
+        session = cls(reader, writer)
+        try:
+            await session.handle()
+        finally:
+            if not writer.is_closing():
+                session.output_stream.stop_compressing()  # So the client knows the compressed stream ended on purpose
+            writer.close()
+            cls.admission.disconnect()
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.client_address = writer.get_extra_info('peername')
+        self.player = None
+        self.send_queue = None
+        self.window_size = None
+        self.terminal_type = None
+        self.output_stream = CompressibleOutput(writer.write, self.compression_level or DEFAULT_COMPRESSION_LEVEL)
+        self.telnet = TelnetParser(offered_options=(COMPRESS2,) if self.compression_level else ())
+        self.telnet.send = self.output_stream.write
+        self.telnet.window_size_changed = self.window_size_changed
+        self.telnet.terminal_type_received = self.terminal_type_received
+        self.telnet.local_option_changed = self.local_option_changed
+        self._input = b''  # What the visitor typed that hasn't been read yet
+        self.session_profile = self.profiler.start_session(self.client_address) if self.profiler else None
+
+    async def handle(self):
+        try:
+            with session_phase(self.session_profile, 'negotiating'):
+                await self.negotiate_window_size()
+            try:
+                async with self.admission.sessions.admitted(self.show_place_in_line):
+                    with session_phase(self.session_profile, 'prompting'):
+                        encoded_movie, visitor = await self.prepare_visitor()
+            except NotAHumanError:
+                print("Nonhuman visited")
+                return
+            async with self.admission.playbacks.admitted(self.show_place_in_line):
+                with session_phase(self.session_profile, 'playing'):
+                    await self.play_movie(encoded_movie)
+            self.output_stream.write(b'\r\n')
+            if self.dialogue_options:
+                with session_phase(self.session_profile, 'parting'):
+                    await self.prompt_for_parting_message(visitor)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    async def prepare_visitor(self):
+        """
+        Everything before the movie. See TelnetRequestHandler.prepare_visitor.
+        """
+        await self.verify_is_human()
+        if self.window_size:
+            encoded_movie = self.encoded_movie.for_window(*self.window_size)
+        else:
+            await self.prepare_for_screen_size()
+            encoded_movie = self.encoded_movie
+        visitor = None
+        if self.dialogue_options:
+            visitor = await self.run_visitor_dialogue()
+            if 'adventurer' in visitor.lower():
+                visitor = await self.run_adventure()
+        return encoded_movie, visitor
+
+    async def play_movie(self, encoded_movie: EncodedMovie):
+        # Data waits in the transport's buffer before it even reaches the socket, so that counts as queued too.
+        self.send_queue = SendQueueMonitor(
+            self.writer.get_extra_info('socket'),
+            self.writer.transport.get_write_buffer_size
+        )
+        if self.broadcast_channel:
+            self.player = AsyncBroadcastViewer(
+                self.broadcast_channel,
+                self.delta_playback,
+                self.max_backlog_seconds,
+                encoded_movie
+            )
+            self.player.draw_frame = self.draw_frame
+            self.player.drain = self.writer.drain
+            self.player.backlog_seconds = self.send_queue.backlog_seconds
+            await self.player.play()
+        else:
+            quality_tiers = self.quality_tiers
+            if quality_tiers and encoded_movie is not self.encoded_movie:
+                quality_tiers = QualityTiers(encoded_movie)
+            self.player = AsyncVT100Player(
+                encoded_movie,
+                self.delta_playback,
+                quality_tiers,
+                self.max_backlog_seconds
+            )
+            self.player.draw_frame = self.draw_frame
+            self.player.drain = self.writer.drain
+            self.player.backlog_seconds = self.send_queue.backlog_seconds
+            await self.player.play(self.scheduler)
+
+    async def show_place_in_line(self, place: int):
+        await self.output(waiting_message(place))
+
+    async def run_visitor_dialogue(self):
+        results = await self.dialogue_options.run_async('visitor', self.prompt, self.output)
+        visitor = results['input']
+        notification = f"Server has been visited by {visitor} at {self.client_address[0]}!"
+        await self.notify(notification)
+        if results['resolved']:
+            await self.prompt('Press enter to continue...')
+        return visitor
+
+    async def run_adventure(self):
+        while True:
+            results = await self.dialogue_options.run_async('adventure', self.prompt, self.output)
+            adventurer_name = results['input']
+            readable_results = Dialogue.make_dialogue_readable(results)
+            result_text = json.dumps(readable_results, indent='\t')
+            notification = f'An adventurer has come! His name is {adventurer_name}.\nHis path: {result_text}'
+            await self.notify(notification)
+            horizontal_bar = '-' * self.movie.screen_width
+            response = await self.prompt(
+                f"\n{horizontal_bar}\nPress enter to continue or enter 'retry' to answer differently. You might find "
+                f"you end up with a VERY different adventure..."
+            )
+            if 'retry' in response:
+                continue
+            return adventurer_name
+
+    async def negotiate_window_size(self):
+        """
+        Asks the client for its terminal size (Telnet NAWS). See TelnetRequestHandler.negotiate_window_size.
+        """
+        self.telnet.request_option(NAWS)
+        self.telnet.request_option(TERMINAL_TYPE)
+        if self.compression_level:
+            self.telnet.offer_option(COMPRESS2)
+        deadline = asyncio.get_event_loop().time() + NAWS_TIMEOUT_SECONDS
+        while not self.window_size and NAWS not in self.telnet.refused_options:
+            remaining = deadline - asyncio.get_event_loop().time()
+            if remaining <= 0:
+                break
+            try:
+                if not await asyncio.wait_for(self._receive(), remaining):
+                    break
+            except asyncio.TimeoutError:
+                break
+
+    def window_size_changed(self, width: int, height: int):
+        self.window_size = (width, height)
+
+    def local_option_changed(self, option: int, enabled: bool):
+        if option != COMPRESS2:
+            return
+        if enabled:
+            self.output_stream.start_compressing()
+            COMPRESSED_SESSIONS.inc()
+        else:
+            self.output_stream.stop_compressing()
+
+    def terminal_type_received(self, terminal_type: str):
+        self.terminal_type = terminal_type
+
+    async def prepare_for_screen_size(self):
+        await self.output("A box is about to be shown to help you prepare your terminal window size.")
+        await asyncio.sleep(5)
+        screen_box = self.movie.create_viewing_area_box()
+        for second in reversed(range(1, 16)):
+            await self.output(f"{CLEAR_SCREEN}{MOVE_TO_TOP_LEFT}\r")
+            await self.output(screen_box)
+            await self.output(f"Continuing in {second} seconds...", False)
+            await asyncio.sleep(1)
+
+    async def output(self, output_text, return_at_end=True):
+        wrapped = wrap_output_text(output_text, self.movie.screen_width, return_at_end)
+        line_count = wrapped.count('\r\n')
+        if line_count > self.movie.screen_height:
+            await self._output_long_text(wrapped)
+        else:
+            encoded = wrapped.encode('ISO-8859-1')
+            self.output_stream.write(encoded)
+            await self.writer.drain()
+
+    async def prompt(self, prompt_text, max_bytes_in=MAX_INPUT_BYTES, pad_with_trailing_space=True) -> str:
+        if pad_with_trailing_space:
+            prompt_text += ' '
+        await self.output(prompt_text, False)
+        bytes_in = await self._readline(max_bytes_in)
+        input_string = bytes_in.decode('ISO-8859-1')
+        return input_string.strip()
+
+    async def _receive(self) -> bool:
+        """
+        Receives what the client sent next, answering its Telnet commands and keeping what the visitor typed.
+
+        Returns:
+            bool: False once the client has hung up
+        """
+        data = await self.reader.read(MAX_INPUT_BYTES)
+        self._input += self.telnet.feed(data)
+        return bool(data)
+
+    async def _readline(self, max_bytes_in: int) -> bytes:
+        """
+        Reads what the visitor typed up to and including the next new line, but no more than max_bytes_in.
+        """
+        while True:
+            end = self._input.find(b'\n', 0, max_bytes_in) + 1
+            if end:
+                break
+            if len(self._input) >= max_bytes_in or not await self._receive():
+                end = max_bytes_in
+                break
+        line, self._input = self._input[:end], self._input[end:]
+        return line
+
+    def draw_frame(self, screen_buffer):
+        """
+        Gets the current screen buffer and writes it to the socket.
+        """
+        if self.writer.is_closing():
+            print("Client Disconnected.")
+            self.player.stop()
+            return
+        write_start = time.perf_counter()
+        bytes_written = self.output_stream.write(screen_buffer)
+        FRAME_WRITE_SECONDS.observe(time.perf_counter() - write_start)
+        FRAMES_SENT.inc()
+        BYTES_WRITTEN.inc(bytes_written)
+        self.send_queue.record_write(bytes_written)
+
+    async def verify_is_human(self):
+        response = await self.prompt("Are you a human?", 20)
+        for answer in ['yes', 'yea', 'si', 'yep']:
+            if answer in response.lower():
+                await self.output("Whew. Ok. I thought you were a robot. Close one!")
+                return
+        await self.output("Robots are not welcome! Get off my lawn!")
+        raise NotAHumanError()
+
+    async def prompt_for_parting_message(self, visitor_name: str):
+        result = await self.dialogue_options.run_async('parting_message', self.prompt, self.output)
+        parting_message = result['input']
+        notification = f"Parting message received from {visitor_name}: {parting_message}"
+        await self.notify(notification)
+
+    async def notify(self, notification_text: str):
+        # Only queued here, the dispatcher's thread sends it off the event loop.
+        with_tabs_replaced = notification_text.replace('\t', '....')
+        self.notifier.notify(with_tabs_replaced)
+
+    async def _output_long_text(self, long_text):
+        lines = long_text.split('\r\n')
+        window_size = self.movie.screen_height - 4
+        window = lines[:window_size]
+        start_index = len(window) - 1
+        end_index = len(lines) - 1
+        current_index = start_index
+
+        def scroll_down():
+            nonlocal current_index
+            window.pop(0)
+            current_index += 1
+            window.append(lines[current_index])
+
+        while True:
+            to_print = '\r\n'.join(window)
+            encoded = to_print.encode('ISO-8859-1')
+            # Clear the line, return cursor to first column and move up one line
+            self.output_stream.write(f'{CLEAR_SCREEN}{LINE_UP}'.encode())
+            self.output_stream.write(encoded)
+            await self.writer.drain()
+            if current_index < end_index:
+                response = await self.prompt(
+                    f"\n{'-' * self.movie.screen_width}\n\n"
+                    f"Press <Enter> to scroll, or enter 'bottom' to scroll to the bottom..."
+                )
+                if 'bottom' in response:
+                    current_index = end_index
+                    window = lines[end_index - window_size:]
+                else:
+                    scroll_down()
+            else:
+                break
@@ -0,0 +1,77 @@
+# coding=utf-8
+import socket
+import struct
+import time
+from typing import Callable, Optional
+
+try:
+    import fcntl
+    import termios
+except ImportError:  # Windows
+    fcntl = termios = None
+
+TIOCOUTQ = getattr(termios, 'TIOCOUTQ', None)  # Linux only: bytes in a socket's send queue not yet acknowledged
+RATE_SMOOTHING = 0.3  # Weight of the newest measurement in the moving average of the drain rate
+
+
+class SendQueueMonitor(object):
+    def __init__(self, sock: socket.socket, buffered_bytes: Callable[[], int] = None):
+        """
+        Estimates how many seconds of data are waiting to reach a client.
+
+        A write returns as soon as the kernel accepts the data, so a slow client can have seconds of frames queued in
+        the socket without the writer noticing. This looks at the kernel send queue instead, measures how fast the
+        client drains it, and divides one by the other.
+
+        Where the send queue can't be read (anything but Linux), the backlog is always reported as 0.
+
+        Args:
+            sock (socket.socket): The client socket
+            buffered_bytes (callable): Returns bytes buffered before they even reach the socket, such as an asyncio
+                transport's write buffer
+        """
+        self._fileno = sock.fileno()
+        self._buffered_bytes = buffered_bytes
+        self._written_since_sample = 0
+        self._last_queued = 0
+        self._last_sample_time = None
+        self.drain_rate = None  # bytes per second
+
+    def record_write(self, byte_count: int):
+        self._written_since_sample += byte_count
+
+    def queued_bytes(self) -> Optional[int]:
+        if TIOCOUTQ is None:
+            return None
+        try:
+            queued, = struct.unpack('i', fcntl.ioctl(self._fileno, TIOCOUTQ, b'\0\0\0\0'))
+        except OSError:
+            return None
+        if self._buffered_bytes:
+            queued += self._buffered_bytes()
+        return queued
+
+    def backlog_seconds(self) -> float:
+        queued = self.queued_bytes()
+        if queued is None:
+            return 0
+        now = time.perf_counter()
+        if self._last_sample_time is not None:
+            elapsed = now - self._last_sample_time
+            drained = self._last_queued + self._written_since_sample - queued
+            if elapsed > 0:
+                rate = max(drained, 0) / elapsed
+                if self.drain_rate is None:
+                    self.drain_rate = rate
+                else:
+                    self.drain_rate += RATE_SMOOTHING * (rate - self.drain_rate)
+        self._last_sample_time = now
+        self._last_queued = queued
+        self._written_since_sample = 0
+
+        if not queued:
+            return 0
+        if not self.drain_rate:
+            # Nothing has drained yet, so there is nothing to go by other than the queue not being empty.
+            return 0 if self.drain_rate is None else float('inf')
+        return queued / self.drain_rate
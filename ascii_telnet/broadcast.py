@@ -0,0 +1,242 @@
+# coding=utf-8
+import asyncio
+import time
+from threading import Event, Lock, Thread
+from typing import Callable, Optional, Tuple
+
+from ascii_telnet.ascii_player import MAX_BACKLOG_SECONDS, FrameTickScheduler
+from ascii_telnet.encoded_movie import EncodedMovie
+from ascii_telnet.metrics import FRAMES_DROPPED
+
+
+class BroadcastChannel(object):
+    def __init__(self, movie: EncodedMovie):
+        """
+        A live channel: one clock plays the movie on a loop and every viewer watches the same frame at the same time.
+        Each frame change is published to the subscribers as (loop number, frame index).
+
+        Args:
+            movie (encoded_movie.EncodedMovie): The movie to broadcast.
+        """
+        self.movie = movie
+        self.position = (0, -1)  # (loop number, frame index) currently on air
+        self._subscribers = set()
+        self._subscribers_lock = Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def subscribe(self, callback: Callable[[Tuple[int, int]], None]):
+        with self._subscribers_lock:
+            self._subscribers.add(callback)
+
+    def unsubscribe(self, callback: Callable[[Tuple[int, int]], None]):
+        with self._subscribers_lock:
+            self._subscribers.discard(callback)
+
+    def _run(self):
+        deadline = time.monotonic()
+        loop_number = 0
+        while True:
+            for index in range(len(self.movie)):
+                self._publish((loop_number, index))
+                deadline += self.movie.frame_seconds(index)
+                time.sleep(max(0, deadline - time.monotonic()))
+            loop_number += 1
+
+    def _publish(self, position: Tuple[int, int]):
+        self.position = position
+        with self._subscribers_lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            callback(position)
+
+
+class AsyncBroadcastChannel(object):
+    def __init__(self, movie: EncodedMovie, scheduler: FrameTickScheduler):
+        """
+        BroadcastChannel for asyncio servers, clocked by the server's FrameTickScheduler instead of a thread.
+
+        Args:
+            movie (encoded_movie.EncodedMovie): The movie to broadcast.
+            scheduler (FrameTickScheduler): The clock of the event loop.
+        """
+        self.movie = movie
+        self.position = (0, -1)
+        self._scheduler = scheduler
+        self._next_position = None
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._next_position = asyncio.get_event_loop().create_future()
+            self._task = asyncio.ensure_future(self._run())
+
+    async def next_position(self) -> Tuple[int, int]:
+        """Waits for the next frame change and returns its (loop number, frame index)."""
+        return await asyncio.shield(self._next_position)
+
+    async def _run(self):
+        tick = self._scheduler.tick
+        loop_number = 0
+        while True:
+            for index, display_time in enumerate(self.movie.display_times):
+                await self._scheduler.wait_for_tick(tick)
+                self._publish((loop_number, index))
+                tick += display_time
+            loop_number += 1
+
+    def _publish(self, position: Tuple[int, int]):
+        self.position = position
+        published, self._next_position = self._next_position, asyncio.get_event_loop().create_future()
+        published.set_result(position)
+
+
+class BroadcastViewer(object):
+    def __init__(
+        self,
+        channel: BroadcastChannel,
+        delta: bool = False,
+        max_backlog_seconds: float = MAX_BACKLOG_SECONDS,
+        movie: EncodedMovie = None
+    ):
+        """
+        Watches a BroadcastChannel. It has the same interface as VT100Player, so it can be used in its place.
+
+        The viewer joins at the channel's next keyframe and watches one whole movie from there, so a viewer who joins
+        half way through sees the second half and then, after the channel loops, the first half. When frames are
+        missed because the client is slow, the next frame is sent in full.
+
+        Args:
+            channel (BroadcastChannel): Channel to watch.
+            delta (bool): Only send the characters that changed since the last drawn frame, when possible.
+            max_backlog_seconds (float): Skip frames while backlog_seconds reports more than this.
+            movie (encoded_movie.EncodedMovie): Rendering of the channel's movie to show, such as one laid out for the
+                viewer's terminal. Defaults to the channel's movie.
+        """
+        self._channel = channel
+        self._movie = movie if movie is not None else channel.movie
+        self._delta = delta
+        self._max_backlog_seconds = max_backlog_seconds
+        self._stopped = False
+        self._joined_at = None  # (loop number, frame index) of the keyframe the viewer joined at
+        self._last_drawn = None  # (loop number, frame index) of the frame currently on screen
+        self._latest = None
+        self._frame_published = Event()
+
+    def play(self):
+        """
+        Plays the channel
+        """
+        self._stopped = False
+        self._channel.subscribe(self._on_publish)
+        try:
+            while not self._stopped:
+                self._frame_published.wait()
+                self._frame_published.clear()
+                position = self._latest
+                if self._is_over(position):
+                    return
+                if self.backlog_seconds() > self._max_backlog_seconds:
+                    FRAMES_DROPPED.inc(reason='backlog')
+                    continue
+                encoded_frame = self._encode_update(position)
+                if encoded_frame is not None:
+                    self.draw_frame(encoded_frame)
+        finally:
+            self._channel.unsubscribe(self._on_publish)
+
+    def stop(self):
+        """
+        Stop watching
+        """
+        self._stopped = True
+        self._frame_published.set()
+
+    def draw_frame(self, screen_buffer):
+        """
+        Public event method, which can be used to get new Screens.
+        This must be implemented by the user.
+
+        Args:
+            screen_buffer (bytes): the VT100 screen buffer
+
+        """
+        raise NotImplementedError("You must specify how to draw the frame.")
+
+    def backlog_seconds(self) -> float:
+        """
+        Public event method, which can be used to report how many seconds of already drawn frames are still waiting
+        to reach the client. Frames are skipped while it is above max_backlog_seconds.
+        """
+        return 0
+
+    def _on_publish(self, position: Tuple[int, int]):
+        self._latest = position
+        self._frame_published.set()
+
+    def _is_over(self, position: Tuple[int, int]) -> bool:
+        if self._joined_at is None:
+            return False
+        joined_loop, joined_index = self._joined_at
+        return position >= (joined_loop + 1, joined_index)
+
+    def _encode_update(self, position: Tuple[int, int]) -> Optional[bytes]:
+        """
+        Returns:
+            bytes: What to send to get this frame on screen, or None if there is nothing to send.
+        """
+        movie = self._movie
+        loop_number, index = position
+        if self._last_drawn is None:
+            if not movie.is_keyframe(index):
+                return None  # Wait for the next keyframe to join
+            self._joined_at = position
+            self._last_drawn = position
+            return movie.clear_screen + movie.frames[index]
+
+        if position == self._last_drawn:
+            return None
+        previous_index = self._last_drawn[1]
+        self._last_drawn = position
+        if self._delta and index == previous_index + 1:
+            return movie.deltas[index]
+        return movie.frames[index]
+
+
+class AsyncBroadcastViewer(BroadcastViewer):
+    """
+    BroadcastViewer for an AsyncBroadcastChannel.
+    """
+
+    async def play(self):
+        """
+        Plays the channel
+        """
+        self._stopped = False
+        while not self._stopped:
+            position = await self._channel.next_position()
+            if self._is_over(position):
+                return
+            if self.backlog_seconds() > self._max_backlog_seconds:
+                FRAMES_DROPPED.inc(reason='backlog')
+                continue
+            encoded_frame = self._encode_update(position)
+            if encoded_frame is not None:
+                self.draw_frame(encoded_frame)
+                await self.drain()
+
+    def stop(self):
+        """
+        Stop watching
+        """
+        self._stopped = True
+
+    async def drain(self):
+        """
+        Public event method, awaited after every drawn frame so the user can wait for the frame to be sent.
+        """
+        pass
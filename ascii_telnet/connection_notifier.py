@@ -1,4 +1,13 @@
+import json
+import os
+import time
+import traceback
+from datetime import datetime
 from os import getenv
+from queue import Empty, Full, Queue
+from threading import Lock, Thread
+from typing import List
+
 import yagmail
 
 NOTIFICATION_USERNAME = getenv('NOTIFICATION_USERNAME')
@@ -6,6 +15,12 @@ NOTIFICATION_PASSWORD = getenv('NOTIFICATION_PASSWORD')
 DESTINATION_EMAIL_ADDRESS = getenv('DESTINATION_EMAIL_ADDRESS')
 APP_NAME = getenv('APP_NAME')
 
+MAX_QUEUED_NOTIFICATIONS = 1000  # Notifications beyond this are dropped rather than held in memory
+DIGEST_SECONDS = 10  # Notifications coming in within this long of the first one are sent together as one digest
+MAX_DIGEST_SIZE = 50
+MAX_SEND_ATTEMPTS = 4
+RETRY_DELAY_SECONDS = 2  # Doubled after every failed attempt
+
 
 class MisconfiguredNotificationError(Exception):
     pass
@@ -33,3 +48,207 @@ def send_notification(
         subject=f"Notification from {app_name}",
         contents=notification_contents
     )
+
+
+class SMTPBackend(object):
+    def __init__(self, username: str, password: str, destination: str):
+        """
+        Sends notifications as emails over one SMTP connection, which is kept open between emails and opened again
+        after a failure.
+        """
+        self.username = username
+        self.password = password
+        self.destination = destination
+        self._client = None
+
+    def send(self, subject: str, contents: str):
+        if self._client is None:
+            self._client = yagmail.SMTP(self.username, self.password)
+        try:
+            self._client.send(to=self.destination, subject=subject, contents=contents)
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        if self._client is not None:
+            try:
+                self._client.close()
+            except Exception:
+                pass
+            self._client = None
+
+
+class JSONLinesBackend(object):
+    def __init__(self, path: str):
+        """
+        Appends notifications to a file, one JSON object per line.
+        """
+        self.path = path
+
+    def send(self, subject: str, contents: str):
+        record = {'time': datetime.now().isoformat(timespec='seconds'), 'subject': subject, 'contents': contents}
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+    def close(self):
+        pass
+
+
+class PrintBackend(object):
+    """
+    Prints notifications, for when nowhere else to send them is configured.
+    """
+
+    def send(self, subject: str, contents: str):
+        print(contents)
+
+    def close(self):
+        pass
+
+
+class MemoryBackend(object):
+    def __init__(self, failures: int = 0):
+        """
+        Stand-in for SMTPBackend in tests, which keeps the notifications it is sent.
+
+        Args:
+            failures (int): How many times sending fails before it starts working
+        """
+        self.sent = []  # (subject, contents) tuples
+        self.failures = failures
+
+    def send(self, subject: str, contents: str):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("Pretending the mail server is down")
+        self.sent.append((subject, contents))
+
+    def close(self):
+        pass
+
+
+def default_backend():
+    """
+    The SMTP backend when the notification environment variables are set, the print backend otherwise.
+    """
+    if None in [NOTIFICATION_USERNAME, NOTIFICATION_PASSWORD, DESTINATION_EMAIL_ADDRESS, APP_NAME]:
+        return PrintBackend()
+    return SMTPBackend(NOTIFICATION_USERNAME, NOTIFICATION_PASSWORD, DESTINATION_EMAIL_ADDRESS)
+
+
+class NotificationDispatcher(object):
+    def __init__(
+        self,
+        backend=None,
+        app_name: str = APP_NAME,
+        digest_seconds: float = DIGEST_SECONDS,
+        max_queued: int = MAX_QUEUED_NOTIFICATIONS,
+        max_attempts: int = MAX_SEND_ATTEMPTS,
+        retry_delay_seconds: float = RETRY_DELAY_SECONDS
+    ):
+        """
+        Sends notifications from a background thread, so that visitors never wait on the mail server.
+
+        notify only queues the notification. The thread waits digest_seconds after a notification for others to come
+        in and sends them all as one digest. A failed send is retried with a doubling delay, up to max_attempts times.
+        When the queue is full, new notifications are dropped.
+
+        The thread is started by the first notification, so that each forked worker process gets its own.
+
+        Args:
+            backend: Where notifications are sent, anything with send(subject, contents) and close() methods.
+                Defaults to default_backend().
+            app_name (str): Name of the app to put in the subjects
+            digest_seconds (float): How long to collect notifications for before sending them together
+            max_queued (int): Notifications that may wait to be sent
+            max_attempts (int): Attempts to send a digest before giving up on it
+            retry_delay_seconds (float): Delay before the first retry
+        """
+        self.backend = backend if backend is not None else default_backend()
+        self.app_name = app_name or 'Ascii Telnet Server'
+        self.digest_seconds = digest_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay_seconds = retry_delay_seconds
+        self.dropped = 0
+        self._queue = Queue(max_queued)
+        self._thread = None
+        self._thread_pid = None
+        self._start_lock = Lock()
+
+    @property
+    def queued(self) -> int:
+        return self._queue.qsize()
+
+    def notify(self, notification: str):
+        """
+        Queues a notification to be sent. This never blocks.
+        """
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(notification)
+        except Full:
+            self.dropped += 1
+
+    def flush(self, timeout: float = None):
+        """
+        Blocks until every queued notification has been sent or given up on.
+        """
+        if self._thread is None:
+            return
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return
+            time.sleep(0.01)
+
+    def _ensure_started(self):
+        with self._start_lock:
+            # A thread started before a fork doesn't exist in the child
+            if self._thread is None or self._thread_pid != os.getpid():
+                self._thread_pid = os.getpid()
+                self._thread = Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            digest = [self._queue.get()]
+            deadline = time.monotonic() + self.digest_seconds
+            while len(digest) < MAX_DIGEST_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    digest.append(self._queue.get(timeout=remaining))
+                except Empty:
+                    break
+            try:
+                self._send_digest(digest)
+            finally:
+                for _ in digest:
+                    self._queue.task_done()
+
+    def _send_digest(self, notifications: List[str]):
+        if len(notifications) == 1:
+            subject = f"Notification from {self.app_name}"
+            contents = notifications[0]
+        else:
+            subject = f"{len(notifications)} notifications from {self.app_name}"
+            contents = '\n\n----------\n\n'.join(notifications)
+        if self.dropped:
+            contents += f"\n\n({self.dropped} notifications were dropped because too many came in at once)"
+            self.dropped = 0
+
+        delay = self.retry_delay_seconds
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                self.backend.send(subject, contents)
+                return
+            except Exception:
+                if attempt == self.max_attempts:
+                    print(f"Giving up on sending {len(notifications)} notifications:")
+                    traceback.print_exc()
+                    print(contents)
+                    return
+                time.sleep(delay)
+                delay *= 2
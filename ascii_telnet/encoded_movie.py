@@ -0,0 +1,515 @@
+# coding=utf-8
+from __future__ import division, print_function
+
+import re
+import sys
+from bisect import bisect_left, bisect_right
+from collections.abc import Sequence
+from functools import lru_cache
+from io import BytesIO
+from itertools import accumulate
+from collections import OrderedDict
+from threading import Lock
+from typing import Callable, Hashable, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from ascii_telnet.ascii_movie import Frame, Movie, ReadOnlyMovie, TimeBar, ansi_escape
+
+ESC = chr(27)  # VT100 escape character constant
+CLEARSCRN = ESC + "[2J"  # Clear entire screen
+
+KEYFRAME_INTERVAL = 30  # Every this many frames, the delta stream carries a full frame
+# Unchanged gaps shorter than this are resent rather than jumped over, since a cursor move costs about as much.
+MIN_CURSOR_JUMP = 8
+LAZY_CACHE_SIZE = 512  # Encoded frames kept by a lazily encoded movie
+WINDOW_CACHE_SIZE = 16  # Renderings for other terminal sizes kept by a movie
+STANDARD_WINDOW_SIZES = ((80, 24), (120, 30))  # Terminal sizes most clients have, see EncodedMovie.prepare_windows
+MIN_WINDOW_SIZE = (16, 4)  # Smaller terminals get the rendering for this size
+
+FULL_STYLING = 'full'
+REDUCED_STYLING = 'reduced'  # Colors reduced to the 16 basic terminal colors
+NO_STYLING = 'none'
+
+sgr_sequence = re.compile(r'\x1B\[([0-9;]*)m')
+CUBE_LEVELS = (0, 95, 135, 175, 215, 255)  # Channel values of the 6x6x6 color cube of 256 color terminals
+
+
+class WindowLayout(NamedTuple):
+    """Where and how a movie is drawn on a terminal of a given size."""
+    scale: int  # 2 to draw every other column and line, 1 otherwise
+    crop_x: int  # First column and line of the (scaled) frame that is drawn
+    crop_y: int
+    width: int  # Columns and lines of the frame that are drawn
+    height: int
+    left_margin: int  # Blank columns left of the frame
+    top_margin: int  # Screen line (starting at 1) of the first line of the frame
+
+
+def fit_to_window(movie: Movie, width: int, height: int) -> WindowLayout:
+    """
+    Lays a movie out on a terminal of width x height characters. The frame and its TimeBar are centered. A frame that
+    doesn't fit is drawn at half resolution, and whatever still doesn't fit is cropped around the center.
+    """
+    width, height = max(width, MIN_WINDOW_SIZE[0]), max(height, MIN_WINDOW_SIZE[1])
+    frame_width = movie.screen_width
+    frame_height = movie.screen_height - TimeBar.height
+    room_height = height - TimeBar.height
+    scale = 1 if frame_width <= width and frame_height <= room_height else 2
+    scaled_width = -(-frame_width // scale)
+    scaled_height = -(-frame_height // scale)
+    drawn_width = min(scaled_width, width)
+    drawn_height = min(scaled_height, room_height)
+    return WindowLayout(
+        scale=scale,
+        crop_x=(scaled_width - drawn_width) // 2,
+        crop_y=(scaled_height - drawn_height) // 2,
+        width=drawn_width,
+        height=drawn_height,
+        left_margin=(width - drawn_width) // 2,
+        top_margin=(room_height - drawn_height) // 2 + 1,
+    )
+
+
+class EncodedMovie(object):
+    def __init__(
+        self,
+        movie: Movie,
+        keyframe_interval: int = KEYFRAME_INTERVAL,
+        styling: str = FULL_STYLING,
+        frame_step: int = 1,
+        window: Tuple[int, int] = None,
+        lazy: bool = None
+    ):
+        """
+        A Movie compiled into ready-to-send VT100 bytes, one immutable bytes object per frame.
+
+        Each encoded frame contains the cursor positioning, the frame lines and the TimeBar for that point in
+        the movie. An EncodedMovie is built once and is only ever read afterwards, so it can be shared by every
+        player and connection.
+
+        Alongside the full frames there is a delta stream. Each delta only repaints the runs of characters that
+        changed since the previous frame, and every keyframe_interval frames the delta is a full frame instead.
+        A delta is only valid when the previous frame of the same EncodedMovie was the last one drawn.
+
+        A MappedMovie or CompressedMovie is encoded lazily instead, frame by frame as players ask for them, with the
+        most recently used frames cached. That keeps start up instant and memory down to the frames being played.
+
+        Frames are encoded by frame id where the movie has them (see ascii_movie.FrameInterner), so a frame that
+        repeats all over the movie is only encoded once, and only its TimeBar is added for each time it's shown.
+
+        Args:
+            movie (ascii_movie.Movie): The loaded movie to encode.
+            keyframe_interval (int): How many frames apart the full frames in the delta stream are.
+            styling (str): FULL_STYLING keeps the ANSI styling of the frames, REDUCED_STYLING reduces the colors to
+                the 16 basic ones and NO_STYLING removes the styling.
+            frame_step (int): Only encode every frame_step-th frame, each displayed for the time of the frames it
+                replaces. 2 gives half the frame rate.
+            window (tuple): (width, height) of the terminal to lay the movie out for, see fit_to_window. Without it,
+                the movie is drawn as it was made.
+            lazy (bool): Encode the frames as players ask for them. By default, a MappedMovie, a CompressedMovie and
+                renderings for a window are, since those are built while a visitor waits.
+        """
+        self.movie = movie
+        self.window = window
+        self.layout: Optional[WindowLayout] = fit_to_window(movie, *window) if window else None
+        if self.layout:
+            self.screen_width = max(window[0], MIN_WINDOW_SIZE[0])
+            self.screen_height = max(window[1], MIN_WINDOW_SIZE[1])
+            self.left_margin = self.layout.left_margin
+            self.top_margin = self.layout.top_margin
+        else:
+            self.screen_width = movie.screen_width
+            self.screen_height = movie.screen_height
+            self.left_margin = 0
+            self.top_margin = movie.top_margin
+        self.clear_screen = CLEARSCRN.encode()
+        self.styling = styling
+        self.frame_step = frame_step
+        self.lazy = (isinstance(movie, ReadOnlyMovie) or self.layout is not None) if lazy is None else lazy
+
+        source_display_times = movie.display_times
+        self.display_times = tuple(
+            sum(source_display_times[index:index + frame_step])
+            for index in range(0, len(source_display_times), frame_step)
+        )
+        self._frame_positions = tuple(accumulate(self.display_times))
+        self._frame_starts = (0,) + self._frame_positions[:-1]
+        self.frame_count = sum(self.display_times)
+        if self.layout:
+            self.timebar = TimeBar(
+                self.frame_count,
+                self.layout.width,
+                row=self.top_margin + self.layout.height,
+                column=self.left_margin + 1
+            )
+        else:
+            self.timebar = TimeBar(self.frame_count, self.screen_width, row=self.screen_height)
+        self.keyframe_interval = keyframe_interval
+
+        # Encodings without the TimeBar, by frame id, for frames that repeat
+        self._frame_lines_cache = KeyedCache()
+        self._frame_bodies = KeyedCache()
+        self._delta_bodies = KeyedCache()  # by (previous frame id, frame id)
+        if self.lazy:
+            self.frames = LazyEncodedFrames(self._encode_frame_at, len(self.display_times))
+            self.deltas = LazyEncodedFrames(self._encode_delta_at, len(self.display_times))
+        else:
+            self.frames = tuple(self._encode_frame_at(index) for index in range(len(self.display_times)))
+            self.deltas = tuple(self._encode_delta_at(index) for index in range(len(self.display_times)))
+            for cache in (self._frame_lines_cache, self._frame_bodies, self._delta_bodies):
+                cache.clear()  # Everything is encoded already
+
+        self._variants = {}
+        self._variants_lock = Lock()
+        self._windows = OrderedDict()  # (width, height) -> EncodedMovie, least recently used first
+        self._prepared_windows = {}  # (width, height) -> EncodedMovie, see prepare_windows
+
+    def __len__(self):
+        return len(self.frames)
+
+    def frame_seconds(self, index: int) -> float:
+        return self.display_times[index] / Frame.DISPLAY_PER_SECONDS
+
+    def is_keyframe(self, index: int) -> bool:
+        return index % self.keyframe_interval == 0
+
+    def frame_start(self, index: int) -> int:
+        """The frame cycle of the movie that the frame at index starts on, the end of the movie for len(self)."""
+        if index == len(self):
+            return self.frame_count
+        return self._frame_starts[index]
+
+    def frame_end(self, index: int) -> int:
+        """The frame cycle of the movie that the frame at index ends on."""
+        return self._frame_positions[index]
+
+    def index_at(self, frame_pos: int) -> int:
+        """The index of the first frame starting at or after frame cycle frame_pos, len(self) if there is none."""
+        return bisect_left(self._frame_starts, frame_pos)
+
+    def index_of(self, frame_pos: float) -> int:
+        """The index of the frame on screen at frame cycle frame_pos, len(self) once the movie is over."""
+        if frame_pos >= self.frame_count:
+            return len(self)
+        return max(bisect_right(self._frame_starts, frame_pos) - 1, 0)
+
+    @property
+    def destyled(self) -> 'EncodedMovie':
+        """
+        The same movie with all ANSI styling removed. It is built the first time a player asks for it and then shared.
+        """
+        return self.variant(styling=NO_STYLING)
+
+    @property
+    def reduced_color(self) -> 'EncodedMovie':
+        """
+        The same movie with its colors reduced to the 16 basic terminal colors, built once and shared.
+        """
+        return self.variant(styling=REDUCED_STYLING)
+
+    @property
+    def half_frame_rate(self) -> 'EncodedMovie':
+        """
+        The same movie without styling at half the frame rate, built once and shared.
+        """
+        return self.variant(styling=NO_STYLING, frame_step=2)
+
+    def variant(self, styling: str = FULL_STYLING, frame_step: int = 1) -> 'EncodedMovie':
+        """
+        The same movie encoded with other settings. Each variant is built the first time it is asked for and then
+        shared.
+        """
+        if (styling, frame_step) == (self.styling, self.frame_step):
+            return self
+        with self._variants_lock:
+            key = (styling, frame_step)
+            if key not in self._variants:
+                self._variants[key] = self.__class__(
+                    self.movie,
+                    self.keyframe_interval,
+                    styling,
+                    frame_step,
+                    self.window
+                )
+            return self._variants[key]
+
+    def for_window(self, width: int, height: int) -> 'EncodedMovie':
+        """
+        The same movie laid out for a terminal of width x height characters. The renderings for the most recently
+        seen sizes are kept and shared. A terminal of exactly the movie's size gets the movie itself.
+        """
+        if self.window is None and (width, height) == (self.screen_width, self.screen_height):
+            return self
+        key = (width, height)
+        with self._variants_lock:
+            if key in self._prepared_windows:
+                return self._prepared_windows[key]
+            rendering = self._windows.get(key)
+            if rendering is None:
+                rendering = self.__class__(self.movie, self.keyframe_interval, self.styling, self.frame_step, key)
+                self._windows[key] = rendering
+                if len(self._windows) > WINDOW_CACHE_SIZE:
+                    self._windows.popitem(last=False)
+            else:
+                self._windows.move_to_end(key)
+            return rendering
+
+    def prepare_windows(self, sizes: Iterable[Tuple[int, int]] = STANDARD_WINDOW_SIZES):
+        """
+        Encodes the renderings for these terminal sizes up front, like the movie itself, and keeps them for good. The
+        renderings for other sizes are encoded lazily, which puts encoding back on the path of every frame once a
+        movie is longer than the cache.
+
+        Args:
+            sizes (iterable): (width, height) of every terminal size to prepare
+        """
+        for key in sizes:
+            if self.window is None and key == (self.screen_width, self.screen_height):
+                continue
+            rendering = self.__class__(
+                self.movie,
+                self.keyframe_interval,
+                self.styling,
+                self.frame_step,
+                key,
+                lazy=isinstance(self.movie, ReadOnlyMovie)
+            )
+            with self._variants_lock:
+                self._prepared_windows[key] = rendering
+
+    def _frame_id(self, index: int) -> Hashable:
+        """
+        Identifies the lines of the frame at index: frames with the same id have the same lines.
+        """
+        source_index = index * self.frame_step
+        if isinstance(self.movie, ReadOnlyMovie):
+            return self.movie.frames.frame_id(source_index)
+        frame_id = self.movie.frames[source_index].frame_id
+        return ('index', index) if frame_id is None else frame_id
+
+    def _frame_lines(self, index: int) -> List[str]:
+        return self._frame_lines_cache.get(self._frame_id(index), lambda: self._render_lines(index))
+
+    def _render_lines(self, index: int) -> List[str]:
+        lines = self.movie.frames[index * self.frame_step].data
+        if self.styling == NO_STYLING:
+            lines = [ansi_escape.sub('', line) for line in lines]
+        elif self.styling == REDUCED_STYLING:
+            lines = [reduce_colors(line) for line in lines]
+        if self.layout:
+            lines = self._fit_lines(lines)
+        return lines
+
+    def _fit_lines(self, lines: List[str]) -> List[str]:
+        layout = self.layout
+        if layout.scale == 1 and layout.crop_x == 0 and layout.crop_y == 0:
+            return lines
+        # Styling can't be cut in half or cropped along with the characters, so a frame that is gets none.
+        lines = [ansi_escape.sub('', line) for line in lines]
+        lines = lines[::layout.scale][layout.crop_y:layout.crop_y + layout.height]
+        return [line[::layout.scale][layout.crop_x:layout.crop_x + layout.width] for line in lines]
+
+    def _encode_frame_at(self, index: int) -> bytes:
+        body = self._frame_bodies.get(self._frame_id(index), lambda: self._encode_frame(self._frame_lines(index)))
+        return body + self.timebar.get_encoded_timebar(self._frame_positions[index])
+
+    def _encode_delta_at(self, index: int) -> bytes:
+        if self.is_keyframe(index):
+            return self.frames[index]
+        body = self._delta_bodies.get(
+            (self._frame_id(index - 1), self._frame_id(index)),
+            lambda: self._encode_delta(self._frame_lines(index - 1), self._frame_lines(index))
+        )
+        return body + self.timebar.get_encoded_timebar(self._frame_positions[index], self._frame_positions[index - 1])
+
+    def _encode_delta(self, previous_lines: List[str], lines: List[str]) -> bytes:
+        """
+        Args:
+            previous_lines (list): Lines of the frame currently on screen
+            lines (list): Lines of the frame to draw
+
+        Returns:
+            bytes: VT100 cursor moves and changed runs that turn the previous frame into this one, without the TimeBar
+        """
+        screenbuf = BytesIO()
+        top = max(self.top_margin, 1)  # A full frame moved to line 0, which terminals take as line 1
+        for row, line in enumerate(lines):
+            previous_line = previous_lines[row] if row < len(previous_lines) else ''
+            if line == previous_line:
+                continue
+            y = top + row
+            if ESC in line or ESC in previous_line:
+                # Characters can't be addressed individually once styling is involved, so repaint the whole line.
+                screenbuf.write(self._move_cursor(self.left_margin + 1, y))
+                screenbuf.write(line.encode())
+                continue
+            for start, end in _changed_runs(previous_line, line):
+                screenbuf.write(self._move_cursor(self.left_margin + start + 1, y))
+                screenbuf.write(line[start:end].encode())
+        return screenbuf.getvalue()
+
+    def _encode_frame(self, lines: List[str]) -> bytes:
+        """
+        Args:
+            lines (list): Lines of the frame to encode
+
+        Returns:
+            bytes: The VT100 screen buffer for the frame, without the TimeBar
+        """
+        screenbuf = BytesIO()
+        if self.left_margin:
+            # A new line would go back to the first column, so every line gets moved to.
+            for row, line in enumerate(lines):
+                screenbuf.write(self._move_cursor(self.left_margin + 1, self.top_margin + row))
+                screenbuf.write(line.encode())
+        else:
+            # center vertical, with respect to the time bar (like letter boxing)
+            screenbuf.write(self._move_cursor(1, self.top_margin))
+            for line in lines:
+                screenbuf.write((line + "\r\n").encode())
+        return screenbuf.getvalue()
+
+    def _move_cursor(self, x, y):
+        """
+        Send VT100 commands: go to position X,Y
+
+        Args:
+            x (int): x coordinate (starting at 1)
+            y (int): y coordinate (starting at 1)
+
+        Returns:
+            bytes: the VT100 code
+
+        """
+        if 0 >= x > self.screen_width or 0 >= y > self.screen_height:
+            sys.stderr.write("Warning, coordinates out of range. ({0}, {1})\n".format(x, y))
+            return "".encode()
+        else:
+            return (ESC + "[{0};{1}H".format(y, x)).encode()
+
+
+class KeyedCache(object):
+    def __init__(self, size: int = LAZY_CACHE_SIZE):
+        """
+        Keeps the size most recently used values, computing the missing ones. Safe to share between threads.
+        """
+        self.size = size
+        self._values = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Hashable, compute: Callable[[], object]):
+        with self._lock:
+            if key in self._values:
+                self._values.move_to_end(key)
+                return self._values[key]
+        value = compute()
+        with self._lock:
+            self._values[key] = value
+            if len(self._values) > self.size:
+                self._values.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class LazyEncodedFrames(Sequence):
+    def __init__(self, encode: Callable[[int], bytes], frame_count: int, cache_size: int = LAZY_CACHE_SIZE):
+        """
+        Encoded frames that are only encoded when asked for, keeping the most recently used ones.
+
+        Args:
+            encode (callable): Encodes the frame at an index
+            frame_count (int): Number of frames
+            cache_size (int): Number of encoded frames to keep
+        """
+        self._encode = lru_cache(maxsize=cache_size)(encode)
+        self._frame_count = frame_count
+
+    def __len__(self):
+        return self._frame_count
+
+    def __getitem__(self, index: int) -> bytes:
+        if index < 0:
+            index += self._frame_count
+        if not 0 <= index < self._frame_count:
+            raise IndexError("Frame index out of range")
+        return self._encode(index)
+
+
+def _changed_runs(previous_line: str, line: str) -> Iterator[Tuple[int, int]]:
+    """
+    Yields (start, end) column slices of line that differ from previous_line. Characters of previous_line past the
+    end of line are left alone, just like a full repaint would.
+    """
+    run_start = None
+    run_end = None
+    for column, character in enumerate(line):
+        if column < len(previous_line) and previous_line[column] == character:
+            continue
+        if run_start is not None and column - run_end >= MIN_CURSOR_JUMP:
+            yield run_start, run_end
+            run_start = None
+        if run_start is None:
+            run_start = column
+        run_end = column + 1
+    if run_start is not None:
+        yield run_start, run_end
+
+
+def reduce_colors(line: str) -> str:
+    """
+    Reduces 256 color and true color SGR codes to the 16 basic terminal colors, and drops codes that only repeat
+    the code before them. Applying the same SGR code twice in a row has no further effect.
+    """
+    previous_sequence = None
+
+    def reduce_sequence(match):
+        nonlocal previous_sequence
+        sequence = '\x1B[{0}m'.format(';'.join(_reduce_sgr_parameters(match.group(1).split(';'))))
+        if sequence == previous_sequence:
+            return ''
+        previous_sequence = sequence
+        return sequence
+
+    return sgr_sequence.sub(reduce_sequence, line)
+
+
+def _reduce_sgr_parameters(parameters: List[str]) -> Iterator[str]:
+    parameters = iter(parameters)
+    for parameter in parameters:
+        if parameter not in ('38', '48'):
+            yield parameter
+            continue
+        color_base = 30 if parameter == '38' else 40
+        try:
+            color_mode = next(parameters)
+            if color_mode == '5':
+                rgb = _rgb_of_256_color(int(next(parameters)))
+            elif color_mode == '2':
+                rgb = (int(next(parameters)), int(next(parameters)), int(next(parameters)))
+            else:
+                continue
+        except (StopIteration, ValueError):
+            return  # Malformed, so drop the rest of the sequence
+        yield str(_basic_color_code(rgb, color_base))
+
+
+def _rgb_of_256_color(color: int) -> Tuple[int, int, int]:
+    if color < 16:
+        # The basic colors themselves. Bright ones are 8 higher.
+        level = 255 if color >= 8 else 170
+        return tuple(level if color & bit else 0 for bit in (1, 2, 4))
+    if color < 232:
+        color -= 16
+        return CUBE_LEVELS[color // 36], CUBE_LEVELS[color // 6 % 6], CUBE_LEVELS[color % 6]
+    gray = 8 + 10 * (color - 232)
+    return gray, gray, gray
+
+
+def _basic_color_code(rgb: Tuple[int, int, int], color_base: int) -> int:
+    """The SGR code of the basic color closest to rgb. color_base is 30 for foreground and 40 for background."""
+    color = sum(bit for bit, value in zip((1, 2, 4), rgb) if value > 127)
+    if max(rgb) > 191 and color_base == 30:
+        return 90 + color  # Bright foreground
+    return color_base + color
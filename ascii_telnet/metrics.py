@@ -0,0 +1,287 @@
+# coding=utf-8
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Callable, Dict, Iterable, List, Tuple
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'  # Prometheus text exposition format
+
+WRITE_SECONDS_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1)
+DRIFT_SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+
+
+def _format_labels(label_names: Tuple[str, ...], label_values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric(object):
+    type_name = None
+
+    def __init__(self, name: str, description: str, label_names: Iterable[str] = ()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self._lock = Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} {self.type_name}']
+        for label_values, value in self._samples():
+            lines.append(f'{self.name}{_format_labels(self.label_names, label_values)} {_format_value(value)}')
+        return lines
+
+    def _samples(self) -> List[Tuple[Tuple[str, ...], float]]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """
+    A count that only goes up, such as frames sent.
+    """
+    type_name = 'counter'
+
+    def __init__(self, name: str, description: str, label_names: Iterable[str] = ()):
+        super().__init__(name, description, label_names)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            return sorted(self._values.items())
+
+
+class Gauge(_Metric):
+    """
+    A value that goes up and down, such as visitors in a phase. Values can also be read from a function when the
+    metrics are collected, for values that are already kept somewhere else.
+    """
+    type_name = 'gauge'
+
+    def __init__(self, name: str, description: str, label_names: Iterable[str] = ()):
+        super().__init__(name, description, label_names)
+        self._values = {}
+        self._functions = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float], **labels):
+        with self._lock:
+            self._functions[self._key(labels)] = function
+
+    def value(self, **labels) -> float:
+        key = self._key(labels)
+        function = self._functions.get(key)
+        return function() if function else self._values.get(key, 0)
+
+    @contextmanager
+    def track(self, **labels):
+        """
+        Counts whatever is in the with block for as long as it's in there.
+        """
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def _samples(self):
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, function in functions.items():
+            values[key] = function()
+        return sorted(values.items())
+
+
+class Histogram(_Metric):
+    """
+    Counts of observations, such as write latencies, in cumulative buckets.
+    """
+    type_name = 'histogram'
+
+    def __init__(self, name: str, description: str, buckets: Iterable[float], label_names: Iterable[str] = ()):
+        super().__init__(name, description, label_names)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._counts = {}  # label values -> [count per bucket], not cumulative
+        self._sums = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        bucket = next(index for index, bound in enumerate(self.buckets) if value <= bound)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * len(self.buckets)
+                self._sums[key] = 0
+            counts[bucket] += 1
+            self._sums[key] += value
+
+    def count(self, **labels) -> int:
+        return sum(self._counts.get(self._key(labels), ()))
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} {self.type_name}']
+        with self._lock:
+            samples = sorted((key, list(counts), self._sums[key]) for key, counts in self._counts.items())
+        for label_values, counts, total in samples:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(self.label_names, label_values, f'le="{_format_value(bound)}"')
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.label_names, label_values)
+            lines.append(f'{self.name}_sum{labels} {_format_value(float(total))}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Registry(object):
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """
+        Returns:
+            str: Every metric in the Prometheus text exposition format
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+CONNECTIONS = REGISTRY.register(Gauge('ascii_telnet_connections', "Connected visitors"))
+CONNECTIONS_REJECTED = REGISTRY.register(Counter(
+    'ascii_telnet_connections_rejected_total', "Visitors turned away because the server was full"
+))
+SESSIONS = REGISTRY.register(Gauge(
+    'ascii_telnet_sessions', "Visitors by what they're doing: negotiating, prompting, playing or parting",
+    ['phase']
+))
+WAITING_VISITORS = REGISTRY.register(Gauge(
+    'ascii_telnet_waiting_visitors', "Visitors waiting in line, for the prompts or for the movie", ['line']
+))
+FRAMES_SENT = REGISTRY.register(Counter('ascii_telnet_frames_sent_total', "Frames written to visitors"))
+FRAMES_DROPPED = REGISTRY.register(Counter(
+    'ascii_telnet_frames_dropped_total',
+    "Frames skipped, either because the player was late or because the visitor's connection was backed up",
+    ['reason']
+))
+BYTES_WRITTEN = REGISTRY.register(Counter(
+    'ascii_telnet_bytes_written_total', "Bytes of frames written to visitors, after compression for those that have it"
+))
+COMPRESSED_SESSIONS = REGISTRY.register(Counter(
+    'ascii_telnet_compressed_sessions_total', "Visitors whose clients accepted MCCP2 compression"
+))
+FRAME_WRITE_SECONDS = REGISTRY.register(Histogram(
+    'ascii_telnet_frame_write_seconds', "Time taken to write a frame to a visitor's connection", WRITE_SECONDS_BUCKETS
+))
+DRIFT_SECONDS = REGISTRY.register(Histogram(
+    'ascii_telnet_drift_seconds', "How late frames are drawn compared to when they are due", DRIFT_SECONDS_BUCKETS
+))
+DESTYLINGS = REGISTRY.register(Counter(
+    'ascii_telnet_destylings_total', "Playbacks switched to the destyled movie because the visitor fell behind"
+))
+NOTIFICATION_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'ascii_telnet_notification_queue_depth', "Notifications waiting to be sent"
+))
+FRAME_CACHE_LOOKUPS = REGISTRY.register(Gauge(
+    'ascii_telnet_frame_cache_lookups', "Lookups of compressed frames in the decompressed frame cache", ['result']
+))
+FRAME_STORE_BYTES_SAVED = REGISTRY.register(Gauge(
+    'ascii_telnet_frame_store_bytes_saved', "Bytes saved by keeping the frames of the movie compressed"
+))
+
+
+def collect_server_state(admission, notifier):
+    """
+    Reads the connection counts, the lines and the notification queue from where the server keeps them.
+
+    Args:
+        admission (admission.AdmissionControl): The server's admission control
+        notifier (connection_notifier.NotificationDispatcher): The server's notification dispatcher
+    """
+    CONNECTIONS.set_function(lambda: admission.connections)
+    WAITING_VISITORS.set_function(lambda: admission.sessions.waiting, line='sessions')
+    WAITING_VISITORS.set_function(lambda: admission.playbacks.waiting, line='playbacks')
+    NOTIFICATION_QUEUE_DEPTH.set_function(lambda: notifier.queued)
+
+
+def collect_frame_store(frames, cache):
+    """
+    Reads the frame cache's hits and misses, and what compressing the frames saved.
+
+    Args:
+        frames (ascii_movie.CompressedFrames): The frames of the movie being played
+        cache (ascii_movie.FrameBlockCache): The cache they are decompressed through
+    """
+    FRAME_CACHE_LOOKUPS.set_function(lambda: cache.hits, result='hit')
+    FRAME_CACHE_LOOKUPS.set_function(lambda: cache.misses, result='miss')
+    FRAME_STORE_BYTES_SAVED.set_function(lambda: frames.bytes_saved)
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes every few seconds would drown out everything else
+
+
+def serve_metrics(interface: str, port: int, registry: Registry = REGISTRY) -> ThreadingHTTPServer:
+    """
+    Serves the metrics over HTTP at /metrics from a background thread, for Prometheus to scrape.
+
+    Args:
+        interface (str): bind to this interface
+        port (int): bind to this port
+        registry (Registry): metrics to serve
+
+    Returns:
+        ThreadingHTTPServer: The running server
+    """
+    handler = type('MetricsRequestHandler', (_MetricsRequestHandler,), {'registry': registry})
+    server = ThreadingHTTPServer((interface, port), handler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -1,9 +1,17 @@
+import math
+import os
+import shutil
 import subprocess
 import tempfile
 import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from typing import Iterable, List
 
-from ascii_telnet.ascii_movie import Movie
+import colorama
+
+from ascii_telnet.ascii_movie import MOVIE_FILE_EXTENSION, Frame, Movie, TimeBar, get_loaded_movie, save_movie
+from ascii_telnet.video_converter import VideoToAsciiConverter, is_raw_video, read_video
 from hashlib import md5
 
 current_directory = Path(__file__).parent
@@ -13,6 +21,8 @@ ascii_video_package_dir = node_modules_dir / 'ascii-video'
 temp_dir = Path(tempfile.gettempdir())
 
 REQUIRED_NODE_VERSION = 7
+DEFAULT_WIDTH = 80  # Of movies converted in Python, in characters
+DEFAULT_HEIGHT = 24 - TimeBar.height
 
 
 def make_movie(
@@ -20,10 +30,42 @@ def make_movie(
     processed_movie_path: str,
     node_executable_path: str = None,
     subtitles_path: str = None,
-    seconds_per_slide: int = 3
+    seconds_per_slide: int = 3,
+    segment_seconds: int = None,
+    jobs: int = None,
+    width: int = DEFAULT_WIDTH,
+    height: int = DEFAULT_HEIGHT,
+    palette: str = '256',
+    fps: float = None
 ):
+    """
+    Raw videos (see video_converter.is_raw_video) are converted in Python. Any other video is transcoded with the
+    ascii-video NodeJS package.
+
+    Args:
+        video_path (str): Video to make the movie of
+        processed_movie_path (str): Where to save the movie, see save_movie
+        node_executable_path (str): NodeJS executable, found on the PATH if not given
+        subtitles_path (str): Subtitles to splice in, see Movie.splice_in_text
+        seconds_per_slide (int): Default seconds per subtitle slide
+        segment_seconds (int): Cut the video into segments this long and transcode them in parallel, see
+            _transcode_in_segments. The whole video is transcoded at once if not given.
+        jobs (int): Segments to transcode at the same time. Defaults to the number of CPUs.
+        width (int): Width of a movie converted in Python, in characters
+        height (int): Height of a movie converted in Python, in lines
+        palette (str): Colors of a movie converted in Python, see VideoToAsciiConverter
+        fps (float): Frame rate of a raw video that doesn't tell its own, such as a directory of images. Defaults
+            to the movie's frame rate.
+    """
+    if is_raw_video(video_path):
+        print("Converting frames...")
+        movie, frames = _convert_raw_video(video_path, width, height, palette, fps)
+        return _save_frames(movie, frames, processed_movie_path, subtitles_path, seconds_per_slide)
+
     if not node_executable_path:
-        node_executable_path = subprocess.run('which node', shell=True, capture_output=True, check=True)
+        node_executable_path = subprocess.run(
+            'which node', shell=True, capture_output=True, check=True, encoding='utf-8'
+        ).stdout.strip()
     else:
         assert Path(node_executable_path).exists()
     if not _node_exists_with_right_version(node_executable_path):
@@ -34,19 +76,63 @@ def make_movie(
 
     video_hash = _hash_file(video_path)
 
-    generated_yaml_file = _encode_video_to_ascii(video_path, video_hash, node_executable_path)
+    if segment_seconds:
+        generated_yaml_files = _transcode_in_segments(
+            video_path, video_hash, node_executable_path, segment_seconds, jobs or os.cpu_count() or 1
+        )
+    else:
+        generated_yaml_files = [_encode_video_to_ascii(video_path, video_hash, node_executable_path)]
+    yaml_paths = [str(generated_yaml_file) for generated_yaml_file in generated_yaml_files]
     movie = Movie()
+    return _save_frames(movie, movie.stream_parts(yaml_paths), processed_movie_path, subtitles_path, seconds_per_slide)
+
+
+def _save_frames(
+    movie: Movie,
+    frames: Iterable[Frame],
+    processed_movie_path: str,
+    subtitles_path: str,
+    seconds_per_slide: int
+) -> str:
+    if processed_movie_path.endswith(MOVIE_FILE_EXTENSION) and not subtitles_path:
+        # Nothing needs the whole movie in memory, so stream the frames straight into the movie file.
+        print("Streaming frames into a movie file...")
+        saved_path = movie.stream_frames_to_movie_file(frames, processed_movie_path)
+        print(get_loaded_movie(saved_path).deduplication_report())
+        print("Saving complete!")
+        return saved_path
+
     print("Loading frames into a movie file...")
-    movie.load(str(generated_yaml_file))
+    movie.load_frames(frames)
+    print(movie.deduplication_report())
 
     if subtitles_path:
         print("Splicing in subtitles...")
         movie.splice_in_text(subtitles_path, seconds_per_slide)
 
-    print("Pickling move...")
-    pickle_path = movie.to_pickle(processed_movie_path)
-    print("Pickling complete!")
-    return pickle_path
+    print("Saving movie...")
+    saved_path = save_movie(movie, processed_movie_path)
+    print("Saving complete!")
+    return saved_path
+
+
+def _convert_raw_video(video_path: str, width: int, height: int, palette: str, fps: float = None):
+    """
+    Returns:
+        tuple: A movie the size of the frames, and the frames converted from the video as they are read
+    """
+    video_fps, images = read_video(video_path)
+    converter = VideoToAsciiConverter(width, height, palette)
+    movie = Movie()
+    movie.set_screen_dimensions(width, height + TimeBar.height)
+    movie.set_frame_dimensions(width, height)
+
+    def frames():
+        for frame in converter.frames(images, fps or video_fps or Frame.DISPLAY_PER_SECONDS):
+            frame.set_background_on_frame(colorama.Back.BLACK)
+            yield frame
+
+    return movie, frames()
 
 
 def _hash_file(video_filepath) -> str:
@@ -75,20 +161,101 @@ def _ascii_video_is_installed():
     return ascii_video_package_dir.exists()
 
 
-def _encode_video_to_ascii(video_path: str, video_hash: str, node_executable_path: str) -> Path:
+def _encode_video_to_ascii(video_path: str, video_hash: str, node_executable_path: str, quiet: bool = False) -> Path:
     ascii_video_script_path = ascii_video_package_dir / 'main.js'
     output_file = temp_dir / f'{video_hash}.yaml'
     if output_file.exists():
-        print("Video has already been transcoded to yaml. Using that file instead.")
+        if not quiet:
+            print("Video has already been transcoded to yaml. Using that file instead.")
     else:
+        # Only renamed to the output file once it's complete, so an interrupted transcode isn't taken for a finished one
+        partial_file = temp_dir / f'{video_hash}.partial.yaml'
         command = [
             node_executable_path,
             '--harmony',
             str(ascii_video_script_path),
             'create',
             video_path,
-            str(output_file)
+            str(partial_file)
         ]
 
-        subprocess.run(command, check=True)
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL if quiet else None)
+        partial_file.replace(output_file)
     return output_file
+
+
+def _transcode_in_segments(
+    video_path: str,
+    video_hash: str,
+    node_executable_path: str,
+    segment_seconds: int,
+    jobs: int
+) -> List[Path]:
+    """
+    Cuts the video into segments of segment_seconds with ffmpeg and transcodes up to jobs of them at the same time,
+    each in its own ascii-video process, so a long video uses every core instead of one.
+
+    Transcoded segments are kept in the temp directory like whole videos are, so running this again after it was
+    interrupted only transcodes the segments that weren't finished.
+
+    Returns:
+        list: The yaml file of every segment, in order
+    """
+    for executable in ('ffmpeg', 'ffprobe'):
+        if not shutil.which(executable):
+            raise SystemError(f"Transcoding in segments needs {executable} on your PATH")
+
+    segment_starts = _segment_starts(_video_duration(video_path), segment_seconds)
+    segment_hashes = [
+        f'{video_hash}-{segment_seconds}s-{number:05d}'
+        for number in range(len(segment_starts))
+    ]
+    yaml_files = [temp_dir / f'{segment_hash}.yaml' for segment_hash in segment_hashes]
+    finished = sum(yaml_file.exists() for yaml_file in yaml_files)
+    if finished:
+        print(f"Resuming: {finished} of {len(yaml_files)} segments were already transcoded.")
+
+    print(f"Transcoding {len(yaml_files) - finished} segments of {segment_seconds} seconds, {jobs} at a time...")
+    with ThreadPoolExecutor(max_workers=jobs) as executor:  # The transcoding itself happens in node processes
+        segment_jobs = [
+            executor.submit(_transcode_segment, video_path, start, segment_seconds, segment_hash, node_executable_path)
+            for start, segment_hash, yaml_file in zip(segment_starts, segment_hashes, yaml_files)
+            if not yaml_file.exists()
+        ]
+        for done, segment_job in enumerate(as_completed(segment_jobs), start=finished + 1):
+            segment_job.result()
+            print(f"Transcoded {done} of {len(yaml_files)} segments")
+    return yaml_files
+
+
+def _segment_starts(duration: float, segment_seconds: int) -> List[int]:
+    return list(range(0, max(math.ceil(duration), 1), segment_seconds))
+
+
+def _video_duration(video_path: str) -> float:
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'csv=p=0', video_path],
+        capture_output=True,
+        check=True,
+        encoding='utf-8'
+    )
+    return float(result.stdout.strip())
+
+
+def _transcode_segment(video_path: str, start: int, seconds: int, segment_hash: str, node_executable_path: str) -> Path:
+    segment_video = temp_dir / f'{segment_hash}.mp4'
+    try:
+        # Seeking before the input and re-encoding cuts at the exact time rather than at the nearest keyframe
+        subprocess.run(
+            [
+                'ffmpeg', '-v', 'error', '-y',
+                '-ss', str(start), '-i', video_path, '-t', str(seconds),
+                '-an', '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '18',
+                str(segment_video)
+            ],
+            check=True
+        )
+        return _encode_video_to_ascii(str(segment_video), segment_hash, node_executable_path, quiet=True)
+    finally:
+        if segment_video.exists():
+            segment_video.unlink()
@@ -0,0 +1,133 @@
+# coding=utf-8
+import cProfile
+import itertools
+import os
+import random
+import time
+import tracemalloc
+from contextlib import contextmanager
+from threading import Lock, get_ident
+from typing import Optional, Tuple
+
+TOP_ALLOCATIONS = 50  # Lines that allocated the most during a phase, written to its allocations file
+
+
+class SessionProfiler(object):
+    def __init__(self, directory: str, sample_rate: float = 1.0, trace_allocations: bool = False):
+        """
+        Profiles a random sample of the sessions, one dump per phase of the session (such as prompting or playing),
+        for finding out where their time and memory go.
+
+        CPU profiles are cProfile dumps, to be read with pstats or snakeviz. With trace_allocations, a file listing the
+        lines that allocated the most during the phase is written next to each dump. Dumps are named after the time
+        the session started, the client address and the phase.
+
+        Profiling can be switched on and off while the server runs with toggle. Sessions that weren't sampled cost a
+        single random number. Allocation tracing is stopped once profiling is off and the phases being traced are over.
+
+        cProfile only sees the thread it's started in, and a thread can only run one at a time. On the asyncio engine
+        everything runs in the event loop's thread, so a phase that starts while another session is being profiled
+        gets no CPU profile, and the profiles that are written include the other sessions that ran at the same time.
+        Allocations are always traced for the whole process.
+
+        Args:
+            directory (str): Where to write the dumps
+            sample_rate (float): Fraction of the sessions to profile
+            trace_allocations (bool): Also trace memory allocations, which slows down the whole process
+        """
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.trace_allocations = trace_allocations
+        self.enabled = True
+        self._session_numbers = itertools.count(1)
+        self._profiled_threads = set()  # Threads with a cProfile running
+        self._started_tracing = False  # Whether tracemalloc was started here, rather than by someone else
+        self._traced_phases = 0  # Phases running with an allocation snapshot to compare against
+        self._tracing_lock = Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        print(f"Session profiling {'enabled' if self.enabled else 'disabled'}")
+        if not self.enabled:
+            self._stop_tracing_if_idle()
+
+    def start_session(self, client_address: Tuple) -> Optional['SessionProfile']:
+        """
+        Returns:
+            SessionProfile: Profile for the session, or None if this session isn't sampled
+        """
+        if not self.enabled or random.random() >= self.sample_rate:
+            return None
+        if self.trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        host = str(client_address[0]).replace(':', '_')  # IPv6
+        session = f"{os.getpid()}-{next(self._session_numbers)}"
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{session}-{host}-{client_address[1]}"
+        return SessionProfile(os.path.join(self.directory, name), self)
+
+    def _start_traced_phase(self) -> Optional[tracemalloc.Snapshot]:
+        """
+        Returns:
+            tracemalloc.Snapshot: Allocations so far, or None if allocations aren't being traced
+        """
+        with self._tracing_lock:
+            if not self.trace_allocations or not tracemalloc.is_tracing():
+                return None
+            self._traced_phases += 1
+        return tracemalloc.take_snapshot()
+
+    def _end_traced_phase(self):
+        with self._tracing_lock:
+            self._traced_phases -= 1
+        if not self.enabled:
+            self._stop_tracing_if_idle()
+
+    def _stop_tracing_if_idle(self):
+        with self._tracing_lock:
+            if self._started_tracing and not self._traced_phases:
+                tracemalloc.stop()
+                self._started_tracing = False
+
+
+class SessionProfile(object):
+    def __init__(self, path_prefix: str, profiler: SessionProfiler):
+        self.path_prefix = path_prefix
+        self._profiler = profiler
+        self._profiled_threads = profiler._profiled_threads
+
+    @contextmanager
+    def phase(self, phase: str):
+        """
+        Profiles what runs in the with block, writing the dumps tagged with the phase when it's done.
+        """
+        snapshot = self._profiler._start_traced_phase()
+        thread = get_ident()
+        profile = None
+        if thread not in self._profiled_threads:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+                self._profiled_threads.add(thread)
+            except ValueError:  # Some other profiler is running
+                profile = None
+        try:
+            yield
+        finally:
+            if profile:
+                profile.disable()
+                self._profiled_threads.discard(thread)
+                profile.dump_stats(f'{self.path_prefix}-{phase}.prof')
+            if snapshot:
+                try:
+                    self._write_allocations(snapshot, f'{self.path_prefix}-{phase}.allocations.txt')
+                finally:
+                    self._profiler._end_traced_phase()
+
+    @staticmethod
+    def _write_allocations(start_snapshot: tracemalloc.Snapshot, path: str):
+        differences = tracemalloc.take_snapshot().compare_to(start_snapshot, 'lineno')
+        with open(path, 'w') as f:
+            for difference in differences[:TOP_ALLOCATIONS]:
+                f.write(f'{difference}\n')
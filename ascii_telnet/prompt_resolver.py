@@ -1,5 +1,5 @@
 import re
-from typing import Dict, Callable, Union
+from typing import Awaitable, Dict, Callable, Union
 
 from yaml import YAMLObject
 
@@ -13,6 +13,9 @@ class Output(YAMLObject):
     def run(self, output_func: Callable[[str], None]):
         output_func('\n' + self.output_text)
 
+    async def run_async(self, output_func: Callable[[str], Awaitable[None]]):
+        await output_func('\n' + self.output_text)
+
     @classmethod
     def from_yaml(cls, loader, node):
         return Output(node.value)
@@ -43,6 +46,14 @@ class Prompt(YAMLObject):
             return self.run(prompt_func)
         return {key: (input_text, response)}
 
+    async def run_async(self, prompt_func: Callable[[str], Awaitable[str]]) -> Dict:
+        key = self.prompt
+        input_text = await prompt_func('\n' + self.prompt + '\n>> ')
+        response = self._find_response(input_text)
+        if isinstance(response, Repeat):
+            return await self.run_async(prompt_func)
+        return {key: (input_text, response)}
+
     def _find_response(self, response):
         if isinstance(self.response, (str, Output, Prompt)):
             return self.response
@@ -85,6 +96,43 @@ class Dialogue(YAMLObject):
         else:
             return value
 
+    async def run_async(
+        self,
+        conversation_name: str,
+        prompt_func: Callable[[str], Awaitable[str]],
+        output_func: Callable[[str], Awaitable[None]]
+    ):
+        """The same as run, but prompt_func and output_func are coroutine functions."""
+        return await self._resolve_conversation_value_async(
+            self.conversations[conversation_name],
+            prompt_func,
+            output_func
+        )
+
+    async def _resolve_conversation_value_async(
+        self,
+        value,
+        prompt_func: Callable[[str], Awaitable[str]],
+        output_func: Callable[[str], Awaitable[None]]
+    ):
+        if isinstance(value, Prompt):
+            result_dict = await value.run_async(prompt_func)
+            dict_to_return = {}
+            for key, input_response_tuple in result_dict.items():
+                input_text, response = input_response_tuple
+                resolved_value = await self._resolve_conversation_value_async(response, prompt_func, output_func)
+                dict_to_return['prompt'] = key
+                dict_to_return['input'] = input_text
+                dict_to_return['resolved'] = resolved_value
+            return dict_to_return
+        elif isinstance(value, Output):
+            await value.run_async(output_func)
+            return {
+                "output": value.output_text
+            }
+        else:
+            return value
+
     @classmethod
     def make_dialogue_readable(cls, dialogue_results: dict):
         results = []
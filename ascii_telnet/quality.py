@@ -0,0 +1,91 @@
+# coding=utf-8
+from typing import Tuple
+
+from ascii_telnet.encoded_movie import EncodedMovie
+
+# A tier is stepped down from when, on average, writing a frame takes this share of the time the frame is shown...
+STEP_DOWN_LOAD = 0.9
+# ...and stepped up from once writing has stayed under this share for STEP_UP_SECONDS.
+STEP_UP_LOAD = 0.3
+STEP_UP_SECONDS = 5
+LOAD_SMOOTHING = 0.2  # Weight of the newest frame in the moving average of the load
+
+
+class QualityTiers(object):
+    NAMES = ('full color', 'reduced color', 'monochrome', 'half frame rate')
+
+    def __init__(self, movie: EncodedMovie):
+        """
+        The movie encoded at every quality tier, best first. They are built once, when the movie is loaded, and
+        shared by every connection.
+
+        Args:
+            movie (encoded_movie.EncodedMovie): The movie at full quality
+        """
+        self.tiers: Tuple[EncodedMovie, ...] = (
+            movie,
+            movie.reduced_color,
+            movie.destyled,
+            movie.half_frame_rate,
+        )
+
+    def __len__(self):
+        return len(self.tiers)
+
+    def __getitem__(self, level: int) -> EncodedMovie:
+        return self.tiers[level]
+
+
+class QualityController(object):
+    def __init__(self, tiers: QualityTiers):
+        """
+        Picks the quality tier for one connection, based on how well the client keeps up.
+
+        The load is the share of each frame's display time that was spent writing the frame to the client. That is the
+        bandwidth the tier needs divided by the bandwidth the client actually achieves. When it gets too close to 1,
+        the next lower tier is picked. When it stays low for a while, the next higher one is.
+
+        Args:
+            tiers (QualityTiers): The tiers to pick from
+        """
+        self.tiers = tiers
+        self.level = 0
+        self.load = 0.0
+        self._headroom_seconds = 0
+
+    @property
+    def movie(self) -> EncodedMovie:
+        return self.tiers[self.level]
+
+    @property
+    def name(self) -> str:
+        return QualityTiers.NAMES[self.level]
+
+    def record_frame(self, write_seconds: float, frame_seconds: float):
+        """
+        Args:
+            write_seconds (float): How long writing the frame took
+            frame_seconds (float): How long the frame is displayed
+        """
+        frame_load = write_seconds / frame_seconds
+        self.load += LOAD_SMOOTHING * (frame_load - self.load)
+        if self.load < STEP_UP_LOAD:
+            self._headroom_seconds += frame_seconds
+        else:
+            self._headroom_seconds = 0
+
+    def record_dropped_frame(self, frame_seconds: float):
+        self.record_frame(frame_seconds, frame_seconds)
+
+    def wanted_level(self) -> int:
+        if self.load > STEP_DOWN_LOAD and self.level < len(self.tiers) - 1:
+            return self.level + 1
+        if self._headroom_seconds >= STEP_UP_SECONDS and self.level > 0:
+            return self.level - 1
+        return self.level
+
+    def switch_to(self, level: int):
+        self.level = level
+        # Start measuring the new tier afresh, without giving it the benefit of the doubt when stepping up.
+        self.load = STEP_UP_LOAD
+        self._headroom_seconds = 0
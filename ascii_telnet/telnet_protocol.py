@@ -0,0 +1,285 @@
+# coding=utf-8
+import zlib
+from typing import Callable, Iterable
+
+# Telnet special command codes
+IAC = 255  # "Interpret As Command"
+DONT = 254
+DO = 253
+WONT = 252
+WILL = 251
+SB = 250  # Subnegotiation Begin
+GA = 249  # Go Ahead
+EL = 248  # Erase Line
+EC = 247  # Erase Character
+AYT = 246  # Are You There
+AO = 245  # Abort output
+IP = 244  # Interrupt process
+BRK = 243  # Break
+DM = 242  # Data Mark
+NOP = 241  # No Operation
+SE = 240  # Subnegotiation End
+
+# Telnet options
+TERMINAL_TYPE = 24
+NAWS = 31  # Negotiate About Window Size
+COMPRESS2 = 86  # MUD Client Compression Protocol version 2 (MCCP2)
+
+# Terminal type subnegotiation commands
+TTYPE_IS = 0
+TTYPE_SEND = 1
+
+DEFAULT_COMPRESSION_LEVEL = 6  # zlib's default, most of the gain for little of the work
+MAX_SUBNEGOTIATION_BYTES = 64  # Longer subnegotiations are cut short, so a misbehaving client can't fill the memory
+
+# Parser states
+_DATA = 0
+_COMMAND = 1  # After IAC
+_OPTION = 2  # After IAC WILL/WONT/DO/DONT
+_SUBNEGOTIATION = 3  # Between IAC SB and IAC SE
+_SUBNEGOTIATION_COMMAND = 4  # After IAC within a subnegotiation
+
+
+class TelnetParser(object):
+    def __init__(self, accepted_options: Iterable[int] = (NAWS, TERMINAL_TYPE), offered_options: Iterable[int] = ()):
+        """
+        Incremental parser for the input of a Telnet connection.
+
+        feed takes the bytes as they come from the socket, in chunks of any size, and returns the data that the
+        visitor typed, with the commands taken out. A command split over several chunks is picked up where the
+        previous chunk left off. Data between commands is sliced off in bulk rather than byte by byte.
+
+        Negotiations are answered through send: the options in accepted_options are agreed to when the client offers
+        them, and the options in offered_options are enabled on our side when the client asks for them. Everything
+        else is refused. The public event methods window_size_changed and terminal_type_received are called when the
+        client reports those, and local_option_changed when one of our options is switched on or off.
+
+        Args:
+            accepted_options (iterable): Options the client may enable on its side
+            offered_options (iterable): Options we may enable on our side
+        """
+        self.accepted_options = frozenset(accepted_options)
+        self.offered_options = frozenset(offered_options)
+        self.enabled_options = set()  # Options enabled on the client side
+        self.refused_options = set()  # Options the client won't enable
+        self.local_options = set()  # Options enabled on our side
+        self._requested_options = set()  # Options we asked the client to enable that it hasn't answered yet
+        self._pending_offers = set()  # Options we offered to enable that the client hasn't answered yet
+        self._state = _DATA
+        self._command = None
+        self._subnegotiation = bytearray()
+
+    def request_option(self, option: int):
+        """
+        Asks the client to enable an option on its side.
+        """
+        if option in self.enabled_options or option in self._requested_options:
+            return
+        self._requested_options.add(option)
+        self.send(bytes([IAC, DO, option]))
+
+    def offer_option(self, option: int):
+        """
+        Offers the client to enable one of the offered_options on our side.
+        """
+        if option in self.local_options or option in self._pending_offers:
+            return
+        self._pending_offers.add(option)
+        self.send(bytes([IAC, WILL, option]))
+
+    def feed(self, data: bytes) -> bytes:
+        """
+        Args:
+            data (bytes): Bytes as received from the client
+
+        Returns:
+            bytes: The part of the bytes that the visitor typed
+        """
+        text = []
+        index = 0
+        length = len(data)
+        while index < length:
+            state = self._state
+            if state == _DATA:
+                command_start = data.find(IAC, index)
+                if command_start == -1:
+                    text.append(data[index:])
+                    break
+                text.append(data[index:command_start])
+                index = command_start + 1
+                self._state = _COMMAND
+                continue
+
+            byte_integer = data[index]
+            index += 1
+            if state == _COMMAND:
+                if byte_integer == IAC:  # An escaped 255
+                    text.append(b'\xff')
+                    self._state = _DATA
+                elif byte_integer in (WILL, WONT, DO, DONT):
+                    self._command = byte_integer
+                    self._state = _OPTION
+                elif byte_integer == SB:
+                    self._subnegotiation.clear()
+                    self._state = _SUBNEGOTIATION
+                else:
+                    self._state = _DATA  # NOP, AYT, GA and the like need no answer
+            elif state == _OPTION:
+                self._negotiate(self._command, byte_integer)
+                self._state = _DATA
+            elif state == _SUBNEGOTIATION:
+                subnegotiation_end = data.find(IAC, index - 1)
+                if subnegotiation_end == -1:
+                    subnegotiation_end = length
+                self._add_to_subnegotiation(data[index - 1:subnegotiation_end])
+                index = subnegotiation_end + 1
+                if subnegotiation_end < length:
+                    self._state = _SUBNEGOTIATION_COMMAND
+            elif state == _SUBNEGOTIATION_COMMAND:
+                if byte_integer == IAC:  # An escaped 255
+                    self._add_to_subnegotiation(b'\xff')
+                    self._state = _SUBNEGOTIATION
+                else:  # SE, or a client that forgot it
+                    self._subnegotiate(bytes(self._subnegotiation))
+                    self._state = _DATA
+                    if byte_integer != SE:
+                        index -= 1
+        return b''.join(text)
+
+    def send(self, data: bytes):
+        """
+        Public event method, which is used to answer the client's negotiations.
+        This must be implemented by the user.
+
+        Args:
+            data (bytes): Bytes to send to the client
+        """
+        raise NotImplementedError("You must specify how to send negotiation replies.")
+
+    def window_size_changed(self, width: int, height: int):
+        """
+        Public event method, called when the client reports the size of its terminal in characters.
+        """
+        pass
+
+    def terminal_type_received(self, terminal_type: str):
+        """
+        Public event method, called when the client reports its terminal type, such as 'XTERM-256COLOR'.
+        """
+        pass
+
+    def local_option_changed(self, option: int, enabled: bool):
+        """
+        Public event method, called after one of our options was switched on or off at the client's request, and
+        the answer was sent.
+        """
+        pass
+
+    def _add_to_subnegotiation(self, data: bytes):
+        room = MAX_SUBNEGOTIATION_BYTES - len(self._subnegotiation)
+        self._subnegotiation += data[:room]
+
+    def _negotiate(self, command: int, option: int):
+        requested = option in self._requested_options
+        self._requested_options.discard(option)
+        if command == WILL:
+            if option not in self.accepted_options:
+                self.send(bytes([IAC, DONT, option]))
+            elif option not in self.enabled_options:
+                self.enabled_options.add(option)
+                if not requested:
+                    self.send(bytes([IAC, DO, option]))
+                if option == TERMINAL_TYPE:
+                    self.send(bytes([IAC, SB, TERMINAL_TYPE, TTYPE_SEND, IAC, SE]))
+        elif command == WONT:
+            self.refused_options.add(option)
+            if option in self.enabled_options:
+                self.enabled_options.discard(option)
+                self.send(bytes([IAC, DONT, option]))
+        elif command == DO:
+            offered = option in self._pending_offers
+            self._pending_offers.discard(option)
+            if option not in self.offered_options:
+                self.send(bytes([IAC, WONT, option]))
+            elif option not in self.local_options:
+                self.local_options.add(option)
+                if not offered:
+                    self.send(bytes([IAC, WILL, option]))
+                self.local_option_changed(option, True)
+        elif command == DONT:
+            self._pending_offers.discard(option)
+            if option in self.local_options:
+                self.local_options.discard(option)
+                self.send(bytes([IAC, WONT, option]))
+                self.local_option_changed(option, False)
+
+    def _subnegotiate(self, subnegotiation: bytes):
+        if not subnegotiation:
+            return
+        option, data = subnegotiation[0], subnegotiation[1:]
+        if option == NAWS and len(data) == 4:
+            width, height = data[0] << 8 | data[1], data[2] << 8 | data[3]
+            if width and height:  # 0 means the client doesn't know
+                self.window_size_changed(width, height)
+        elif option == TERMINAL_TYPE and data[:1] == bytes([TTYPE_IS]):
+            self.terminal_type_received(data[1:].decode('ascii', 'replace'))
+
+
+class CompressibleOutput(object):
+    def __init__(self, write: Callable[[bytes], object], level: int = DEFAULT_COMPRESSION_LEVEL):
+        """
+        The output of a Telnet connection, which can be switched to MCCP2 compression once the client agreed to it.
+
+        Once started, everything written is zlib compressed and flushed right away, so every write, such as a frame of
+        the movie, reaches the client whole and can be shown without waiting for the next one. Frames repeat a lot of
+        what came before them, so the compressor's history makes them very small.
+
+        Args:
+            write (callable): Writes bytes to the connection
+            level (int): zlib compression level, from 1 (fastest) to 9 (smallest)
+        """
+        self._write = write
+        self.level = level
+        self._compressor = None
+
+    @property
+    def compressing(self) -> bool:
+        return self._compressor is not None
+
+    def write(self, data: bytes) -> int:
+        """
+        Returns:
+            int: How many bytes went to the connection
+        """
+        if self._compressor:
+            data = self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        self._write(data)
+        return len(data)
+
+    def start_compressing(self):
+        """
+        Tells the client that the compressed stream starts, and compresses everything written from then on.
+        """
+        if self._compressor:
+            return
+        self._write(bytes([IAC, SB, COMPRESS2, IAC, SE]))
+        self._compressor = zlib.compressobj(self.level)
+
+    def stop_compressing(self):
+        """
+        Ends the compressed stream, after which the client reads the output as is again.
+        """
+        if not self._compressor:
+            return
+        compressor, self._compressor = self._compressor, None
+        self._write(compressor.flush(zlib.Z_FINISH))
+
+
+def strip_telnet_commands(bytes_in: bytes) -> bytes:
+    """
+    Returns:
+        bytes: The bytes with all the Telnet commands taken out, without answering any of them
+    """
+    parser = TelnetParser(accepted_options=())
+    parser.send = lambda data: None
+    return parser.feed(bytes_in)
@@ -0,0 +1,332 @@
+# coding=utf-8
+"""
+Converts raw video frames to ASCII movie frames in Python, without Node or the ascii-video package.
+
+Videos are read as raw frames, which ffmpeg can produce from any video:
+
+    ffmpeg -i video.mp4 -pix_fmt yuv420p video.y4m
+    ffmpeg -i video.mp4 -r 15 frames/%05d.ppm
+
+The frames are scaled down to the size of the movie by averaging the pixels each character covers, and every character
+gets a glyph for its brightness and the nearest color of a terminal palette. All of that is done on whole frames with
+NumPy, which is in requirements.txt but only imported when it's there, since only converting needs it.
+"""
+import os
+import re
+from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # Only needed for converting videos
+    np = None
+
+from ascii_telnet.ascii_movie import Frame
+
+GLYPHS = " .:-=+*#%@"  # From the darkest to the brightest
+CHARACTER_ASPECT = 0.5  # Width of a terminal character relative to its height
+PALETTES = ('256', '16', 'none')
+DEFAULT_FOREGROUND = '\x1b[39m'  # Unlike a reset, this keeps the background the movie puts behind the frame
+
+Y4M_MAGIC = b'YUV4MPEG2'
+PNM_MAGICS = (b'P5', b'P6')  # Binary grayscale and color
+FRAME_FILE_EXTENSIONS = ('.ppm', '.pgm', '.pnm')
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("Converting videos in Python needs NumPy: pip install -r requirements.txt")
+
+
+def is_raw_video(path: str) -> bool:
+    """
+    Returns:
+        bool: Whether the path is something the converter reads: a .y4m file, a PPM/PGM stream or a directory of them
+    """
+    return os.path.isdir(path) or path.endswith('.y4m') or path.endswith(FRAME_FILE_EXTENSIONS)
+
+
+def read_video(path: str) -> Tuple[Optional[float], Iterator['np.ndarray']]:
+    """
+    Reads the frames of a raw video.
+
+    Args:
+        path (str): A .y4m file, a file of concatenated PPM/PGM images (ffmpeg's image2pipe) or a directory of
+            PPM/PGM images, which are read in the order of their names
+
+    Returns:
+        tuple: The frame rate, if the video tells it, and the frames as height x width x 3 RGB arrays
+    """
+    _require_numpy()
+    if os.path.isdir(path):
+        frame_files = sorted(
+            frame_file for frame_file in Path(path).iterdir() if frame_file.suffix.lower() in FRAME_FILE_EXTENSIONS
+        )
+        return None, (image for frame_file in frame_files for image in _read_pnm_file(frame_file))
+    with open(path, 'rb') as f:
+        magic = f.read(len(Y4M_MAGIC))
+    if magic == Y4M_MAGIC:
+        fps = _read_y4m_header(path)[2]
+        return fps, _read_y4m_file(path)
+    return None, _read_pnm_file(Path(path))
+
+
+def _read_pnm_file(path: Path) -> Iterator['np.ndarray']:
+    with open(path, 'rb') as f:
+        yield from read_pnm_stream(f)
+
+
+def read_pnm_stream(stream: BinaryIO) -> Iterator['np.ndarray']:
+    """
+    Reads binary PPM (P6) and PGM (P5) images one after the other until the stream ends.
+    """
+    while True:
+        magic = _read_pnm_token(stream)
+        if not magic:
+            return
+        if magic not in PNM_MAGICS:
+            raise ValueError(f"Not a binary PPM or PGM image: {magic!r}")
+        width, height, max_value = (int(_read_pnm_token(stream)) for _ in range(3))
+        channels = 3 if magic == b'P6' else 1
+        dtype = np.dtype('>u2' if max_value > 255 else 'u1')
+        size = width * height * channels * dtype.itemsize
+        data = stream.read(size)
+        if len(data) < size:
+            raise ValueError("The image ends before all of its pixels")
+        image = np.frombuffer(data, dtype).reshape(height, width, channels)
+        if max_value != 255:
+            image = (image.astype(np.uint32) * 255 // max_value).astype(np.uint8)
+        yield np.repeat(image, 3, axis=2) if channels == 1 else image
+
+
+def _read_pnm_token(stream: BinaryIO) -> bytes:
+    """
+    Reads the next header token, skipping white space and comments, and the single white space character after it.
+    """
+    token = bytearray()
+    while True:
+        character = stream.read(1)
+        if not character:
+            return bytes(token)
+        if character == b'#' and not token:
+            stream.readline()
+        elif character.isspace():
+            if token:
+                return bytes(token)
+        else:
+            token += character
+
+
+def _read_y4m_header(path: str) -> Tuple[int, int, Optional[float], str]:
+    with open(path, 'rb') as f:
+        return _parse_y4m_header(f.readline())
+
+
+def _parse_y4m_header(header: bytes) -> Tuple[int, int, Optional[float], str]:
+    """
+    Returns:
+        tuple: Width, height, frame rate and chroma subsampling of a YUV4MPEG2 stream
+    """
+    width = height = fps = None
+    chroma = '420'
+    for parameter in header.split()[1:]:
+        key, value = chr(parameter[0]), parameter[1:].decode('ascii')
+        if key == 'W':
+            width = int(value)
+        elif key == 'H':
+            height = int(value)
+        elif key == 'F':
+            numerator, denominator = value.split(':')
+            fps = int(numerator) / int(denominator) if int(denominator) else None
+        elif key == 'C':
+            chroma = value
+    if not width or not height:
+        raise ValueError("The YUV4MPEG2 header has no frame size")
+    return width, height, fps, chroma
+
+
+def _read_y4m_file(path: str) -> Iterator['np.ndarray']:
+    with open(path, 'rb') as f:
+        yield from read_y4m_stream(f)
+
+
+def read_y4m_stream(stream: BinaryIO) -> Iterator['np.ndarray']:
+    """
+    Reads the frames of a YUV4MPEG2 stream, as ffmpeg writes it, converted to RGB.
+    """
+    width, height, _, chroma = _parse_y4m_header(stream.readline())
+    if re.search(r'p\d+$', chroma):
+        raise ValueError(f"Only 8 bit video is supported, not {chroma}, convert the video with -pix_fmt yuv420p")
+    if chroma.startswith('mono'):
+        chroma_width = chroma_height = 0
+    elif chroma.startswith('444'):
+        chroma_width, chroma_height = width, height
+    elif chroma.startswith('422'):
+        chroma_width, chroma_height = (width + 1) // 2, height
+    elif chroma.startswith('420'):
+        chroma_width, chroma_height = (width + 1) // 2, (height + 1) // 2
+    else:
+        raise ValueError(f"Unsupported chroma subsampling {chroma}, convert the video with -pix_fmt yuv420p")
+    luma_size, chroma_size = width * height, chroma_width * chroma_height
+    while True:
+        frame_header = stream.readline()
+        if not frame_header:
+            return
+        data = stream.read(luma_size + 2 * chroma_size)
+        if len(data) < luma_size + 2 * chroma_size:
+            return  # Cut off at the end
+        planes = np.frombuffer(data, np.uint8)
+        luma = planes[:luma_size].reshape(height, width)
+        if not chroma_size:
+            yield np.repeat(luma[:, :, np.newaxis], 3, axis=2)
+            continue
+        chroma_planes = []
+        for start in (luma_size, luma_size + chroma_size):
+            plane = planes[start:start + chroma_size].reshape(chroma_height, chroma_width)
+            plane = plane.repeat(height // chroma_height + (height % chroma_height > 0), axis=0)[:height]
+            chroma_planes.append(plane.repeat(width // chroma_width + (width % chroma_width > 0), axis=1)[:, :width])
+        yield yuv_to_rgb(luma, *chroma_planes)
+
+
+def yuv_to_rgb(y: 'np.ndarray', u: 'np.ndarray', v: 'np.ndarray') -> 'np.ndarray':
+    """
+    Converts limited range BT.601 YUV, what video almost always is, to RGB.
+    """
+    y = (y.astype(np.float32) - 16) * (255 / 219)
+    u = (u.astype(np.float32) - 128) * (255 / 224)
+    v = (v.astype(np.float32) - 128) * (255 / 224)
+    rgb = np.stack((y + 1.402 * v, y - 0.344136 * u - 0.714136 * v, y + 1.772 * u), axis=-1)
+    return np.clip(rgb, 0, 255).astype(np.uint8)
+
+
+def _xterm_256_palette() -> Tuple['np.ndarray', List[str]]:
+    levels = [0, 95, 135, 175, 215, 255]
+    colors = [(red, green, blue) for red in levels for green in levels for blue in levels]
+    colors += [(gray, gray, gray) for gray in range(8, 248, 10)]
+    return np.array(colors, np.float32), [f'\x1b[38;5;{code}m' for code in range(16, 256)]
+
+
+def _ansi_16_palette() -> Tuple['np.ndarray', List[str]]:
+    colors = [
+        (0, 0, 0), (170, 0, 0), (0, 170, 0), (170, 85, 0), (0, 0, 170), (170, 0, 170), (0, 170, 170), (170, 170, 170),
+        (85, 85, 85), (255, 85, 85), (85, 255, 85), (255, 255, 85), (85, 85, 255), (255, 85, 255), (85, 255, 255),
+        (255, 255, 255),
+    ]
+    codes = [f'\x1b[{30 + code}m' for code in range(8)] + [f'\x1b[{90 + code}m' for code in range(8)]
+    return np.array(colors, np.float32), codes
+
+
+class VideoToAsciiConverter(object):
+    def __init__(self, width: int, height: int, palette: str = '256', glyphs: str = GLYPHS):
+        """
+        Turns video frames into the lines of ASCII movie frames.
+
+        Frames are scaled to fit in width x height characters, keeping their aspect ratio, and padded with spaces to
+        exactly that size.
+
+        Args:
+            width (int): Characters per line
+            height (int): Lines per frame
+            palette (str): '256' for the xterm 256 color palette, '16' for the basic ANSI colors, 'none' for no color
+            glyphs (str): Characters to draw with, from the darkest to the brightest
+        """
+        _require_numpy()
+        if palette not in PALETTES:
+            raise ValueError(f"Unknown palette {palette}, use one of {', '.join(PALETTES)}")
+        self.width = width
+        self.height = height
+        self.palette = palette
+        self.glyphs = np.array(list(glyphs))
+        self._palette_colors, self._color_codes = {
+            '256': _xterm_256_palette,
+            '16': _ansi_16_palette,
+            'none': lambda: (None, None),
+        }[palette]()
+        if self._palette_colors is not None:
+            self._palette_norms = (self._palette_colors ** 2).sum(axis=-1)
+        self._source_size = None
+        self._bins = None
+
+    def convert(self, image: 'np.ndarray') -> List[str]:
+        """
+        Args:
+            image (np.ndarray): A height x width x 3 RGB frame
+
+        Returns:
+            list: The lines of the frame
+        """
+        cells = self._scale(image)
+        luminance = cells @ np.array([0.299, 0.587, 0.114], np.float32)
+        glyph_indexes = np.minimum((luminance * len(self.glyphs) / 256).astype(np.intp), len(self.glyphs) - 1)
+        glyph_rows = self.glyphs[glyph_indexes]
+        if self._palette_colors is None:
+            lines = [''.join(row) for row in glyph_rows]
+        else:
+            colors = self._nearest_colors(cells)
+            lines = [self._color_line(glyph_row, color_row) for glyph_row, color_row in zip(glyph_rows, colors)]
+        padding = ' ' * (self.width - glyph_rows.shape[1])
+        return [line + padding for line in lines] + [' ' * self.width] * (self.height - len(lines))
+
+    def frames(self, images: Iterable['np.ndarray'], fps: float) -> Iterator[Frame]:
+        """
+        Converts video frames shown fps times a second into movie frames, which are shown Frame.DISPLAY_PER_SECONDS
+        times a second. Video frames that fall between two movie frames are dropped.
+        """
+        shown_until = 0  # In movie frames
+        for number, image in enumerate(images, start=1):
+            ends_at = round(number * Frame.DISPLAY_PER_SECONDS / fps)
+            if ends_at <= shown_until:
+                continue
+            frame = Frame(ends_at - shown_until)
+            frame.data = self.convert(image)
+            shown_until = ends_at
+            yield frame
+
+    def _scale(self, image: 'np.ndarray') -> 'np.ndarray':
+        """
+        Averages the pixels each character covers.
+
+        Returns:
+            np.ndarray: rows x columns x 3 float colors
+        """
+        source_height, source_width = image.shape[:2]
+        if self._source_size != (source_width, source_height):
+            self._source_size = (source_width, source_height)
+            columns = self.width
+            rows = max(1, round(columns * source_height / source_width * CHARACTER_ASPECT))
+            if rows > self.height:
+                rows = self.height
+                columns = max(1, round(rows * source_width / source_height / CHARACTER_ASPECT))
+            rows, columns = min(rows, source_height), min(columns, source_width)
+            self._bins = (
+                np.linspace(0, source_height, rows + 1).astype(np.intp)[:-1],
+                np.linspace(0, source_width, columns + 1).astype(np.intp)[:-1],
+            )
+        row_starts, column_starts = self._bins
+        pixels = image.astype(np.float32)
+        sums = np.add.reduceat(np.add.reduceat(pixels, row_starts, axis=0), column_starts, axis=1)
+        row_heights = np.diff(np.append(row_starts, source_height))
+        column_widths = np.diff(np.append(column_starts, source_width))
+        return sums / (row_heights[:, np.newaxis, np.newaxis] * column_widths[np.newaxis, :, np.newaxis])
+
+    def _nearest_colors(self, cells: 'np.ndarray') -> 'np.ndarray':
+        """
+        Returns:
+            np.ndarray: rows x columns indexes of the nearest palette color of every cell
+        """
+        # The squared distance to a color, less the square of the cell's own color, which is the same for every color.
+        # That leaves a matrix product rather than a difference for every cell and color.
+        distances = self._palette_norms - 2 * (cells @ self._palette_colors.T)
+        return distances.argmin(axis=-1)
+
+    def _color_line(self, glyph_row: 'np.ndarray', color_row: 'np.ndarray') -> str:
+        """
+        Only switches colors where the color changes, which is what most of the size of a colored frame is.
+        """
+        text = ''.join(glyph_row)
+        run_starts = np.flatnonzero(np.diff(color_row)) + 1
+        starts = [0] + run_starts.tolist()
+        ends = run_starts.tolist() + [len(text)]
+        codes = self._color_codes
+        runs = (codes[color_row[start]] + text[start:end] for start, end in zip(starts, ends))
+        return ''.join(runs) + DEFAULT_FOREGROUND
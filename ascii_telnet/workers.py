@@ -0,0 +1,100 @@
+# coding=utf-8
+import os
+import socket
+import time
+import traceback
+from signal import signal, SIGINT, SIGTERM, SIG_DFL
+from typing import Callable, Optional
+
+RESTART_DELAY_SECONDS = 1  # Keeps a worker that crashes on start up from being restarted in a tight loop
+MAX_RESTART_DELAY_SECONDS = 30  # The delay doubles for every time in a row a worker exits while starting, up to this
+STARTUP_SECONDS = 5  # A worker that exits sooner than this after it was started failed to start
+MAX_FAILED_STARTS = 5  # Give up after a worker failed to start this many times in a row
+
+REUSE_PORT_SUPPORTED = hasattr(socket, 'SO_REUSEPORT')
+
+current_worker = 0  # Number of the worker this process is, set in each forked worker
+
+
+def create_listening_socket(interface: str, port: int) -> socket.socket:
+    """
+    Binds a listening socket to be inherited by forked workers, for platforms without SO_REUSEPORT.
+    """
+    listening_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listening_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listening_socket.bind((interface, port))
+    listening_socket.listen(socket.SOMAXCONN)
+    return listening_socket
+
+
+def run_worker_pool(worker_count: int, serve: Callable[[Optional[socket.socket]], None], interface: str, port: int):
+    """
+    Forks worker_count processes that each run serve, and restarts any worker that exits.
+    Whatever was loaded before calling this (such as the movie) is shared with the workers by the fork.
+
+    A worker that exits within STARTUP_SECONDS of being started, such as one that can't bind the port, is restarted
+    after a delay that doubles every time in a row that happens. After MAX_FAILED_STARTS in a row, the other workers
+    are stopped and a RuntimeError is raised, since restarting it evidently doesn't help.
+
+    When the platform supports SO_REUSEPORT, serve is called with None and each worker is expected to bind the port
+    itself with SO_REUSEPORT, so that the kernel balances new connections between them. Otherwise the port is bound
+    here and serve is called with the listening socket, which all the workers accept from.
+
+    Args:
+        worker_count (int): How many worker processes to run
+        serve (callable): Serves forever in a worker
+        interface (str):  The interface the workers serve
+        port (int): The port the workers serve
+    """
+    listening_socket = None if REUSE_PORT_SUPPORTED else create_listening_socket(interface, port)
+    workers = {}  # pid -> worker number
+    started_at = {}  # worker number -> when it was last started
+    failed_starts = {}  # worker number -> times in a row it exited while starting
+
+    def start_worker(worker_number: int):
+        pid = os.fork()
+        if pid == 0:
+            global current_worker
+            current_worker = worker_number
+            # Only the supervisor should react to termination, not every worker.
+            signal(SIGINT, SIG_DFL)
+            signal(SIGTERM, SIG_DFL)
+            exit_code = 0
+            try:
+                serve(listening_socket)
+            except BaseException:
+                traceback.print_exc()
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+        workers[pid] = worker_number
+        started_at[worker_number] = time.monotonic()
+        print(f"Started worker {worker_number} (pid {pid})")
+
+    for worker_number in range(worker_count):
+        start_worker(worker_number)
+
+    try:
+        while True:
+            pid, status = os.wait()
+            worker_number = workers.pop(pid, None)
+            if worker_number is None:
+                continue
+            if time.monotonic() - started_at[worker_number] < STARTUP_SECONDS:
+                failed_starts[worker_number] = failed_starts.get(worker_number, 0) + 1
+            else:
+                failed_starts[worker_number] = 0
+            if failed_starts[worker_number] >= MAX_FAILED_STARTS:
+                raise RuntimeError(
+                    f"Worker {worker_number} exited while starting {MAX_FAILED_STARTS} times in a row. Giving up."
+                )
+            delay = min(RESTART_DELAY_SECONDS * 2 ** failed_starts[worker_number], MAX_RESTART_DELAY_SECONDS)
+            print(f"Worker {worker_number} (pid {pid}) exited with status {status}. Restarting it in {delay}s...")
+            time.sleep(delay)
+            start_worker(worker_number)
+    finally:
+        for pid in workers:
+            try:
+                os.kill(pid, SIGTERM)
+            except ProcessLookupError:
+                pass
@@ -26,24 +26,41 @@
 #  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 #  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+import asyncio
 import os
 import sys
 from pathlib import Path
-from signal import signal, SIGINT, SIGTERM
+from signal import signal, SIGINT, SIGTERM, SIGUSR2
 from time import sleep
 from urllib.request import urlopen
 
 import click
 import yaml
 
-from ascii_telnet.ascii_movie import get_loaded_movie
-from ascii_telnet.ascii_player import VT100Player
-from ascii_telnet.ascii_server import TelnetRequestHandler, ThreadedTCPServer
-from ascii_telnet.connection_notifier import send_notification
-from ascii_telnet.movie_maker import make_movie
+from ascii_telnet import workers as worker_pool
+from ascii_telnet.admission import AdmissionControl, AsyncAdmissionControl
+from ascii_telnet.ascii_movie import (
+    FRAME_BLOCK_CACHE,
+    FRAME_CACHE_BLOCKS,
+    CompressedMovie,
+    MappedMovie,
+    Movie,
+    get_loaded_movie,
+    save_movie
+)
+from ascii_telnet.ascii_player import MAX_BACKLOG_SECONDS, VT100Player
+from ascii_telnet.ascii_server import TelnetRequestHandler
+from ascii_telnet.async_server import AsyncTelnetSession
+from ascii_telnet.connection_notifier import JSONLinesBackend, NotificationDispatcher, send_notification
+from ascii_telnet.metrics import collect_frame_store, serve_metrics
+from ascii_telnet.movie_maker import DEFAULT_HEIGHT, DEFAULT_WIDTH, make_movie
+from ascii_telnet.profiling import SessionProfiler
 from ascii_telnet.prompt_resolver import Dialogue
+from ascii_telnet.telnet_protocol import DEFAULT_COMPRESSION_LEVEL
+from ascii_telnet.video_converter import PALETTES
 
 DNS_UPDATE_URL = os.getenv('DNS_UPDATE_URL')
+METRICS_INTERFACE = '127.0.0.1'  # Metrics are only for the local Prometheus, not for visitors
 
 current_directory = Path(__file__).parent
 default_movie = current_directory / 'movies' / 'movie.pkl'
@@ -57,7 +74,29 @@ def termination_handler(*args):
     exit(0)
 
 
-def runTcpServer(interface, port, filename, dialogue: Dialogue):
+def runTcpServer(
+    interface,
+    port,
+    filename,
+    dialogue: Dialogue,
+    delta: bool = False,
+    engine: str = 'threaded',
+    broadcast: bool = False,
+    workers: int = 1,
+    adaptive: bool = False,
+    max_latency: float = MAX_BACKLOG_SECONDS,
+    max_connections: int = None,
+    max_sessions: int = None,
+    max_playbacks: int = None,
+    notifications_file: str = None,
+    metrics_port: int = None,
+    profile_directory: str = None,
+    profile_rate: float = 1.0,
+    trace_allocations: bool = False,
+    compress_frames: bool = False,
+    frame_cache_blocks: int = FRAME_CACHE_BLOCKS,
+    compression_level: int = None
+):
     """
     Start a TCP server that a client can connect to that streams the output of
      Ascii Player
@@ -65,8 +104,26 @@ def runTcpServer(interface, port, filename, dialogue: Dialogue):
     Args:
         interface (str):  bind to this interface
         port (int): bind to this port
-        filename (str): file name of the ASCII movie. Can be a txt file, yaml file, or pickled movie file.
+        filename (str): file name of the ASCII movie. Can be a txt file, yaml file, pickled movie file or .atm file.
         dialogue (Dialogue): The Dialogue object to run
+        delta (bool): Send only the changed parts of each frame
+        engine (str): 'threaded' for a thread per visitor, or 'asyncio' to serve every visitor on one event loop
+        broadcast (bool): Play the movie on one shared live channel instead of from the start for every visitor
+        workers (int): Number of worker processes to serve visitors with
+        adaptive (bool): Adapt the quality of the movie to how well each visitor keeps up
+        max_latency (float): Skip frames while more than this many seconds of the movie wait to reach a visitor
+        max_connections (int): Turn visitors away beyond this many connected ones, per worker
+        max_sessions (int): Visitors going through the prompts at a time per worker, the others wait in line
+        max_playbacks (int): Visitors watching the movie at a time per worker, the others wait in line
+        notifications_file (str): Append notifications to this JSON lines file instead of emailing them
+        metrics_port (int): Serve Prometheus metrics on this port of localhost. With several workers, each worker
+            serves its own metrics on the port after the previous worker's.
+        profile_directory (str): Profile sessions, writing the dumps to this directory
+        profile_rate (float): Fraction of the sessions to profile
+        trace_allocations (bool): Also trace memory allocations of the profiled sessions
+        compress_frames (bool): Keep the frames of the movie compressed in memory
+        frame_cache_blocks (int): Blocks of decompressed frames to keep with compress_frames
+        compression_level (int): Offer clients MCCP2 compression of the output at this zlib level
     """
     signal(SIGINT, termination_handler)
     signal(SIGTERM, termination_handler)
@@ -76,30 +133,70 @@ def runTcpServer(interface, port, filename, dialogue: Dialogue):
         print(f"DNS update response: {response.read().decode('utf-8')}")
     print("Loading movie...")
     movie = get_loaded_movie(filename)
-    TelnetRequestHandler.set_up_handler_global_state(movie, dialogue)
+    if compress_frames and not isinstance(movie, MappedMovie):  # A MappedMovie isn't in memory to begin with
+        FRAME_BLOCK_CACHE.size = frame_cache_blocks
+        movie = CompressedMovie(movie)
+        print(f"Compressed frames: {movie.frames.report()}")
+        collect_frame_store(movie.frames, FRAME_BLOCK_CACHE)
     print("Launching server!")
-    server = ThreadedTCPServer((interface, port), TelnetRequestHandler)
-    server.serve_forever()
-
-
-def runStdOut(filepath, dialogue: Dialogue = None):
+    reuse_port = workers > 1
+    notifier = NotificationDispatcher(JSONLinesBackend(notifications_file) if notifications_file else None)
+    profiler = None
+    if profile_directory:
+        profiler = SessionProfiler(profile_directory, profile_rate, trace_allocations)
+        # Inherited by the workers, so `kill -USR2` on a worker switches profiling for that worker
+        signal(SIGUSR2, lambda *args: profiler.toggle())
+        print(f"Profiling {profile_rate:.0%} of the sessions into {profile_directory}, SIGUSR2 switches it on and off")
+    if engine == 'asyncio':
+        admission = AsyncAdmissionControl(max_connections, max_sessions, max_playbacks)
+        AsyncTelnetSession.set_up_handler_global_state(
+            movie, dialogue, delta, broadcast, adaptive, max_latency, admission, notifier, profiler, compression_level
+        )
+
+        def serve_visitors(listening_socket=None):
+            asyncio.run(AsyncTelnetSession.serve(interface, port, reuse_port, listening_socket))
+    else:
+        admission = AdmissionControl(max_connections, max_sessions, max_playbacks)
+        TelnetRequestHandler.set_up_handler_global_state(
+            movie, dialogue, delta, broadcast, adaptive, max_latency, admission, notifier, profiler, compression_level
+        )
+
+        def serve_visitors(listening_socket=None):
+            TelnetRequestHandler.serve(interface, port, reuse_port, listening_socket)
+
+    def serve(listening_socket=None):
+        if metrics_port:
+            # Bound in the worker, since each worker only knows its own visitors
+            metrics_server_port = metrics_port + worker_pool.current_worker
+            serve_metrics(METRICS_INTERFACE, metrics_server_port)
+            print(f"Serving metrics on http://{METRICS_INTERFACE}:{metrics_server_port}/metrics")
+        serve_visitors(listening_socket)
+
+    if workers > 1:
+        worker_pool.run_worker_pool(workers, serve, interface, port)
+    else:
+        serve()
+
+
+def runStdOut(filepath, dialogue: Dialogue = None, delta: bool = False):
     """
     Stream the output of the Ascii Player to STDOUT
     Args:
         filepath (str): file path of the ASCII movie
         dialogue_file (str): The file name for special dialogue options based upon visitor name
+        delta (bool): Send only the changed parts of each frame
     """
     def prompt_func(prompt_text: str):
         return input(f'{prompt_text} ')
 
     def draw_frame_to_stdout(screen_buffer):
-        sys.stdout.write(screen_buffer.read().decode('iso-8859-15'))
+        sys.stdout.write(screen_buffer.decode('iso-8859-15'))
 
     if dialogue:
         dialogue.run(prompt_func, print)
 
     movie = get_loaded_movie(filepath)
-    player = VT100Player(movie)
+    player = VT100Player(movie, delta)
     player.draw_frame = draw_frame_to_stdout
     print(movie.create_viewing_area_box())
     sleep(5)
@@ -127,7 +224,7 @@ def cli():
     '-f',
     '--file',
     type=click.Path(exists=True),
-    help="File containing the ASCII movie. It can be a .txt, .yaml, or .pkl file",
+    help="File containing the ASCII movie. It can be a .txt, .yaml, .pkl or .atm file",
     default=str(default_movie)
 )
 @click.option(
@@ -151,12 +248,175 @@ def cli():
         "to that specific visitor."
     )
 )
+@click.option(
+    '--delta',
+    is_flag=True,
+    help=(
+        "Only send the characters that changed since the previous frame, with a full frame every so often. This "
+        "greatly reduces bandwidth for mostly static movies."
+    )
+)
+@click.option(
+    '--engine',
+    type=click.Choice(['threaded', 'asyncio']),
+    default='threaded',
+    help=(
+        "How the TCP server handles visitors: 'threaded' runs a thread per visitor, 'asyncio' runs every visitor on a "
+        "single event loop, which holds far more concurrent visitors."
+    )
+)
+@click.option(
+    '--broadcast',
+    is_flag=True,
+    help=(
+        "Run the movie as a live channel on a loop. Visitors join the channel at its next keyframe and all watch the "
+        "same frames, instead of each starting the movie from the beginning. Each visitor watches one whole loop "
+        "from where they joined."
+    )
+)
+@click.option(
+    '-w',
+    '--workers',
+    type=click.IntRange(min=1),
+    default=1,
+    help=(
+        "Number of worker processes serving visitors, to make use of more than one CPU core. Crashed workers are "
+        "restarted. With --broadcast, each worker runs its own channel."
+    )
+)
+@click.option(
+    '--adaptive',
+    is_flag=True,
+    help=(
+        "Adapt the quality of the movie to how well each visitor keeps up, stepping between full color, reduced color, "
+        "monochrome and half frame rate. Does not apply to --broadcast."
+    )
+)
+@click.option(
+    '--max-latency',
+    type=click.FloatRange(min=0),
+    default=MAX_BACKLOG_SECONDS,
+    show_default=True,
+    help=(
+        "Skip frames while more than this many seconds of the movie are still queued in a visitor's connection, so "
+        "slow visitors stay in sync instead of falling further and further behind. Needs Linux."
+    )
+)
+@click.option(
+    '--max-connections',
+    type=click.IntRange(min=1),
+    help=(
+        "Turn visitors away right after they connect once this many are connected, waiting ones included. "
+        "Unlimited by default. With --workers, this is per worker."
+    )
+)
+@click.option(
+    '--max-sessions',
+    type=click.IntRange(min=1),
+    help=(
+        "How many visitors may go through the prompts before the movie at a time. The others wait in line and are "
+        "told their place. Unlimited by default. With --workers, this is per worker."
+    )
+)
+@click.option(
+    '--max-playbacks',
+    type=click.IntRange(min=1),
+    help=(
+        "How many visitors may watch the movie at a time. The others wait in line and are told their place. "
+        "Unlimited by default. With --workers, this is per worker."
+    )
+)
+@click.option(
+    '--notifications-file',
+    type=click.Path(dir_okay=False),
+    help=(
+        "Append notifications to this file as JSON lines instead of emailing them. Notifications are sent in the "
+        "background either way, and ones that come in close together are sent together."
+    )
+)
+@click.option(
+    '--metrics-port',
+    type=click.IntRange(min=1, max=65535),
+    help=(
+        "Serve Prometheus metrics (sessions, frames sent and dropped, bytes written, write latency, drift and more) "
+        "at http://127.0.0.1:<port>/metrics. With --workers, worker N serves its metrics on <port> + N."
+    )
+)
+@click.option(
+    '--profile',
+    'profile_directory',
+    type=click.Path(file_okay=False),
+    help=(
+        "Profile sessions with cProfile and write a dump per session phase (negotiating, prompting, playing, parting) "
+        "to this directory, named after the client address. Send the server SIGUSR2 to switch profiling off and on."
+    )
+)
+@click.option(
+    '--profile-rate',
+    type=click.FloatRange(min=0, max=1),
+    default=1.0,
+    show_default=True,
+    help="Fraction of the sessions to profile with --profile."
+)
+@click.option(
+    '--trace-allocations',
+    is_flag=True,
+    help="With --profile, also write the lines that allocated the most memory during each phase. Slows everything down."
+)
+@click.option(
+    '--compress-frames',
+    is_flag=True,
+    help=(
+        "Keep the frames of the movie zlib compressed in memory, and decompress them as they are played. Saves a lot "
+        "of memory on long, colored movies. .atm movies are read from disk as they are played instead."
+    )
+)
+@click.option(
+    '--frame-cache-blocks',
+    type=click.IntRange(min=1),
+    default=FRAME_CACHE_BLOCKS,
+    show_default=True,
+    help="With --compress-frames, how many blocks of decompressed frames to keep, shared by every visitor."
+)
+@click.option(
+    '--mccp',
+    is_flag=True,
+    help=(
+        "Offer clients MCCP2 (Telnet option 86) compression of everything sent to them. Most MUD clients support it, "
+        "and it makes the movie several times smaller on the wire. Clients that don't support it aren't affected."
+    )
+)
+@click.option(
+    '--mccp-level',
+    type=click.IntRange(min=1, max=9),
+    default=DEFAULT_COMPRESSION_LEVEL,
+    show_default=True,
+    help="zlib compression level for --mccp, from 1 (least CPU) to 9 (smallest)."
+)
 def run(
     stdout,
     file,
     interface,
     port,
-    dialogue_file
+    dialogue_file,
+    delta,
+    engine,
+    broadcast,
+    workers,
+    adaptive,
+    max_latency,
+    max_connections,
+    max_sessions,
+    max_playbacks,
+    notifications_file,
+    metrics_port,
+    profile_directory,
+    profile_rate,
+    trace_allocations,
+    compress_frames,
+    frame_cache_blocks,
+    mccp,
+    mccp_level
 ):
     """Plays the specified movie file, either via stdout (if the --stdout) flag is used, or as a Telnet server
     (the default)
@@ -178,17 +438,31 @@ def run(
 
         If this is not set, DNS records will not be updated
     """
+    dialogue = None
     if dialogue_file:
         with open(dialogue_file) as f:
             result = yaml.unsafe_load(f)
             dialogue = result['dialogue']
     try:
         if stdout:
-            runStdOut(file, dialogue)
+            runStdOut(file, dialogue, delta)
         else:
             print("Running TCP server on {0}:{1}".format(interface, port))
             print("Playing movie {0}".format(file))
-            runTcpServer(interface, port, file, dialogue)
+            runTcpServer(
+                interface, port, file, dialogue, delta, engine, broadcast, workers, adaptive, max_latency,
+                max_connections=max_connections,
+                max_sessions=max_sessions,
+                max_playbacks=max_playbacks,
+                notifications_file=notifications_file,
+                metrics_port=metrics_port,
+                profile_directory=profile_directory,
+                profile_rate=profile_rate,
+                trace_allocations=trace_allocations,
+                compress_frames=compress_frames,
+                frame_cache_blocks=frame_cache_blocks,
+                compression_level=mccp_level if mccp else None
+            )
 
     except KeyboardInterrupt:
         print("Ascii Player Quit.")
@@ -200,13 +474,19 @@ def run(
     '--video-file-in',
     required=True,
     type=click.Path(exists=True),
-    help="A valid video file, such as mp4, that can be rendered using ffmpeg to produce movie."
+    help=(
+        "A valid video file, such as mp4, that can be rendered using ffmpeg to produce movie. Raw videos (.y4m, PPM or "
+        "PGM images, or a directory of them) are converted in Python instead, without NodeJS."
+    )
 )
 @click.option(
     '-o',
     '--pickle-file-out',
     required=True,
-    help="The output filename to save the pickled movie to. Should end with .pkl"
+    help=(
+        "The output filename to save the pickled movie to. Should end with .pkl, or with .atm to save it in the "
+        "indexed binary movie format instead"
+    )
 )
 @click.option(
     '--node-path',
@@ -228,21 +508,81 @@ def run(
         "number is the number of seconds it should display for."
     )
 )
+@click.option(
+    '--segment-seconds',
+    type=click.IntRange(min=1),
+    help=(
+        "Cut the video into segments this many seconds long and transcode them in parallel, which needs ffmpeg. "
+        "Segments that were already transcoded are reused, so an interrupted run picks up where it left off."
+    )
+)
+@click.option(
+    '-j',
+    '--jobs',
+    type=click.IntRange(min=1),
+    help="With --segment-seconds, how many segments to transcode at the same time. Defaults to the number of CPUs."
+)
+@click.option(
+    '--width',
+    type=click.IntRange(min=1),
+    default=DEFAULT_WIDTH,
+    show_default=True,
+    help="Width in characters of a movie converted from a raw video."
+)
+@click.option(
+    '--height',
+    type=click.IntRange(min=1),
+    default=DEFAULT_HEIGHT,
+    show_default=True,
+    help="Height in lines of a movie converted from a raw video, not counting the time bar."
+)
+@click.option(
+    '--palette',
+    type=click.Choice(PALETTES),
+    default='256',
+    show_default=True,
+    help="Colors of a movie converted from a raw video: the 256 xterm colors, the 16 basic ones or none."
+)
+@click.option(
+    '--fps',
+    type=click.FloatRange(min=1),
+    help="Frame rate of a raw video that doesn't tell its own, such as a directory of images. Defaults to 15."
+)
 def make(
     video_file_in,
     pickle_file_out,
     node_path,
     subtitles,
-    subtitle_seconds
+    subtitle_seconds,
+    segment_seconds,
+    jobs,
+    width,
+    height,
+    palette,
+    fps
 ):
     """Creates an ascii-movie from a video file and then saves it as a pickle for fast loading later.
 
     Note: This method requires the ascii-video nodejs package installed using the attached package.json with at least
     node version 10. Why? Because this is simply the best video-to-ascii conversion tool I could find that produced
-    colorful, text-based output into a single file. This functionality COULD be produced in native Python, but nothing
-    similar seems to exist at this point.
+    colorful, text-based output into a single file.
+
+    Raw videos are converted in Python with NumPy instead, which needs neither. ffmpeg makes them from any video, for
+    example with `ffmpeg -i video.mp4 -pix_fmt yuv420p video.y4m`.
     """
-    make_movie(video_file_in, pickle_file_out, node_path, subtitles, subtitle_seconds)
+    make_movie(
+        video_file_in,
+        pickle_file_out,
+        node_path,
+        subtitles,
+        subtitle_seconds,
+        segment_seconds,
+        jobs,
+        width,
+        height,
+        palette,
+        fps
+    )
 
 
 @cli.command(short_help="Combines multiple movies together into a single move, output to a pickle file.")
@@ -252,14 +592,17 @@ def make(
     multiple=True,
     type=click.Path(exists=True),
     required=True,
-    help="Movie files to combine. Can be .txt, .yaml, or .pkl. This option can be used multiple times."
+    help="Movie files to combine. Can be .txt, .yaml, .pkl or .atm. This option can be used multiple times."
 )
 @click.option(
     '-o',
     '--pickle_file_out',
     type=click.Path(),
     required=True,
-    help="Output filepath for the combined and pickled movie file."
+    help=(
+        "Output filepath for the combined and pickled movie file. If it ends with .atm, it is saved in the indexed "
+        "binary movie format instead."
+    )
 )
 def combine(movie, pickle_file_out):
     movie_iterator = (
@@ -267,11 +610,43 @@ def combine(movie, pickle_file_out):
         for movie_path in movie
     )
     first_movie = next(movie_iterator)
+    if isinstance(first_movie, MappedMovie):
+        first_movie = first_movie.clone()
     for subsequent_movie in movie_iterator:
         first_movie += subsequent_movie
 
     first_movie.compress()
-    first_movie.to_pickle(pickle_file_out)
+    print(first_movie.deduplication_report())
+    save_movie(first_movie, pickle_file_out)
+
+
+@cli.command(short_help="Converts a movie to the indexed binary movie format.")
+@click.option(
+    '-m',
+    '--movie',
+    type=click.Path(exists=True),
+    required=True,
+    help="Movie file to convert. Can be .txt, .yaml, or .pkl."
+)
+@click.option(
+    '-o',
+    '--movie-file-out',
+    type=click.Path(),
+    required=True,
+    help="Output filepath for the movie file. Should end with .atm"
+)
+def convert(movie, movie_file_out):
+    """Converts a movie to the indexed binary movie format (.atm).
+
+    The server plays .atm files straight from disk with mmap, so they start up instantly, only keep the frames being
+    played in memory and, unlike pickles, can't run code when they are loaded.
+    """
+    if movie.endswith(('.txt', '.yaml')):
+        output_path = Movie().stream_to_movie_file(movie, movie_file_out)
+    else:
+        output_path = get_loaded_movie(movie).to_movie_file(movie_file_out)
+    print(get_loaded_movie(output_path).deduplication_report())
+    print(f"Saved {output_path}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,362 @@
+# coding=utf-8
+"""
+Load test for the Telnet server.
+
+Starts the server the way `ascii_telnet_server.py run` does, in its own process, connects simulated visitors to it and
+reports how it held up as JSON:
+
+    python benchmarks/load_test.py --clients 200 --bandwidth 20000 -o results.json -- --engine asyncio --delta
+
+The visitors answer the human check and any dialogue prompts, report a window size so the movie starts right away, and
+read the movie at the given bandwidth. Server CPU time and memory (of all its workers together) are read from /proc, so
+they are only reported on Linux. Frame counts come from the server's metrics endpoints.
+"""
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.request import urlopen
+
+import click
+
+REPO_DIRECTORY = Path(__file__).resolve().parent.parent
+SERVER_SCRIPT = REPO_DIRECTORY / 'ascii_telnet_server.py'
+DEFAULT_MOVIE = REPO_DIRECTORY / 'movies' / 'short_intro.txt'
+
+IAC, SB, SE, WILL, WONT = 255, 250, 240, 251, 252
+NAWS, TERMINAL_TYPE = 31, 24
+CLEAR_SCREEN = b'\x1b[2J'  # The movie starts by clearing the screen
+HUMAN_PROMPT = b'human?'
+
+SERVER_START_TIMEOUT_SECONDS = 60
+QUIET_SECONDS = 0.3  # A server that has been quiet this long is waiting for the visitor to type something
+
+
+class ClientResult(object):
+    def __init__(self):
+        self.connected = False
+        self.completed = False
+        self.error = None
+        self.time_to_first_frame = None
+        self.bytes_received = 0
+        self.duration = None
+
+
+def window_size_report(width: int, height: int) -> bytes:
+    """
+    What a client sends to offer its window size right after connecting, and to refuse to tell its terminal type.
+    """
+    size = bytes([width >> 8, width & 0xff, height >> 8, height & 0xff]).replace(b'\xff', b'\xff\xff')
+    return bytes([IAC, WILL, NAWS, IAC, SB, NAWS]) + size + bytes([IAC, SE, IAC, WONT, TERMINAL_TYPE])
+
+
+async def run_client(
+    port: int,
+    window_size: tuple,
+    bandwidth: Optional[int],
+    answer: str,
+    timeout: float
+) -> ClientResult:
+    """
+    One simulated visitor, from connecting until the server hangs up or timeout seconds have passed.
+    """
+    result = ClientResult()
+    start = time.perf_counter()
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    except OSError as e:
+        result.error = repr(e)
+        return result
+    result.connected = True
+    writer.write(window_size_report(*window_size))
+    deadline = start + timeout
+    pending = b''  # Received since the visitor last typed something, to look for prompts in
+    try:
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                result.error = 'timeout'
+                break
+            try:
+                data = await asyncio.wait_for(reader.read(65536), min(QUIET_SECONDS, remaining))
+            except asyncio.TimeoutError:
+                # The server is waiting for input: a prompt, or the parting message after the movie.
+                writer.write(b'yes\r\n' if HUMAN_PROMPT in pending else answer.encode() + b'\r\n')
+                pending = b''
+                continue
+            if not data:
+                result.completed = True
+                break
+            result.bytes_received += len(data)
+            if result.time_to_first_frame is None:
+                pending += data
+                if CLEAR_SCREEN in pending:
+                    result.time_to_first_frame = time.perf_counter() - start
+            if bandwidth:
+                await asyncio.sleep(len(data) / bandwidth)
+    except OSError as e:
+        result.error = repr(e)
+    finally:
+        writer.close()
+    result.duration = time.perf_counter() - start
+    return result
+
+
+async def run_clients(
+    client_count: int,
+    ramp_seconds: float,
+    port: int,
+    window_size: tuple,
+    bandwidth: Optional[int],
+    answer: str,
+    timeout: float
+) -> List[ClientResult]:
+    async def start_client(number):
+        await asyncio.sleep(ramp_seconds * number / client_count)
+        return await run_client(port, window_size, bandwidth, answer, timeout)
+
+    return await asyncio.gather(*(start_client(number) for number in range(client_count)))
+
+
+def process_tree(pid: int) -> List[int]:
+    """
+    Returns:
+        list: The process and all its descendants, such as the server's workers
+    """
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                parent = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(parent, []).append(int(entry))
+    tree = [pid]
+    for process in tree:
+        tree.extend(children.get(process, ()))
+    return tree
+
+
+def cpu_seconds(pids: List[int]) -> float:
+    total_ticks = 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        total_ticks += int(fields[11]) + int(fields[12])  # utime + stime
+    return total_ticks / os.sysconf('SC_CLK_TCK')
+
+
+def peak_rss_bytes(pids: List[int]) -> int:
+    total = 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        total += int(line.split()[1]) * 1024
+        except OSError:
+            continue
+    return total
+
+
+def scrape_metrics(metrics_port: int) -> Dict[str, float]:
+    """
+    Returns:
+        dict: The server's samples by their name and labels, such as 'ascii_telnet_frames_dropped_total{reason="late"}'
+    """
+    samples = {}
+    with urlopen(f'http://127.0.0.1:{metrics_port}/metrics', timeout=5) as response:
+        for line in response.read().decode('utf-8').splitlines():
+            if line and not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                samples[name] = float(value)
+    return samples
+
+
+def scrape_all_metrics(metrics_port: int, worker_count: int) -> Dict[str, float]:
+    """
+    Adds up the samples of every worker, which each serve their own metrics on the port after the previous one's.
+    """
+    samples = {}
+    for worker in range(worker_count):
+        for name, value in scrape_metrics(metrics_port + worker).items():
+            samples[name] = samples.get(name, 0) + value
+    return samples
+
+
+def worker_count(server_options: List[str]) -> int:
+    for index, option in enumerate(server_options):
+        if option in ('-w', '--workers') and index + 1 < len(server_options):
+            return int(server_options[index + 1])
+        if option.startswith('--workers='):
+            return int(option.split('=', 1)[1])
+    return 1
+
+
+def wait_for_server(server: subprocess.Popen, port: int, metrics_port: int):
+    deadline = time.monotonic() + SERVER_START_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise click.ClickException(f"The server exited with status {server.returncode}")
+        try:
+            scrape_metrics(metrics_port)
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise click.ClickException("The server didn't start in time")
+
+
+def distribution(values: List[float]) -> Optional[Dict[str, float]]:
+    if not values:
+        return None
+    values = sorted(values)
+    return {
+        'min': values[0],
+        'median': statistics.median(values),
+        'p95': values[min(len(values) - 1, int(len(values) * 0.95))],
+        'max': values[-1],
+    }
+
+
+def summarize(
+    results: List[ClientResult],
+    wall_seconds: float,
+    server_cpu_seconds: Optional[float],
+    server_peak_rss: Optional[int],
+    metrics: Dict[str, float]
+) -> dict:
+    bytes_received = sum(result.bytes_received for result in results)
+    errors = {}
+    for result in results:
+        if result.error:
+            errors[result.error] = errors.get(result.error, 0) + 1
+    return {
+        'clients': len(results),
+        'connected': sum(result.connected for result in results),
+        'completed': sum(result.completed for result in results),
+        'errors': errors,
+        'wall_seconds': wall_seconds,
+        'bytes_received': bytes_received,
+        'throughput_bytes_per_second': bytes_received / wall_seconds if wall_seconds else 0,
+        'time_to_first_frame_seconds': distribution(
+            [result.time_to_first_frame for result in results if result.time_to_first_frame is not None]
+        ),
+        'session_seconds': distribution([result.duration for result in results if result.completed]),
+        'server': {
+            'cpu_seconds': server_cpu_seconds,
+            'cpu_percent': 100 * server_cpu_seconds / wall_seconds if server_cpu_seconds is not None else None,
+            'peak_rss_bytes': server_peak_rss,
+        },
+        'frames_sent': metrics.get('ascii_telnet_frames_sent_total', 0),
+        'frames_dropped': {
+            'late': metrics.get('ascii_telnet_frames_dropped_total{reason="late"}', 0),
+            'backlog': metrics.get('ascii_telnet_frames_dropped_total{reason="backlog"}', 0),
+        },
+        'connections_rejected': metrics.get('ascii_telnet_connections_rejected_total', 0),
+    }
+
+
+@click.command()
+@click.option('-n', '--clients', type=click.IntRange(min=1), default=50, show_default=True, help="Visitors to simulate.")
+@click.option(
+    '--ramp-seconds',
+    type=click.FloatRange(min=0),
+    default=5,
+    show_default=True,
+    help="Spread the visitors' connections over this many seconds."
+)
+@click.option(
+    '--bandwidth',
+    type=click.IntRange(min=1),
+    help="Bytes per second each visitor reads at. Unlimited by default."
+)
+@click.option('--window', default='80x24', show_default=True, help="Window size the visitors report, WIDTHxHEIGHT.")
+@click.option('--answer', default='benchmark', show_default=True, help="What visitors type at dialogue prompts.")
+@click.option(
+    '--timeout',
+    type=click.FloatRange(min=1),
+    default=300,
+    show_default=True,
+    help="Give up on a visitor after this many seconds."
+)
+@click.option('-f', '--file', 'movie_file', type=click.Path(exists=True), default=str(DEFAULT_MOVIE), show_default=True)
+@click.option('-p', '--port', type=int, default=9023, show_default=True)
+@click.option('--metrics-port', type=int, default=9024, show_default=True)
+@click.option(
+    '-o',
+    '--output',
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write the results to this file instead of stdout."
+)
+@click.argument('server_options', nargs=-1, type=click.UNPROCESSED)
+def load_test(
+    clients,
+    ramp_seconds,
+    bandwidth,
+    window,
+    answer,
+    timeout,
+    movie_file,
+    port,
+    metrics_port,
+    output,
+    server_options
+):
+    """Runs the server with SERVER_OPTIONS (any options of `ascii_telnet_server.py run`, after a --) and measures
+    how it handles CLIENTS simulated visitors."""
+    width, height = (int(size) for size in window.lower().split('x'))
+    command = [
+        sys.executable, str(SERVER_SCRIPT), 'run',
+        '-f', movie_file,
+        '-i', '127.0.0.1',
+        '-p', str(port),
+        '--metrics-port', str(metrics_port),
+        *server_options
+    ]
+    server = subprocess.Popen(command, cwd=str(REPO_DIRECTORY), stdout=subprocess.DEVNULL)
+    try:
+        wait_for_server(server, port, metrics_port)
+        on_linux = os.path.isdir('/proc/self')
+        cpu_before = cpu_seconds(process_tree(server.pid)) if on_linux else None
+        start = time.perf_counter()
+        results = asyncio.run(run_clients(clients, ramp_seconds, port, (width, height), bandwidth, answer, timeout))
+        wall_seconds = time.perf_counter() - start
+        server_processes = process_tree(server.pid) if on_linux else []
+        server_cpu = cpu_seconds(server_processes) - cpu_before if on_linux else None
+        server_peak_rss = peak_rss_bytes(server_processes) if on_linux else None
+        metrics = scrape_all_metrics(metrics_port, worker_count(server_options))
+    finally:
+        server.terminate()
+        server.wait()
+
+    summary = summarize(results, wall_seconds, server_cpu, server_peak_rss, metrics)
+    summary['config'] = {
+        'clients': clients,
+        'ramp_seconds': ramp_seconds,
+        'bandwidth': bandwidth,
+        'window': window,
+        'movie': movie_file,
+        'server_options': list(server_options),
+    }
+    report = json.dumps(summary, indent=2)
+    if output:
+        with open(output, 'w') as f:
+            f.write(report + '\n')
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    load_test()
@@ -0,0 +1,228 @@
+# coding=utf-8
+"""
+Microbenchmarks for loading movies and working on their frames.
+
+Each benchmark is timed over several rounds, and its peak memory is measured with tracemalloc in a separate round, so
+the tracing doesn't slow the timed ones down. The results can be saved as a baseline and later runs compared against it:
+
+    python benchmarks/microbenchmarks.py --save-baseline
+    python benchmarks/microbenchmarks.py --compare
+
+Comparing exits with status 1 when a benchmark got slower or bigger than the tolerance allows. Timings depend on the
+machine, so a baseline is only meaningful on the machine it was saved on.
+"""
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import click
+import colorama
+
+REPO_DIRECTORY = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIRECTORY))
+
+from ascii_telnet.ascii_movie import Movie, get_loaded_movie, save_movie  # noqa: E402
+
+MOVIE_PATH = str(REPO_DIRECTORY / 'movies' / 'sw1.txt')
+BASELINE_PATH = Path(__file__).resolve().parent / 'baseline.json'
+DEFAULT_TOLERANCE = 0.25  # A benchmark may be this much slower or bigger than the baseline before it counts as worse
+
+BENCHMARKS = {}  # name -> (setup, benchmark)
+
+
+def benchmark(setup: Callable[[], object] = lambda: None):
+    """
+    Registers a benchmark. setup runs before every round, untimed, and its result is passed to the benchmark.
+    """
+    def register(function: Callable[[object], None]):
+        BENCHMARKS[function.__name__] = (setup, function)
+        return function
+    return register
+
+
+@contextlib.contextmanager
+def quiet():
+    """The movie code reports progress with print, which would end up in the results."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+_loaded_movie = None
+_unmerged_frames = None
+_saved_movies = {}
+
+
+def loaded_movie() -> Movie:
+    global _loaded_movie
+    if _loaded_movie is None:
+        _loaded_movie = Movie()
+        with quiet():
+            _loaded_movie.load(MOVIE_PATH)
+    return _loaded_movie
+
+
+def uncompressed_movie() -> Movie:
+    """A fresh copy of the movie with its frames fitted, but not merged or interned yet."""
+    global _unmerged_frames
+    movie = Movie()
+    if _unmerged_frames is None:
+        with open(MOVIE_PATH) as f:
+            _unmerged_frames = list(movie._generate_text_frames(f))
+        for frame in _unmerged_frames:
+            movie._fit_frame(frame)
+    movie.frames = [frame.clone() for frame in _unmerged_frames]
+    return movie
+
+
+def saved_movie(extension: str) -> str:
+    if extension not in _saved_movies:
+        path = os.path.join(tempfile.mkdtemp(), 'movie' + extension)
+        with quiet():
+            save_movie(loaded_movie(), path)
+        _saved_movies[extension] = path
+    return _saved_movies[extension]
+
+
+def raw_frames():
+    """Frames as they come out of the text file, before they are fitted to the movie."""
+    movie = Movie()
+    with open(MOVIE_PATH) as f:
+        return list(movie._generate_text_frames(f))
+
+
+@benchmark()
+def movie_load(state):
+    with quiet():
+        Movie().load(MOVIE_PATH)
+
+
+@benchmark(uncompressed_movie)
+def movie_compress(movie):
+    movie.compress()
+
+
+@benchmark(lambda: loaded_movie())
+def movie_clone(movie):
+    movie.clone()
+
+
+@benchmark(lambda: loaded_movie().frames)
+def frame_dimensions(frames):
+    for frame in frames:
+        frame.dimensions
+
+
+@benchmark(raw_frames)
+def frame_increase_width(frames):
+    for frame in frames:
+        frame._increase_width(80)
+
+
+@benchmark(raw_frames)
+def frame_increase_height(frames):
+    for frame in frames:
+        frame._increase_height(24)
+
+
+@benchmark(raw_frames)
+def frame_set_background(frames):
+    for frame in frames:
+        frame.set_background_on_frame(colorama.Back.BLACK)
+
+
+@benchmark(lambda: saved_movie('.pkl'))
+def get_loaded_movie_pickle(path):
+    get_loaded_movie(path)
+
+
+@benchmark(lambda: saved_movie('.atm'))
+def get_loaded_movie_atm(path):
+    get_loaded_movie(path)
+
+
+def run_benchmark(name: str, rounds: int) -> Dict[str, float]:
+    setup, function = BENCHMARKS[name]
+    timings = []
+    for _ in range(rounds):
+        state = setup()
+        start = time.perf_counter()
+        function(state)
+        timings.append(time.perf_counter() - start)
+
+    state = setup()
+    tracemalloc.start()
+    try:
+        function(state)
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'min_seconds': min(timings),
+        'median_seconds': statistics.median(timings),
+        'peak_memory_bytes': peak_memory,
+    }
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], tolerance: float) -> List[str]:
+    """
+    Returns:
+        list: A description of every benchmark that got worse than the tolerance allows
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for measure in ('min_seconds', 'peak_memory_bytes'):
+            before, after = baseline[name][measure], result[measure]
+            result[f'{measure}_ratio'] = after / before if before else None
+            if before and after > before * (1 + tolerance):
+                regressions.append(f"{name}: {measure} went from {before:.6g} to {after:.6g}")
+    return regressions
+
+
+@click.command()
+@click.option('-r', '--rounds', type=click.IntRange(min=1), default=5, show_default=True, help="Timed rounds.")
+@click.option('-k', '--only', multiple=True, type=click.Choice(sorted(BENCHMARKS)), help="Only run these benchmarks.")
+@click.option('--save-baseline', is_flag=True, help="Save the results as the new baseline.")
+@click.option('--compare', 'compare_to_baseline', is_flag=True, help="Compare the results against the baseline.")
+@click.option(
+    '--tolerance',
+    type=click.FloatRange(min=0),
+    default=DEFAULT_TOLERANCE,
+    show_default=True,
+    help="How much worse than the baseline a benchmark may get, as a fraction."
+)
+@click.option('--baseline', 'baseline_path', type=click.Path(dir_okay=False), default=str(BASELINE_PATH))
+def main(rounds, only, save_baseline, compare_to_baseline, tolerance, baseline_path):
+    """Runs the movie microbenchmarks and prints their results as JSON."""
+    results = {}
+    for name in only or BENCHMARKS:
+        results[name] = run_benchmark(name, rounds)
+
+    regressions = []
+    if compare_to_baseline:
+        with open(baseline_path) as f:
+            regressions = compare(results, json.load(f), tolerance)
+    print(json.dumps(results, indent=2))
+
+    if save_baseline:
+        with open(baseline_path, 'w') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+    if regressions:
+        print("Worse than the baseline:", file=sys.stderr)
+        for regression in regressions:
+            print(f"  {regression}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
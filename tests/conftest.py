@@ -0,0 +1,28 @@
+# coding=utf-8
+from ascii_telnet.ascii_movie import Frame, Movie
+
+
+def make_movie(*frames_data, frame_size=None):
+    """
+    Builds a movie from (display time, lines) for every frame, without fitting the frames to the movie.
+
+    Args:
+        frame_size (tuple): (width, height) to set as the movie's frame dimensions
+    """
+    movie = Movie()
+    if frame_size:
+        movie.set_frame_dimensions(*frame_size)
+    movie.frames = []
+    for display_time, lines in frames_data:
+        frame = Frame(display_time)
+        frame.data = list(lines)
+        movie.frames.append(frame)
+    return movie
+
+
+def make_small_movie(width, *frames_data):
+    """A movie whose screen is only width columns wide and just high enough for its frames and TimeBar."""
+    movie = make_movie(*frames_data)
+    movie.screen_width = width
+    movie.screen_height = len(frames_data[0][1]) + 1
+    return movie
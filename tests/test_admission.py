@@ -0,0 +1,69 @@
+# coding=utf-8
+import asyncio
+import threading
+import time
+
+from ascii_telnet.admission import AdmissionControl, AsyncWaitingRoom, WaitingRoom
+
+
+class TestAdmissionControl(object):
+    def test_connections_beyond_the_limit_are_turned_away(self):
+        admission = AdmissionControl(max_connections=2)
+        assert admission.connect() and admission.connect()
+        assert not admission.connect()
+        admission.disconnect()
+        assert admission.connect()
+
+    def test_unlimited_by_default(self):
+        admission = AdmissionControl()
+        assert all(admission.connect() for _ in range(100))
+
+
+class TestWaitingRoom(object):
+    def test_visitors_wait_in_line_in_order(self):
+        room = WaitingRoom(1)
+        room.enter()
+        admitted = []
+        places = {}
+
+        def visit(name):
+            room.enter(lambda place: places.setdefault(name, []).append(place))
+            admitted.append(name)
+
+        visitors = []
+        for name in ('first', 'second'):
+            visitors.append(threading.Thread(target=visit, args=(name,)))
+            visitors[-1].start()
+            while room.waiting < len(visitors):
+                time.sleep(0.001)
+        room.leave()
+        visitors[0].join()
+        room.leave()
+        visitors[1].join()
+        assert admitted == ['first', 'second']
+        assert places['first'] == [1]
+        assert places['second'][0] == 2
+
+    def test_visitor_that_leaves_the_line_gives_up_their_place(self):
+        room = AsyncWaitingRoom(1)
+
+        async def scenario():
+            await room.enter()
+            leaving = asyncio.ensure_future(room.enter())
+            await asyncio.sleep(0)
+            places = []
+
+            async def place_changed(place):
+                places.append(place)
+
+            staying = asyncio.ensure_future(room.enter(place_changed))
+            await asyncio.sleep(0)
+            leaving.cancel()
+            await asyncio.sleep(0)
+            assert room.waiting == 1
+            await room.leave()
+            await staying
+            return places
+
+        assert asyncio.run(scenario())[0] == 2
+        assert room.in_use == 1
@@ -0,0 +1,156 @@
+# coding=utf-8
+import asyncio
+import socket
+
+from ascii_telnet.ascii_player import AsyncVT100Player, FrameTickScheduler
+from ascii_telnet.async_server import AsyncTelnetSession
+from ascii_telnet.encoded_movie import EncodedMovie
+from ascii_telnet.telnet_protocol import IAC, NAWS, SB, SE, WILL
+
+from tests.conftest import make_movie
+
+
+class FakeScheduler(object):
+    """A FrameTickScheduler whose ticks only pass when a player waits for them or draws a frame."""
+
+    def __init__(self):
+        self.tick = 0
+
+    async def wait_for_tick(self, tick):
+        self.tick = max(self.tick, tick)
+
+
+def play(player, draw_ticks=0):
+    scheduler = FakeScheduler()
+    drawn = []
+
+    def draw_frame(screen_buffer):
+        drawn.append(screen_buffer)
+        scheduler.tick += draw_ticks
+
+    player.draw_frame = draw_frame
+    asyncio.run(player.play(scheduler))
+    return drawn, scheduler.tick
+
+
+class TestFrameTickScheduler(object):
+    def test_waiters_are_woken_in_tick_order(self):
+        async def scenario():
+            scheduler = FrameTickScheduler(ticks_per_second=200)
+            scheduler.start()
+            woken = []
+
+            async def wait(tick):
+                await scheduler.wait_for_tick(tick)
+                woken.append((tick, scheduler.tick >= tick))
+
+            await asyncio.gather(*(wait(tick) for tick in (6, 2, 4, 4)))
+            scheduler.stop()
+            return woken
+
+        assert asyncio.run(scenario()) == [(2, True), (4, True), (4, True), (6, True)]
+
+    def test_past_ticks_dont_wait(self):
+        async def scenario():
+            scheduler = FrameTickScheduler()
+            scheduler.tick = 10
+            await asyncio.wait_for(scheduler.wait_for_tick(10), 0.1)
+
+        asyncio.run(scenario())
+
+    def test_cancelled_waiter_leaves_the_tick_to_the_others(self):
+        async def scenario():
+            scheduler = FrameTickScheduler(ticks_per_second=200)
+            cancelled = asyncio.ensure_future(scheduler.wait_for_tick(3))
+            staying = asyncio.ensure_future(scheduler.wait_for_tick(3))
+            await asyncio.sleep(0)
+            cancelled.cancel()
+            scheduler.start()
+            await asyncio.wait_for(staying, 1)
+            scheduler.stop()
+            return cancelled.cancelled()
+
+        assert asyncio.run(scenario())
+
+
+class TestAsyncVT100Player(object):
+    movie = EncodedMovie(make_movie(*[(15, [str(i)]) for i in range(10)]))  # One second, 15 ticks, per frame
+
+    def test_plays_every_frame_on_its_tick(self):
+        drawn, tick = play(AsyncVT100Player(self.movie))
+        assert len(drawn) == 10
+        assert tick == 150
+
+    def test_skips_to_the_current_frame_when_behind(self):
+        drawn, tick = play(AsyncVT100Player(self.movie), draw_ticks=37.5)
+        # Drawing takes 2.5 seconds, so after each frame the player is already into a later one
+        assert drawn[1:] == [self.movie.frames[2], self.movie.frames[5], self.movie.frames[7]]
+        assert tick == 150
+
+    def test_seek(self):
+        player = AsyncVT100Player(self.movie)
+        player.seek(7.5)
+        drawn, tick = play(player)
+        assert drawn[1:] == list(self.movie.frames[8:])
+        assert self.movie.frames[7] in drawn[0]
+        assert tick == 45  # Playing starts on the tick frame 7 starts on, not half way through it
+
+
+class FakeWriter(object):
+    """An asyncio.StreamWriter that keeps what is written."""
+
+    def __init__(self):
+        self.written = b''
+        self.closed = False
+        self.transport = self
+        self.socket, self._peer = socket.socketpair()  # Only there for its send queue, which stays empty
+
+    def write(self, data):
+        self.written += data
+
+    async def drain(self):
+        pass
+
+    def is_closing(self):
+        return self.closed
+
+    def close(self):
+        self.closed = True
+        self.socket.close()
+        self._peer.close()
+
+    def get_write_buffer_size(self):
+        return 0
+
+    def get_extra_info(self, name):
+        return {'peername': ('10.0.0.1', 4321), 'socket': self.socket}.get(name)
+
+
+class Session(AsyncTelnetSession):
+    pass
+
+
+class TestAsyncTelnetSession(object):
+    def test_plays_the_movie_to_a_human_with_a_window_size(self):
+        movie = make_movie((1, ["abcdef", "ghijkl"]), (1, ["abcdeX", "ghijkl"]))
+        Session.set_up_handler_global_state(movie, None)
+
+        async def scenario():
+            reader = asyncio.StreamReader()
+            reader.feed_data(bytes([IAC, WILL, NAWS, IAC, SB, NAWS, 0, 100, 0, 30, IAC, SE]) + b'yes\r\n')
+            reader.feed_eof()
+            writer = FakeWriter()
+            Session.scheduler.start()
+            try:
+                await asyncio.wait_for(Session.handle_connection(reader, writer), 5)
+            finally:
+                Session.scheduler.stop()
+            return writer
+
+        writer = asyncio.run(scenario())
+        assert b'Are you a human?' in writer.written
+        assert b'Whew.' in writer.written
+        rendering = Session.encoded_movie.for_window(100, 30)
+        assert all(frame in writer.written for frame in rendering.frames)
+        assert writer.closed
+        assert Session.admission.connections == 0
@@ -0,0 +1,46 @@
+# coding=utf-8
+import socket
+
+import pytest
+
+from ascii_telnet.backpressure import TIOCOUTQ, SendQueueMonitor
+
+
+@pytest.fixture
+def connection():
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+    client = socket.create_connection(server.getsockname())
+    sending, _ = server.accept()
+    server.close()
+    yield sending, client
+    sending.close()
+    client.close()
+
+
+@pytest.mark.skipif(TIOCOUTQ is None, reason="The send queue can only be read on Linux")
+class TestSendQueueMonitor(object):
+    def test_empty_queue_has_no_backlog(self, connection):
+        sending, _ = connection
+        monitor = SendQueueMonitor(sending)
+        assert monitor.queued_bytes() == 0
+        assert monitor.backlog_seconds() == 0
+
+    def test_client_that_stops_reading_builds_a_backlog(self, connection):
+        sending, _ = connection
+        sending.setblocking(False)
+        try:
+            while True:
+                sending.send(b'x' * 65536)
+        except BlockingIOError:
+            pass
+        monitor = SendQueueMonitor(sending)
+        assert monitor.queued_bytes() > 0
+        monitor.backlog_seconds()
+        assert monitor.backlog_seconds() == float('inf')
+
+    def test_buffered_bytes_count_as_queued(self, connection):
+        sending, _ = connection
+        monitor = SendQueueMonitor(sending, lambda: 100)
+        assert monitor.queued_bytes() == 100
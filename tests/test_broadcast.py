@@ -0,0 +1,54 @@
+# coding=utf-8
+from ascii_telnet.broadcast import BroadcastChannel, BroadcastViewer
+from ascii_telnet.encoded_movie import EncodedMovie
+
+from tests.conftest import make_movie
+
+
+def make_channel(frame_count, keyframe_interval):
+    movie = make_movie(*[(1, [str(i)]) for i in range(frame_count)])
+    return BroadcastChannel(EncodedMovie(movie, keyframe_interval))
+
+
+class TestBroadcastViewer(object):
+    def test_joins_at_keyframe_and_watches_one_whole_movie(self):
+        channel = make_channel(6, 3)
+        viewer = BroadcastViewer(channel, delta=True)
+        drawn = []
+        for position in [(0, 1), (0, 2), (0, 3), (0, 4), (0, 5), (1, 0), (1, 1), (1, 2)]:
+            assert not viewer._is_over(position)
+            drawn.append(viewer._encode_update(position))
+        assert viewer._is_over((1, 3))
+
+        movie = channel.movie
+        assert drawn == [
+            None,
+            None,
+            movie.clear_screen + movie.frames[3],
+            movie.deltas[4],
+            movie.deltas[5],
+            movie.frames[0],
+            movie.deltas[1],
+            movie.deltas[2],
+        ]
+
+    def test_viewer_joining_at_the_start_leaves_when_the_channel_loops(self):
+        channel = make_channel(6, 3)
+        viewer = BroadcastViewer(channel)
+        viewer._encode_update((4, 0))
+        assert not viewer._is_over((4, 5))
+        assert viewer._is_over((5, 0))
+
+    def test_skipped_frames_dont_keep_a_viewer_on_the_channel(self):
+        channel = make_channel(6, 3)
+        viewer = BroadcastViewer(channel)
+        viewer._encode_update((0, 3))
+        assert not viewer._is_over((1, 2))
+        assert viewer._is_over((1, 5))
+
+    def test_missed_frames_are_sent_in_full(self):
+        channel = make_channel(6, 3)
+        viewer = BroadcastViewer(channel, delta=True)
+        viewer._encode_update((0, 0))
+        assert viewer._encode_update((0, 2)) == channel.movie.frames[2]
+        assert viewer._encode_update((0, 2)) is None
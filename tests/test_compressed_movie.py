@@ -0,0 +1,40 @@
+# coding=utf-8
+import pytest
+
+from ascii_telnet.ascii_movie import CompressedMovie, FrameBlockCache
+from ascii_telnet.encoded_movie import EncodedMovie
+
+from tests.conftest import make_movie
+
+# Four distinct frames, repeated
+FRAMES = [(number + 1, ["\x1b[40m{0}\x1b[0m".format(number % 4) * 20, ""]) for number in range(10)]
+
+
+class TestCompressedMovie(object):
+    def test_frames_read_back_equal(self):
+        movie = make_movie(*FRAMES, frame_size=(20, 2))
+        compressed = CompressedMovie(movie, block_size=3, cache=FrameBlockCache())
+        assert len(compressed.frames) == 10
+        assert compressed.display_times == movie.display_times
+        assert [frame.data for frame in compressed.frames] == [frame.data for frame in movie.frames]
+        assert compressed.frames.unique_frame_count == 4
+        assert compressed.frames.frame_id(0) == compressed.frames.frame_id(4) != compressed.frames.frame_id(1)
+        assert compressed.frames.bytes_saved > 0
+        assert EncodedMovie(compressed).frames[7] == EncodedMovie(movie).frames[7]
+
+    def test_decompressed_blocks_are_cached(self):
+        cache = FrameBlockCache(size=1)
+        compressed = CompressedMovie(make_movie(*FRAMES, frame_size=(20, 2)), block_size=2, cache=cache)
+        compressed.frames[0]
+        compressed.frames[1]
+        compressed.frames[2]  # In the second block, which pushes the first one out
+        compressed.frames[0]
+        assert (cache.hits, cache.misses) == (1, 3)
+        assert cache.hit_ratio == 0.25
+
+    def test_changes_are_not_kept(self):
+        compressed = CompressedMovie(make_movie(*FRAMES, frame_size=(20, 2)), cache=FrameBlockCache())
+        compressed.frames[0].data[0] = "changed"
+        assert compressed.frames[0].data[0] != "changed"
+        with pytest.raises(TypeError):
+            compressed.remove_styling()
@@ -0,0 +1,48 @@
+# coding=utf-8
+import json
+
+from ascii_telnet.connection_notifier import JSONLinesBackend, MemoryBackend, NotificationDispatcher
+
+
+class TestNotificationDispatcher(object):
+    def test_notifications_close_together_are_sent_as_one_digest(self):
+        backend = MemoryBackend()
+        dispatcher = NotificationDispatcher(backend, app_name='Theater', digest_seconds=0.2)
+        for number in range(3):
+            dispatcher.notify(f"visitor {number}")
+        dispatcher.flush(timeout=5)
+        assert len(backend.sent) == 1
+        subject, contents = backend.sent[0]
+        assert subject == "3 notifications from Theater"
+        assert all(f"visitor {number}" in contents for number in range(3))
+
+    def test_single_notification_is_sent_as_is(self):
+        backend = MemoryBackend()
+        dispatcher = NotificationDispatcher(backend, app_name='Theater', digest_seconds=0)
+        dispatcher.notify("hello")
+        dispatcher.flush(timeout=5)
+        assert backend.sent == [("Notification from Theater", "hello")]
+
+    def test_failed_sends_are_retried(self):
+        backend = MemoryBackend(failures=2)
+        dispatcher = NotificationDispatcher(backend, digest_seconds=0, retry_delay_seconds=0.01)
+        dispatcher.notify("hello")
+        dispatcher.flush(timeout=5)
+        assert len(backend.sent) == 1
+
+    def test_notifications_beyond_the_queue_are_dropped(self):
+        dispatcher = NotificationDispatcher(MemoryBackend(), max_queued=1)
+        dispatcher._ensure_started = lambda: None  # Nothing takes notifications off the queue
+        dispatcher.notify("kept")
+        dispatcher.notify("dropped")
+        assert dispatcher.dropped == 1
+
+
+class TestJSONLinesBackend(object):
+    def test_appends_one_line_per_notification(self, tmp_path):
+        path = tmp_path / 'notifications.jsonl'
+        backend = JSONLinesBackend(str(path))
+        backend.send("first", "one")
+        backend.send("second", "two")
+        records = [json.loads(line) for line in path.read_text().splitlines()]
+        assert [(record['subject'], record['contents']) for record in records] == [("first", "one"), ("second", "two")]
@@ -0,0 +1,124 @@
+# coding=utf-8
+import re
+
+from ascii_telnet import encoded_movie
+from ascii_telnet.encoded_movie import EncodedMovie, _changed_runs, fit_to_window
+
+from tests.conftest import make_movie, make_small_movie
+
+
+def render(*buffers, width=80, height=24):
+    """
+    Draws VT100 buffers on a blank screen, the way a terminal would, and returns its lines. Styling is ignored.
+    """
+    screen = [[' '] * width for _ in range(height)]
+    row = column = 0
+    for buffer in buffers:
+        for sequence, text in re.findall(r'\x1b\[([0-9;]*[A-Za-z])|([^\x1b])', buffer.decode()):
+            if sequence.endswith('H'):
+                y, x = (int(number or 1) for number in sequence[:-1].split(';'))
+                row, column = max(y, 1) - 1, max(x, 1) - 1
+            elif text == '\r':
+                column = 0
+            elif text == '\n':
+                row += 1
+            elif text and row < height and column < width:
+                screen[row][column] = text
+                column += 1
+    return [''.join(line) for line in screen]
+
+
+class TestEncodedMovie(object):
+    def test_frames_are_bytes(self):
+        encoded = EncodedMovie(make_movie((1, ["ab", "cd"]), (2, ["ef", "gh"])))
+        assert len(encoded) == 2
+        assert all(isinstance(frame, bytes) for frame in encoded.frames)
+        assert encoded.display_times == (1, 2)
+        assert encoded.frame_count == 3
+
+    def test_frame_contains_lines_and_timebar(self):
+        movie = make_movie((1, ["ab", "cd"]))
+        encoded = EncodedMovie(movie)
+        frame = encoded.frames[0]
+        assert frame.startswith("\x1b[{0};1H".format(movie.top_margin).encode())
+        assert b"ab\r\ncd\r\n" in frame
+        assert frame.endswith(encoded.timebar.get_timebar(1).encode())
+
+    def test_destyled_is_shared(self):
+        encoded = EncodedMovie(make_movie((1, ["\x1b[40mab\x1b[0m"])))
+        assert encoded.destyled is encoded.destyled
+        assert b"\x1b[40m" not in encoded.destyled.frames[0]
+        assert b"\x1b[40m" in encoded.frames[0]
+
+    def test_first_delta_is_full_frame(self):
+        encoded = EncodedMovie(make_movie((1, ["ab"]), (1, ["ab"])))
+        assert encoded.deltas[0] == encoded.frames[0]
+
+    def test_delta_only_contains_changed_runs(self):
+        movie = make_movie((1, ["abcdefghijklmnop", "same"]), (1, ["aXcdefghijklmnoY", "same"]))
+        encoded = EncodedMovie(movie)
+        assert b"same" not in encoded.deltas[1]
+        assert b"abcdefghijklmnop" not in encoded.deltas[1]
+
+    def test_deltas_draw_the_same_screen_as_full_frames(self):
+        movie = make_movie(
+            (1, ["abcdefghijklmnop", "same", "line three"]),
+            (1, ["aXcdefghijklmnoY", "same", "line thrEE"]),
+            (1, ["aXcdefghijklmnoY", "sZme", "\x1b[40mline\x1b[0m thrEE"]),
+        )
+        encoded = EncodedMovie(movie, keyframe_interval=10)
+        size = dict(width=encoded.screen_width, height=encoded.screen_height)
+        for index in range(1, len(encoded)):
+            assert render(*encoded.deltas[:index + 1], **size) == render(encoded.frames[index], **size)
+
+    def test_index_of(self):
+        encoded = EncodedMovie(make_movie((1, ["a"]), (2, ["b"]), (3, ["c"])))
+        assert [encoded.index_of(position) for position in (0, 1, 2.5, 3, 5.9, 6)] == [0, 1, 1, 2, 2, 3]
+
+    def test_keyframes(self):
+        encoded = EncodedMovie(make_movie(*[(1, [str(i)]) for i in range(5)]), keyframe_interval=2)
+        assert encoded.deltas[2] == encoded.frames[2]
+        assert encoded.deltas[4] == encoded.frames[4]
+        assert encoded.deltas[3] != encoded.frames[3]
+
+
+class TestWindowRendering(object):
+    movie = make_small_movie(6, (1, ["abcdef", "ghijkl"]), (1, ["abcdeX", "ghijkl"]))
+
+    def test_margins_on_larger_terminal(self):
+        rendering = EncodedMovie(self.movie).for_window(20, 8)
+        assert rendering.layout.scale == 1
+        assert rendering.frames[0].startswith(b"\x1b[3;8Habcdef\x1b[4;8Hghijkl\x1b[5;8H<")
+
+    def test_half_resolution_and_crop_on_smaller_terminal(self):
+        layout = fit_to_window(make_small_movie(40, (1, ["x" * 40] * 10)), 16, 4)
+        assert (layout.scale, layout.width, layout.height, layout.crop_y) == (2, 16, 3, 1)
+
+    def test_renderings_are_shared(self):
+        encoded = EncodedMovie(self.movie)
+        assert encoded.for_window(30, 10) is encoded.for_window(30, 10)
+        assert encoded.for_window(encoded.screen_width, encoded.screen_height) is encoded
+        assert encoded.for_window(30, 10).destyled.window == (30, 10)
+
+    def test_prepared_windows_are_encoded_up_front_and_kept(self, monkeypatch):
+        monkeypatch.setattr(encoded_movie, 'WINDOW_CACHE_SIZE', 1)
+        encoded = EncodedMovie(self.movie)
+        encoded.prepare_windows([(30, 10), (encoded.screen_width, encoded.screen_height)])
+        prepared = encoded.for_window(30, 10)
+        assert isinstance(prepared.frames, tuple)
+        assert prepared.frames == tuple(EncodedMovie(self.movie, window=(30, 10)).frames)
+        for size in [(40, 10), (50, 10)]:
+            assert encoded.for_window(*size).lazy
+        assert encoded.for_window(30, 10) is prepared
+        assert encoded.for_window(encoded.screen_width, encoded.screen_height) is encoded
+
+
+class TestChangedRuns(object):
+    def test_identical(self):
+        assert list(_changed_runs("abc", "abc")) == []
+
+    def test_close_changes_are_merged(self):
+        assert list(_changed_runs("abcdef", "XbcdeY")) == [(0, 6)]
+
+    def test_longer_line(self):
+        assert list(_changed_runs("ab", "abcd")) == [(2, 4)]
@@ -0,0 +1,44 @@
+# coding=utf-8
+from urllib.request import urlopen
+
+from ascii_telnet.metrics import Counter, Gauge, Histogram, Registry, serve_metrics
+
+
+class TestMetrics(object):
+    def test_renders_prometheus_text(self):
+        registry = Registry()
+        frames = registry.register(Counter('frames_total', "Frames", ['reason']))
+        sessions = registry.register(Gauge('sessions', "Sessions", ['phase']))
+        frames.inc(reason='late')
+        frames.inc(2, reason='late')
+        sessions.set_function(lambda: 7, phase='playing')
+        lines = registry.render().splitlines()
+        assert lines[:3] == ['# HELP frames_total Frames', '# TYPE frames_total counter', 'frames_total{reason="late"} 3']
+        assert 'sessions{phase="playing"} 7' in lines
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram('latency_seconds', "Latency", buckets=(0.1, 1))
+        for value in (0.05, 0.5, 5):
+            histogram.observe(value)
+        lines = histogram.render()
+        assert 'latency_seconds_bucket{le="0.1"} 1' in lines
+        assert 'latency_seconds_bucket{le="1"} 2' in lines
+        assert 'latency_seconds_bucket{le="+Inf"} 3' in lines
+        assert 'latency_seconds_count 3' in lines
+
+    def test_gauge_tracks_a_with_block(self):
+        gauge = Gauge('sessions', "Sessions", ['phase'])
+        with gauge.track(phase='playing'):
+            assert gauge.value(phase='playing') == 1
+        assert gauge.value(phase='playing') == 0
+
+    def test_served_over_http(self):
+        registry = Registry()
+        registry.register(Counter('frames_total', "Frames")).inc()
+        server = serve_metrics('127.0.0.1', 0, registry)
+        try:
+            with urlopen(f'http://127.0.0.1:{server.server_address[1]}/metrics') as response:
+                assert 'frames_total 1' in response.read().decode('utf-8')
+        finally:
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,89 @@
+# coding=utf-8
+import pytest
+
+from ascii_telnet.ascii_movie import FrameInterner, MappedMovie, Movie, get_loaded_movie
+
+from tests.conftest import make_movie
+
+FRAMES = [(1, ["ab", "cd"]), (3, ["\x1b[40mé\x1b[0m", ""])]
+
+
+class TestMovieFile(object):
+    def test_round_trip(self, tmp_path):
+        movie = make_movie(*FRAMES)
+        path = movie.to_movie_file(str(tmp_path / 'movie'))
+        assert path.endswith('.atm')
+
+        mapped = get_loaded_movie(path)
+        assert isinstance(mapped, MappedMovie)
+        assert len(mapped.frames) == 2
+        assert mapped.display_times == [1, 3]
+        assert [frame.data for frame in mapped.frames] == [frame.data for frame in movie.frames]
+        assert mapped.frames[-1].display_time == 3
+        assert (mapped.screen_width, mapped.screen_height, mapped.top_margin) == \
+            (movie.screen_width, movie.screen_height, movie.top_margin)
+
+    def test_not_a_movie_file(self, tmp_path):
+        path = tmp_path / 'bad.atm'
+        path.write_bytes(b'\0' * 64)
+        with pytest.raises(ValueError):
+            MappedMovie(str(path))
+
+    def test_mapped_movie_is_read_only(self, tmp_path):
+        mapped = MappedMovie(make_movie(*FRAMES).to_movie_file(str(tmp_path / 'movie.atm')))
+        with pytest.raises(TypeError):
+            mapped.compress()
+        clone = mapped.clone()
+        clone.remove_styling()
+        assert clone.frames[1].data == ["é", ""]
+
+    def test_stream_to_movie_file_merges_equal_frames(self, tmp_path):
+        text_movie = tmp_path / 'movie.txt'
+        frame_lines = ['x'] * Movie()._frame_height
+        text_movie.write_text('\n'.join(['2'] + frame_lines + ['3'] + frame_lines + ['1'] + ['y'] * len(frame_lines)))
+
+        path = Movie().stream_to_movie_file(str(text_movie), str(tmp_path / 'movie.atm'))
+        mapped = MappedMovie(path)
+        assert mapped.display_times == [5, 1]
+        assert [frame.data for frame in mapped.frames] == [frame.data for frame in get_loaded_movie(str(text_movie)).frames]
+
+    def test_repeated_frames_are_stored_once(self, tmp_path):
+        movie = make_movie(*FRAMES)
+        movie.frames.append(movie.frames[0].clone())
+        path = movie.to_movie_file(str(tmp_path / 'movie.atm'))
+        mapped = MappedMovie(path)
+        assert [frame.data for frame in mapped.frames] == [frame.data for frame in movie.frames]
+        assert mapped.frames.frame_id(0) == mapped.frames.frame_id(2) != mapped.frames.frame_id(1)
+
+    def test_parts_stream_into_one_movie_file(self, tmp_path):
+        frame_lines = ['x'] * Movie()._frame_height
+        first, second = tmp_path / 'first.txt', tmp_path / 'second.txt'
+        first.write_text('\n'.join(['2'] + frame_lines))
+        second.write_text('\n'.join(['3'] + frame_lines + ['1'] + ['y'] * len(frame_lines)))
+
+        path = Movie().stream_parts_to_movie_file([str(first), str(second)], str(tmp_path / 'movie.atm'))
+        assert MappedMovie(path).display_times == [5, 1]  # Merged across the cut
+        movie = Movie()
+        movie.load_parts([str(first), str(second)])
+        assert movie.display_times == [5, 1]
+
+
+class TestFrameInterner(object):
+    def test_equal_frames_share_their_lines(self):
+        movie = make_movie(*FRAMES)
+        movie.frames.append(movie.frames[0].clone())
+        interner = FrameInterner()
+        assert [interner.intern(frame) for frame in movie.frames] == [0, 1, 0]
+        assert movie.frames[0].data is movie.frames[2].data
+        assert movie.timeline == [(0, 1), (1, 3), (0, 1)]
+        assert interner.report() == "3 frames, 2 unique (33.3% deduplicated)"
+
+    def test_loading_reports_nothing_until_asked(self, tmp_path, capsys):
+        text_movie = tmp_path / 'movie.txt'
+        frame_lines = ['x'] * Movie()._frame_height
+        text_movie.write_text('\n'.join(['1'] + frame_lines + ['1'] + ['y'] * len(frame_lines) + ['1'] + frame_lines))
+        movie = get_loaded_movie(str(text_movie))
+        mapped = MappedMovie(movie.to_movie_file(str(tmp_path / 'movie.atm')))
+        assert capsys.readouterr().out == ''
+        assert movie.deduplication_report() == "3 frames, 2 unique (33.3% deduplicated)"
+        assert mapped.deduplication_report() == movie.deduplication_report()
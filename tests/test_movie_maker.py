@@ -0,0 +1,111 @@
+# coding=utf-8
+import subprocess
+import threading
+from pathlib import Path
+
+import pytest
+
+from ascii_telnet import movie_maker
+
+
+class FakeTools(object):
+    """Stands in for ffprobe, ffmpeg and ascii-video, recording what they were asked to do."""
+
+    def __init__(self, duration, temp_dir, later_segments):
+        self.duration = duration
+        self.temp_dir = temp_dir
+        self.later_segments = later_segments  # How many segments after the first are transcoded
+        self.cuts = []
+        self.transcoded = []
+        self.later_segments_done = threading.Event()
+
+    def run(self, command, **kwargs):
+        if command[0] == 'ffprobe':
+            return subprocess.CompletedProcess(command, 0, stdout=f'{self.duration}\n')
+        assert command[0] == 'ffmpeg'
+        self.cuts.append(int(command[command.index('-ss') + 1]))
+        Path(command[-1]).write_bytes(b'segment')
+        return subprocess.CompletedProcess(command, 0)
+
+    def encode_video_to_ascii(self, video_path, video_hash, node_executable_path, quiet=False):
+        assert Path(video_path).exists()
+        first_segment = video_hash.endswith('00000')
+        if first_segment:
+            # The first segment finishes last, so completion order isn't segment order
+            self.later_segments_done.wait(5)
+        output_file = self.temp_dir / f'{video_hash}.yaml'
+        output_file.write_text(video_hash)
+        self.transcoded.append(video_hash)
+        if not first_segment and len(self.transcoded) == self.later_segments:
+            self.later_segments_done.set()
+        return output_file
+
+
+def fake_tools(monkeypatch, tmp_path, later_segments):
+    tools = FakeTools(125.3, tmp_path, later_segments)
+    monkeypatch.setattr(movie_maker, 'temp_dir', tmp_path)
+    monkeypatch.setattr(movie_maker.shutil, 'which', lambda executable: f'/usr/bin/{executable}')
+    monkeypatch.setattr(movie_maker.subprocess, 'run', tools.run)
+    monkeypatch.setattr(movie_maker, '_encode_video_to_ascii', tools.encode_video_to_ascii)
+    return tools
+
+
+class TestSegmentedTranscoding(object):
+    def test_segment_starts(self):
+        assert movie_maker._segment_starts(125.3, 60) == [0, 60, 120]
+        assert movie_maker._segment_starts(120, 60) == [0, 60]
+        assert movie_maker._segment_starts(0.2, 60) == [0]
+
+    def test_segments_are_returned_in_order(self, monkeypatch, tmp_path, capsys):
+        tools = fake_tools(monkeypatch, tmp_path, later_segments=2)
+        yaml_files = movie_maker._transcode_in_segments('video.mp4', 'hash', 'node', 60, 2)
+        assert [yaml_file.name for yaml_file in yaml_files] == [
+            'hash-60s-00000.yaml', 'hash-60s-00001.yaml', 'hash-60s-00002.yaml'
+        ]
+        assert sorted(tools.cuts) == [0, 60, 120]
+        assert tools.transcoded[-1] == 'hash-60s-00000'
+        assert list(tmp_path.glob('*.mp4')) == []  # The cut segments are removed once transcoded
+        output = capsys.readouterr().out
+        assert [f"Transcoded {done} of 3 segments" in output for done in (1, 2, 3)] == [True] * 3
+
+    def test_resumes_from_segments_already_transcoded(self, monkeypatch, tmp_path, capsys):
+        tools = fake_tools(monkeypatch, tmp_path, later_segments=1)
+        (tmp_path / 'hash-60s-00001.yaml').write_text('done before')
+        yaml_files = movie_maker._transcode_in_segments('video.mp4', 'hash', 'node', 60, 2)
+        assert sorted(tools.transcoded) == ['hash-60s-00000', 'hash-60s-00002']
+        assert sorted(tools.cuts) == [0, 120]
+        assert yaml_files[1].read_text() == 'done before'
+        output = capsys.readouterr().out
+        assert "Resuming: 1 of 3 segments were already transcoded." in output
+        assert "Transcoded 1 of 3" not in output and "Transcoded 3 of 3 segments" in output
+
+    def test_needs_ffmpeg(self, monkeypatch, tmp_path):
+        fake_tools(monkeypatch, tmp_path, later_segments=2)
+        monkeypatch.setattr(movie_maker.shutil, 'which', lambda executable: None)
+        with pytest.raises(SystemError):
+            movie_maker._transcode_in_segments('video.mp4', 'hash', 'node', 60, 2)
+
+
+class TestEncodeVideoToAscii(object):
+    def test_output_is_only_there_once_complete(self, monkeypatch, tmp_path):
+        commands = []
+
+        def run(command, **kwargs):
+            commands.append(command)
+            Path(command[-1]).write_text('frames')
+            if len(commands) == 1:
+                raise subprocess.CalledProcessError(1, command)  # Interrupted half way
+
+        monkeypatch.setattr(movie_maker, 'temp_dir', tmp_path)
+        monkeypatch.setattr(movie_maker.subprocess, 'run', run)
+        with pytest.raises(subprocess.CalledProcessError):
+            movie_maker._encode_video_to_ascii('video.mp4', 'hash', 'node')
+        assert not (tmp_path / 'hash.yaml').exists()
+
+        output_file = movie_maker._encode_video_to_ascii('video.mp4', 'hash', 'node')
+        assert output_file == tmp_path / 'hash.yaml'
+        assert output_file.read_text() == 'frames'
+        assert not (tmp_path / 'hash.partial.yaml').exists()
+
+        movie_maker._encode_video_to_ascii('video.mp4', 'hash', 'node')
+        assert len(commands) == 2  # Transcoded already, so it's reused
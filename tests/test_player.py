@@ -0,0 +1,55 @@
+# coding=utf-8
+from ascii_telnet import ascii_player
+from ascii_telnet.ascii_player import VT100Player
+from ascii_telnet.encoded_movie import EncodedMovie
+
+from tests.conftest import make_movie
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def perf_counter(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def play(player, monkeypatch, draw_seconds=0.0):
+    clock = FakeClock()
+    monkeypatch.setattr(ascii_player.time, 'perf_counter', clock.perf_counter)
+    monkeypatch.setattr(ascii_player.time, 'sleep', clock.sleep)
+    drawn = []
+
+    def draw_frame(screen_buffer):
+        drawn.append(screen_buffer)
+        clock.now += draw_seconds
+
+    player.draw_frame = draw_frame
+    player.play()
+    return drawn, clock.now
+
+
+class TestVT100Player(object):
+    movie = EncodedMovie(make_movie(*[(15, [str(i)]) for i in range(10)]))  # One second per frame
+
+    def test_plays_every_frame_on_time(self, monkeypatch):
+        drawn, seconds = play(VT100Player(self.movie), monkeypatch)
+        assert len(drawn) == 10
+        assert seconds == 10
+
+    def test_jumps_to_the_current_frame_when_behind(self, monkeypatch):
+        drawn, seconds = play(VT100Player(self.movie), monkeypatch, draw_seconds=2.5)
+        # Drawing takes 2.5 seconds, so after each frame the player is already into a later one
+        assert drawn[1:] == [self.movie.frames[2], self.movie.frames[5], self.movie.frames[7]]
+        assert seconds == 10
+
+    def test_seek(self, monkeypatch):
+        player = VT100Player(self.movie)
+        player.seek(7.5)
+        drawn, seconds = play(player, monkeypatch)
+        assert drawn[1:] == list(self.movie.frames[8:])
+        assert self.movie.frames[7] in drawn[0]
+        assert seconds == 2.5
@@ -0,0 +1,65 @@
+# coding=utf-8
+import pstats
+import tracemalloc
+
+from ascii_telnet.profiling import SessionProfiler
+
+
+def busy():
+    return sum(range(1000))
+
+
+class TestSessionProfiler(object):
+    def test_writes_a_dump_per_phase_tagged_with_the_client(self, tmp_path):
+        profiler = SessionProfiler(str(tmp_path))
+        profile = profiler.start_session(('10.0.0.1', 4321))
+        for phase in ('prompting', 'playing'):
+            with profile.phase(phase):
+                busy()
+        dumps = sorted(path.name for path in tmp_path.iterdir())
+        assert len(dumps) == 2
+        assert all('-10.0.0.1-4321-' in dump for dump in dumps)
+        assert dumps[0].endswith('-playing.prof') and dumps[1].endswith('-prompting.prof')
+        assert any('busy' in function[2] for function in pstats.Stats(str(tmp_path / dumps[0])).stats)
+
+    def test_only_a_sample_of_sessions_is_profiled(self, tmp_path):
+        assert SessionProfiler(str(tmp_path), sample_rate=0).start_session(('10.0.0.1', 4321)) is None
+
+    def test_disabled_profiler_profiles_nothing(self, tmp_path):
+        profiler = SessionProfiler(str(tmp_path))
+        profiler.toggle()
+        assert profiler.start_session(('10.0.0.1', 4321)) is None
+
+    def test_nested_phases_in_one_thread_dont_clash(self, tmp_path):
+        profiler = SessionProfiler(str(tmp_path))
+        first, second = profiler.start_session(('10.0.0.1', 1)), profiler.start_session(('10.0.0.2', 2))
+        with first.phase('playing'):
+            with second.phase('playing'):
+                busy()
+        assert [path.name for path in tmp_path.iterdir()] == [path.name for path in tmp_path.glob('*-10.0.0.1-1-*')]
+
+    def test_allocation_tracing_stops_when_profiling_is_disabled(self, tmp_path):
+        profiler = SessionProfiler(str(tmp_path), trace_allocations=True)
+        profile = profiler.start_session(('10.0.0.1', 4321))
+        with profile.phase('playing'):
+            profiler.toggle()
+            assert tracemalloc.is_tracing()  # Until the phase being traced is over
+        assert not tracemalloc.is_tracing()
+        assert len(list(tmp_path.glob('*-playing.allocations.txt'))) == 1
+
+        profiler.toggle()
+        profiler.start_session(('10.0.0.1', 4321))
+        assert tracemalloc.is_tracing()
+        profiler.toggle()
+        assert not tracemalloc.is_tracing()
+
+    def test_allocation_tracing_started_elsewhere_is_left_running(self, tmp_path):
+        tracemalloc.start()
+        try:
+            profiler = SessionProfiler(str(tmp_path), trace_allocations=True)
+            with profiler.start_session(('10.0.0.1', 4321)).phase('playing'):
+                busy()
+            profiler.toggle()
+            assert tracemalloc.is_tracing()
+        finally:
+            tracemalloc.stop()
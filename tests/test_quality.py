@@ -0,0 +1,57 @@
+# coding=utf-8
+from ascii_telnet.encoded_movie import EncodedMovie, reduce_colors
+from ascii_telnet.quality import STEP_UP_SECONDS, QualityController, QualityTiers
+
+from tests.conftest import make_movie
+
+
+def make_tiers():
+    movie = make_movie(*[(i + 1, ["\x1b[38;5;196m{0}\x1b[0m".format(i)]) for i in range(4)])
+    return QualityTiers(EncodedMovie(movie))
+
+
+class TestQualityTiers(object):
+    def test_tiers_cover_the_same_time(self):
+        tiers = make_tiers()
+        assert [tier.frame_count for tier in tiers.tiers] == [10, 10, 10, 10]
+        assert tiers[3].display_times == (3, 7)
+        assert tiers[3].index_at(tiers[0].frame_start(2)) == 1
+
+    def test_tiers_are_shared(self):
+        tiers = make_tiers()
+        assert tiers[2] is tiers[0].destyled
+        assert b"\x1b[91m" in tiers[1].frames[0]
+        assert b"\x1b[3" not in tiers[2].frames[0]
+
+
+class TestReduceColors(object):
+    def test_256_colors(self):
+        assert reduce_colors("\x1b[38;5;196mA\x1b[48;5;21mB") == "\x1b[91mA\x1b[44mB"
+
+    def test_true_color_and_repeats(self):
+        assert reduce_colors("\x1b[38;2;250;0;0mA\x1b[38;2;240;10;10mB\x1b[0m") == "\x1b[91mAB\x1b[0m"
+
+
+class TestQualityController(object):
+    def test_steps_down_when_writes_take_too_long(self):
+        controller = QualityController(make_tiers())
+        for _ in range(20):
+            controller.record_frame(0.2, 0.2)
+        assert controller.wanted_level() == 1
+        controller.switch_to(1)
+        assert controller.movie is controller.tiers[1]
+
+    def test_steps_up_after_sustained_headroom(self):
+        controller = QualityController(make_tiers())
+        controller.switch_to(2)
+        controller.record_frame(0, 1)
+        assert controller.wanted_level() == 2
+        for _ in range(STEP_UP_SECONDS):
+            controller.record_frame(0, 1)
+        assert controller.wanted_level() == 1
+
+    def test_never_leaves_the_tiers(self):
+        controller = QualityController(make_tiers())
+        controller.switch_to(3)
+        controller.record_dropped_frame(1)
+        assert controller.wanted_level() == 3
@@ -0,0 +1,101 @@
+# coding=utf-8
+import zlib
+
+from ascii_telnet.ascii_server import get_text_from_raw_bytes
+from ascii_telnet.telnet_protocol import (
+    COMPRESS2,
+    DO,
+    DONT,
+    IAC,
+    NAWS,
+    SB,
+    SE,
+    TERMINAL_TYPE,
+    WILL,
+    WONT,
+    CompressibleOutput,
+    TelnetParser,
+)
+
+NAWS_80_BY_24 = bytes([IAC, SB, NAWS, 0, 80, 0, 24, IAC, SE])
+
+
+def make_parser(**options):
+    parser = TelnetParser(**options)
+    parser.sent = []
+    parser.send = parser.sent.append
+    parser.window_sizes = []
+    parser.window_size_changed = lambda width, height: parser.window_sizes.append((width, height))
+    return parser
+
+
+class TestTelnetParser(object):
+    def test_text_passes_through(self):
+        assert make_parser().feed(b"yes\r\n") == b"yes\r\n"
+
+    def test_commands_are_taken_out(self):
+        parser = make_parser()
+        assert parser.feed(bytes([IAC, WILL, NAWS]) + NAWS_80_BY_24 + b"yes\xff\xff\r\n") == b"yes\xff\r\n"
+        assert parser.window_sizes == [(80, 24)]
+
+    def test_command_split_over_chunks(self):
+        parser = make_parser()
+        data = b"a" + bytes([IAC, SB, NAWS, 1, IAC, IAC, 0, 10, IAC, SE]) + b"b\n"
+        assert b"".join(parser.feed(data[i:i + 1]) for i in range(len(data))) == b"ab\n"
+        assert parser.window_sizes == [(511, 10)]
+
+    def test_answers_negotiations(self):
+        parser = make_parser()
+        parser.request_option(NAWS)
+        parser.feed(bytes([IAC, WILL, NAWS, IAC, WILL, TERMINAL_TYPE, IAC, WILL, 1, IAC, DO, 3]))
+        assert parser.sent == [
+            bytes([IAC, DO, NAWS]),
+            bytes([IAC, DO, TERMINAL_TYPE]),
+            bytes([IAC, SB, TERMINAL_TYPE, 1, IAC, SE]),
+            bytes([IAC, DONT, 1]),
+            bytes([IAC, WONT, 3]),
+        ]
+        assert parser.enabled_options == {NAWS, TERMINAL_TYPE}
+
+    def test_refusal(self):
+        parser = make_parser()
+        parser.request_option(NAWS)
+        parser.feed(bytes([IAC, WONT, NAWS]))
+        assert NAWS in parser.refused_options
+        assert parser.sent == [bytes([IAC, DO, NAWS])]
+
+    def test_terminal_type(self):
+        parser = make_parser()
+        received = []
+        parser.terminal_type_received = received.append
+        parser.feed(bytes([IAC, SB, TERMINAL_TYPE, 0]) + b"XTERM-256COLOR" + bytes([IAC, SE]))
+        assert received == ["XTERM-256COLOR"]
+
+    def test_get_text_from_raw_bytes(self):
+        assert get_text_from_raw_bytes(bytes([IAC, WILL, NAWS]) + NAWS_80_BY_24 + b"yes\r\n") == "yes\r\n"
+
+    def test_offered_option(self):
+        parser = make_parser(offered_options=[COMPRESS2])
+        changes = []
+        parser.local_option_changed = lambda option, enabled: changes.append((option, enabled))
+        parser.offer_option(COMPRESS2)
+        parser.feed(bytes([IAC, DO, COMPRESS2]))
+        assert parser.local_options == {COMPRESS2}
+        parser.feed(bytes([IAC, DONT, COMPRESS2]))
+        assert parser.sent == [bytes([IAC, WILL, COMPRESS2]), bytes([IAC, WONT, COMPRESS2])]
+        assert changes == [(COMPRESS2, True), (COMPRESS2, False)]
+
+
+class TestCompressibleOutput(object):
+    def test_every_write_can_be_decompressed_right_away(self):
+        sent = []
+        output = CompressibleOutput(sent.append)
+        output.write(b"prompt")
+        output.start_compressing()
+        decompressor = zlib.decompressobj()
+        for frame in (b"frame one" * 50, b"frame two" * 50):
+            assert output.write(frame) == len(sent[-1]) < len(frame)
+            assert decompressor.decompress(sent[-1]) == frame
+        output.stop_compressing()
+        assert decompressor.decompress(sent[-1]) == b"" and decompressor.eof
+        assert sent[:2] == [b"prompt", bytes([IAC, SB, COMPRESS2, IAC, SE])]
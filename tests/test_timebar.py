@@ -114,3 +114,13 @@ class TestTimeBar(object):
         bad_frame_timebar = tb.get_timebar(104)
         assert len(bad_frame_timebar) == 102
         assert bad_frame_timebar == "<                                                                                                   o>"
+
+    def test_encoded_timebar(self):
+        tb = TimeBar(100, 8, row=24)
+        assert tb.get_encoded_timebar(10) == b"\x1b[24;1H< o    >"
+        assert TimeBar(100, 8).get_encoded_timebar(10) == b"< o    >"
+
+    def test_encoded_timebar_skipped_when_marker_has_not_moved(self):
+        tb = TimeBar(100, 8)
+        assert tb.get_encoded_timebar(11, previous_frame_num=10) == b""
+        assert tb.get_encoded_timebar(50, previous_frame_num=10) == b"<   o  >"
@@ -0,0 +1,44 @@
+# coding=utf-8
+import io
+
+import numpy as np
+
+from ascii_telnet.video_converter import VideoToAsciiConverter, read_pnm_stream, read_y4m_stream
+
+
+def solid_image(color, width=40, height=20):
+    return np.full((height, width, 3), color, np.uint8)
+
+
+class TestVideoToAsciiConverter(object):
+    def test_brightness_picks_the_glyph_and_color_the_palette_entry(self):
+        converter = VideoToAsciiConverter(20, 5)
+        lines = converter.convert(solid_image((255, 0, 0)))
+        assert len(lines) == 5
+        assert lines[0].startswith('\x1b[38;5;196m')  # Pure red in the xterm palette
+        assert VideoToAsciiConverter(20, 5, palette='none').convert(solid_image((255, 255, 255)))[0] == '@' * 20
+
+    def test_keeps_the_aspect_ratio_and_pads_to_the_size(self):
+        lines = VideoToAsciiConverter(20, 10, palette='none').convert(solid_image((255, 255, 255), 40, 20))
+        assert len(lines) == 10 and all(len(line) == 20 for line in lines)
+        assert lines[4] == '@' * 20 and lines[5] == ' ' * 20  # Characters are twice as tall as they are wide
+
+    def test_frames_are_timed_in_movie_frames(self):
+        converter = VideoToAsciiConverter(4, 2, palette='none')
+        frames = list(converter.frames([solid_image(0)] * 6, fps=10))
+        assert sum(frame.display_time for frame in frames) == 9  # 0.6 seconds at 15 frames a second
+
+
+class TestReaders(object):
+    def test_pnm_stream(self):
+        stream = io.BytesIO(b'P6\n# comment\n2 1\n255\n' + bytes([255, 0, 0, 0, 0, 255]) + b'P5 1 1 255\n' + b'\x80')
+        color, gray = list(read_pnm_stream(stream))
+        assert color.tolist() == [[[255, 0, 0], [0, 0, 255]]]
+        assert gray.tolist() == [[[128, 128, 128]]]
+
+    def test_y4m_stream(self):
+        luma, chroma = bytes([235] * 4), bytes([128])
+        stream = io.BytesIO(b'YUV4MPEG2 W2 H2 F30:1 C420jpeg\n' + (b'FRAME\n' + luma + chroma + chroma) * 2)
+        frames = list(read_y4m_stream(stream))
+        assert len(frames) == 2
+        assert frames[0].shape == (2, 2, 3) and frames[0].min() == 255
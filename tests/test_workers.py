@@ -0,0 +1,84 @@
+# coding=utf-8
+import os
+import socket
+from socketserver import BaseRequestHandler
+
+import pytest
+
+from ascii_telnet import workers
+from ascii_telnet.ascii_server import ThreadedTCPServer
+
+
+class Stop(Exception):
+    pass
+
+
+def record_delays(monkeypatch, stop_after=None):
+    """Replaces the supervisor's sleeps between restarts, optionally stopping the pool after stop_after of them."""
+    delays = []
+
+    def sleep(seconds):
+        delays.append(seconds)
+        if stop_after is not None and len(delays) >= stop_after:
+            raise Stop()
+
+    monkeypatch.setattr(workers.time, 'sleep', sleep)
+    return delays
+
+
+def crash(listening_socket):
+    raise OSError(98, 'Address already in use')
+
+
+class TestWorkerPool(object):
+    def test_gives_up_on_a_worker_that_keeps_failing_to_start(self, monkeypatch, capfd):
+        delays = record_delays(monkeypatch)
+        with pytest.raises(RuntimeError, match='Worker 0 exited while starting'):
+            workers.run_worker_pool(1, crash, '127.0.0.1', 0)
+        assert delays == [2, 4, 8, 16]
+        assert capfd.readouterr().err.count('OSError: [Errno 98]') == workers.MAX_FAILED_STARTS
+
+    def test_restarts_a_worker_that_exits_after_starting(self, monkeypatch, capfd):
+        monkeypatch.setattr(workers, 'STARTUP_SECONDS', 0)
+        delays = record_delays(monkeypatch, stop_after=3)
+        with pytest.raises(Stop):
+            workers.run_worker_pool(1, crash, '127.0.0.1', 0)
+        assert delays == [workers.RESTART_DELAY_SECONDS] * 3
+
+    def test_every_worker_serves_with_its_number(self, monkeypatch, tmp_path, capfd):
+        def serve(listening_socket):
+            (tmp_path / str(workers.current_worker)).write_text(str(listening_socket is None))
+
+        def sleep(seconds):
+            if len(list(tmp_path.iterdir())) == 2:
+                raise Stop()
+
+        monkeypatch.setattr(workers, 'STARTUP_SECONDS', 0)
+        monkeypatch.setattr(workers.time, 'sleep', sleep)
+        with pytest.raises(Stop):
+            workers.run_worker_pool(2, serve, '127.0.0.1', 0)
+        assert sorted(path.name for path in tmp_path.iterdir()) == ['0', '1']
+        assert {path.read_text() for path in tmp_path.iterdir()} == {str(workers.REUSE_PORT_SUPPORTED)}
+
+
+class TestThreadedTCPServer(object):
+    def test_binds_a_port_with_connections_left_in_time_wait(self):
+        server = ThreadedTCPServer(('127.0.0.1', 0), BaseRequestHandler)
+        port = server.server_address[1]
+        client = socket.create_connection(('127.0.0.1', port))
+        connection, _ = server.socket.accept()
+        connection.close()  # The server closes first, so its end is left in TIME_WAIT
+        client.close()
+        server.server_close()
+
+        ThreadedTCPServer(('127.0.0.1', port), BaseRequestHandler).server_close()
+
+
+@pytest.fixture(autouse=True)
+def reap_workers():
+    yield
+    try:
+        while os.waitpid(-1, 0):
+            pass
+    except ChildProcessError:
+        pass